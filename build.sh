@@ -15,6 +15,9 @@ pip install -r $REQ_PATH
 # Run database migrations
 python manage.py migrate
 
+# Tabla de la caché de páginas del CV (solo crea algo con CV_PAGE_CACHE_BACKEND=db)
+python manage.py createcachetable
+
 # Collect static files
 python manage.py collectstatic --noinput
 
@@ -97,6 +100,11 @@ try:
 except Exception as e:
     print(f"⚠️  Error en migración: {str(e)}", file=sys.stderr)
 EOF
+
+    # Índice de nombres de blob usado por el proxy /media/
+    python manage.py rebuild_blob_index
+    # Metadatos (páginas/validez) de certificados subidos antes del índice
+    python manage.py index_certificates
 else
     echo "⚠️  Azure no configurado, saltando migración de archivos"
 fi
@@ -7,12 +7,17 @@ from django.conf import settings
 from django.core.files.storage import Storage
 from django.core.files.base import File
 from io import BytesIO
+import logging
 import os
+import time
 import uuid
-from datetime import datetime, timedelta
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
+from datetime import datetime, timedelta, timezone as dt_timezone
+from azure.storage.blob import generate_blob_sas, BlobSasPermissions
 from azure.core.exceptions import AzureError, ResourceNotFoundError
 
+from pagina_usuario import blob_cache, cert_metadata, photo_variants
+from pagina_usuario.azure_blob import get_service_client, index_blob, list_directory, unindex_blob
+
 
 class AzureBlobStorage(Storage):
     """Custom storage class for Azure Blob Storage"""
@@ -20,7 +25,13 @@ class AzureBlobStorage(Storage):
     def __init__(self):
         self.connection_string = getattr(settings, 'AZURE_STORAGE_CONNECTION_STRING', '')
         self.container_name = getattr(settings, 'AZURE_CONTAINER_NAME', 'media')
-        self.account_name = self._extract_account_name()
+        # Parsed once: url() is called for every file field rendered
+        credentials = self._parse_connection_string()
+        self.account_name = credentials.get('AccountName')
+        self.account_key = credentials.get('AccountKey')
+        # {name: url} for the current SAS time bucket
+        self._url_cache = {}
+        self._url_bucket = None
 
         # Only raise error if we're trying to use Azure storage
         if not self.connection_string:
@@ -31,17 +42,17 @@ class AzureBlobStorage(Storage):
         """Get Azure Blob Service Client"""
         if not self.connection_string:
             raise ValueError('AZURE_STORAGE_CONNECTION_STRING must be configured in settings')
-        return BlobServiceClient.from_connection_string(self.connection_string)
-
-    def _extract_account_name(self):
-        """Extract account name from connection string"""
-        if 'AccountName=' in self.connection_string:
-            start = self.connection_string.find('AccountName=') + len('AccountName=')
-            end = self.connection_string.find(';', start)
-            if end == -1:
-                end = len(self.connection_string)
-            return self.connection_string[start:end]
-        return None
+        # Cliente compartido por proceso (pool de conexiones reutilizable)
+        return get_service_client(self.connection_string)
+
+    def _parse_connection_string(self):
+        """Split 'Key=value;Key=value' into a dict (values may contain '=')"""
+        parts = {}
+        for segment in self.connection_string.split(';'):
+            key, sep, value = segment.partition('=')
+            if sep:
+                parts[key.strip()] = value.strip()
+        return parts
 
     def _open(self, name, mode='rb'):
         """Open a file for reading"""
@@ -60,43 +71,88 @@ class AzureBlobStorage(Storage):
         """Save a file to Azure Blob Storage"""
         if not name:
             name = str(uuid.uuid4())
-        
+
         # Keep the original name to make URLs more predictable
         # UUID will be added only if needed to avoid conflicts
-        
+
+        # Determine content type
+        content_type = getattr(content, 'content_type', None)
+        if not content_type:
+            if name.lower().endswith(('.jpg', '.jpeg')):
+                content_type = 'image/jpeg'
+            elif name.lower().endswith('.png'):
+                content_type = 'image/png'
+            elif name.lower().endswith('.gif'):
+                content_type = 'image/gif'
+            elif name.lower().endswith('.pdf'):
+                content_type = 'application/pdf'
+            elif name.lower().endswith('.webp'):
+                content_type = 'image/webp'
+
+        etag = self._upload(name, content, content_type, size=getattr(content, 'size', None))
+
+        if photo_variants.is_enabled() and photo_variants.is_photo(name):
+            self._save_photo_variants(name, content)
+        if cert_metadata.is_certificate(name):
+            self._record_certificate(name, content, etag)
+        return name
+
+    def upload_bytes(self, name, data, content_type=None):
+        """Upload raw bytes (or a binary file, read from its current position) under exactly ``name``"""
+        if isinstance(data, (bytes, bytearray)):
+            size = len(data)
+        else:
+            # File-like: streamed in chunks by the SDK, never read whole
+            start = data.tell()
+            size = data.seek(0, os.SEEK_END) - start
+            data.seek(start)
+        self._upload(name, data, content_type, size=size)
+
+    def _upload(self, name, content, content_type, size=None):
         try:
             service_client = self._get_service_client()
             blob_client = service_client.get_blob_client(
                 container=self.container_name,
                 blob=name
             )
-
-            # Determine content type
-            content_type = getattr(content, 'content_type', None)
-            if not content_type:
-                if name.lower().endswith(('.jpg', '.jpeg')):
-                    content_type = 'image/jpeg'
-                elif name.lower().endswith('.png'):
-                    content_type = 'image/png'
-                elif name.lower().endswith('.gif'):
-                    content_type = 'image/gif'
-                elif name.lower().endswith('.pdf'):
-                    content_type = 'application/pdf'
-                elif name.lower().endswith('.webp'):
-                    content_type = 'image/webp'
-
             # Upload to Azure (overwrite if exists)
-            if hasattr(content, 'read'):
-                blob_client.upload_blob(content, overwrite=True, content_settings={'content_type': content_type} if content_type else {})
-            else:
-                blob_client.upload_blob(content, overwrite=True, content_settings={'content_type': content_type} if content_type else {})
-
-            return name
+            result = blob_client.upload_blob(content, overwrite=True, content_settings={'content_type': content_type} if content_type else {})
         except AzureError as e:
             raise IOError(f'Error saving blob {name} to Azure: {str(e)}')
 
+        etag = (result or {}).get('etag', '')
+        self._run_hook(index_blob, name, size=size, etag=etag)
+        self._run_hook(blob_cache.invalidate, name)
+        return etag
+
+    def _save_photo_variants(self, name, content):
+        """Resized avatar/PDF variants next to the original; a failure never fails the upload"""
+        try:
+            content.seek(0)
+            photo_variants.store_variants(self, name, content.read())
+        except Exception as e:
+            logging.warning(f'Could not generate photo variants for {name}: {str(e)}')
+
+    def _record_certificate(self, name, content, etag):
+        """Page count / validity of an uploaded certificate; a failure never fails the upload"""
+        try:
+            content.seek(0)
+            cert_metadata.record_certificate(name, content.read(), etag=etag)
+        except Exception as e:
+            logging.warning(f'Could not index certificate {name}: {str(e)}')
+
+    def _run_hook(self, func, name, **kwargs):
+        """Keep the blob index and local caches in sync; never fail the storage operation for it"""
+        try:
+            func(name, **kwargs)
+        except Exception as e:
+            logging.warning(f'Could not update blob index for {name}: {str(e)}')
+
     def delete(self, name):
         """Delete a file from Azure Blob Storage"""
+        if photo_variants.is_photo(name):
+            for variant in photo_variants.variant_names(name):
+                self.delete(variant)
         try:
             service_client = self._get_service_client()
             blob_client = service_client.get_blob_client(
@@ -106,6 +162,10 @@ class AzureBlobStorage(Storage):
             blob_client.delete_blob()
         except (AzureError, ResourceNotFoundError):
             pass  # Blob already deleted or doesn't exist
+        self._run_hook(unindex_blob, name)
+        self._run_hook(blob_cache.invalidate, name)
+        if cert_metadata.is_certificate(name):
+            self._run_hook(cert_metadata.forget_certificate, name)
 
     def exists(self, name):
         """Check if a file exists in Azure Blob Storage"""
@@ -120,28 +180,9 @@ class AzureBlobStorage(Storage):
             return False
 
     def listdir(self, path):
-        """List files in a directory"""
+        """List files in a directory (one level, via delimiter listing: no full container scan)"""
         try:
-            service_client = self._get_service_client()
-            container_client = service_client.get_container_client(self.container_name)
-            
-            directories = set()
-            files = []
-            
-            blobs = container_client.list_blobs(name_starts_with=path)
-            for blob in blobs:
-                blob_name = blob.name
-                if path and not blob_name.startswith(path):
-                    continue
-                
-                relative_name = blob_name[len(path):] if path else blob_name
-                if '/' in relative_name:
-                    dir_name = relative_name.split('/')[0]
-                    directories.add(dir_name)
-                else:
-                    files.append(relative_name)
-            
-            return list(directories), files
+            return list_directory(path)
         except AzureError:
             return [], []
 
@@ -159,38 +200,49 @@ class AzureBlobStorage(Storage):
             return 0
 
     def url(self, name):
-        """Get the URL of a file with SAS token for access"""
+        """Get the URL of a file with SAS token for access.
+
+        Signed URLs are time-bucketed: every call within the same
+        ``AZURE_URL_SAS_BUCKET_SECONDS`` window returns the same URL (the expiry
+        is derived from the bucket, so even other workers sign it identically),
+        which keeps the URL cacheable by browsers and CDNs and turns repeated
+        calls into a dictionary lookup.
+        """
         if not self.account_name:
             return f'/media/{name}'
-        
+
+        base_url = f'https://{self.account_name}.blob.core.windows.net/{self.container_name}/{name}'
+        if not self.account_key:
+            # Fallback URL (requires public access, which may not work)
+            return base_url
+
+        window = getattr(settings, 'AZURE_URL_SAS_BUCKET_SECONDS', 86400)
+        bucket = int(time.time() // window)
+        if bucket != self._url_bucket:
+            self._url_cache = {}
+            self._url_bucket = bucket
+        url = self._url_cache.get(name)
+        if url is not None:
+            return url
+
         try:
-            # Try to generate SAS URL (if account key is available)
-            if 'AccountKey=' in self.connection_string:
-                # Extract account key
-                start = self.connection_string.find('AccountKey=') + len('AccountKey=')
-                end = self.connection_string.find(';', start)
-                if end == -1:
-                    end = len(self.connection_string)
-                account_key = self.connection_string[start:end]
-                
-                # Generate SAS token (valid for 30 days - long enough for most images)
-                sas_token = generate_blob_sas(
-                    account_name=self.account_name,
-                    container_name=self.container_name,
-                    blob_name=name,
-                    account_key=account_key,
-                    permission=BlobSasPermissions(read=True),
-                    expiry=datetime.utcnow() + timedelta(days=30)
-                )
-                
-                base_url = f'https://{self.account_name}.blob.core.windows.net/{self.container_name}/{name}'
-                return f'{base_url}?{sas_token}'
+            # Valid for 30 days after the end of the bucket - long enough for most images
+            expiry = datetime.fromtimestamp((bucket + 1) * window, tz=dt_timezone.utc) + timedelta(days=30)
+            sas_token = generate_blob_sas(
+                account_name=self.account_name,
+                container_name=self.container_name,
+                blob_name=name,
+                account_key=self.account_key,
+                permission=BlobSasPermissions(read=True),
+                expiry=expiry
+            )
         except Exception as e:
-            import logging
             logging.warning(f'Could not generate SAS token: {str(e)}')
-        
-        # Fallback URL (requires public access, which may not work)
-        return f'https://{self.account_name}.blob.core.windows.net/{self.container_name}/{name}'
+            return base_url
+
+        url = f'{base_url}?{sas_token}'
+        self._url_cache[name] = url
+        return url
 
     def get_accessed_time(self, name):
         """Get last accessed time"""
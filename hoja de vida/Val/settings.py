@@ -56,6 +56,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Para archivos estáticos en Render
+    'pagina_usuario.metrics.MetricsMiddleware',  # Latencia por URL para /metrics (METRICS_ENABLED)
+    'pagina_usuario.instrumentation.PerformanceMiddleware',  # Server-Timing (PERF_INSTRUMENTATION)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -123,6 +125,98 @@ MEDIA_ROOT = BASE_DIR / 'media'
 AZURE_STORAGE_CONNECTION_STRING = config('AZURE_STORAGE_CONNECTION_STRING', default='')
 AZURE_CONTAINER_NAME = config('AZURE_CONTAINER_NAME', default='media')
 
+# Pool HTTP compartido por worker (ver pagina_usuario.azure_blob.get_service_client)
+AZURE_POOL_MAXSIZE = config('AZURE_POOL_MAXSIZE', default=10, cast=int)
+AZURE_CONNECTION_TIMEOUT = config('AZURE_CONNECTION_TIMEOUT', default=10, cast=int)
+AZURE_READ_TIMEOUT = config('AZURE_READ_TIMEOUT', default=60, cast=int)
+# Tamaño de cada trozo descargado al hacer streaming de /media/ (bytes)
+AZURE_STREAM_CHUNK_SIZE = config('AZURE_STREAM_CHUNK_SIZE', default=4 * 1024 * 1024, cast=int)
+
+# Vistas async (/media/, certificados, debug/blobs) con el cliente aio de Azure.
+# Solo tiene sentido bajo ASGI (uvicorn): con WSGI cada petición abriría su propia sesión aiohttp
+ASYNC_MEDIA_VIEWS = config('ASYNC_MEDIA_VIEWS', default=False, cast=bool)
+# Conexiones del cliente aio (una sesión aiohttp por event loop, es decir, por worker de uvicorn)
+AZURE_AIO_POOL_MAXSIZE = config('AZURE_AIO_POOL_MAXSIZE', default=100, cast=int)
+
+# AzureBlobStorage.url reutiliza la misma URL SAS durante esta ventana (segundos)
+AZURE_URL_SAS_BUCKET_SECONDS = config('AZURE_URL_SAS_BUCKET_SECONDS', default=86400, cast=int)
+
+# Intervalo mínimo entre reconstrucciones automáticas del índice de blobs (segundos)
+BLOB_INDEX_REFRESH_SECONDS = config('BLOB_INDEX_REFRESH_SECONDS', default=300, cast=int)
+
+# Tipos de contenido que /media/ entrega con un 302 a una URL SAS en lugar de pasar
+# los bytes por el worker (p. ej. 'image/*,application/pdf'); vacío = siempre proxy
+MEDIA_SAS_REDIRECT_TYPES = config('MEDIA_SAS_REDIRECT_TYPES', default='', cast=Csv())
+MEDIA_SAS_TTL = config('MEDIA_SAS_TTL', default=3600, cast=int)
+# Segundos antes de expirar en que se firma una URL nueva
+MEDIA_SAS_REFRESH_MARGIN = config('MEDIA_SAS_REFRESH_MARGIN', default=300, cast=int)
+
+# Caché local en disco (LRU) para blobs servidos por /media/
+BLOB_CACHE_ENABLED = config('BLOB_CACHE_ENABLED', default=True, cast=bool)
+BLOB_CACHE_DIR = config('BLOB_CACHE_DIR', default=str(MEDIA_ROOT / '.blob_cache'))
+BLOB_CACHE_MAX_BYTES = config('BLOB_CACHE_MAX_BYTES', default=256 * 1024 * 1024, cast=int)
+BLOB_CACHE_MAX_FILE_BYTES = config('BLOB_CACHE_MAX_FILE_BYTES', default=20 * 1024 * 1024, cast=int)
+BLOB_CACHE_REVALIDATE_SECONDS = config('BLOB_CACHE_REVALIDATE_SECONDS', default=3600, cast=int)
+
+# Caché del PDF final de la hoja de vida (clave = huella del contenido del perfil)
+CV_PDF_CACHE_ENABLED = config('CV_PDF_CACHE_ENABLED', default=True, cast=bool)
+CV_PDF_CACHE_DIR = config('CV_PDF_CACHE_DIR', default=str(MEDIA_ROOT / '.cv_pdf_cache'))
+# Sin caché, el PDF se arma en un temporal que pasa de memoria a disco por encima de este tamaño (bytes)
+CV_PDF_SPOOL_MAX_BYTES = config('CV_PDF_SPOOL_MAX_BYTES', default=8 * 1024 * 1024, cast=int)
+# Medir el pico de memoria Python de cada armado con tracemalloc (lento; solo para dimensionar workers)
+CV_PDF_TRACE_MEMORY = config('CV_PDF_TRACE_MEMORY', default=False, cast=bool)
+# Descargas simultáneas de certificados al armar el PDF
+CV_PDF_CERT_FETCH_WORKERS = config('CV_PDF_CERT_FETCH_WORKERS', default=8, cast=int)
+# Anexo con todos los certificados del perfil ya unidos, reconstruido en segundo plano
+CV_CERT_BUNDLE_ENABLED = config('CV_CERT_BUNDLE_ENABLED', default=True, cast=bool)
+CV_CERT_BUNDLE_RETRY_SECONDS = config('CV_CERT_BUNDLE_RETRY_SECONDS', default=3600, cast=int)
+
+# Render de WeasyPrint en un pool de procesos propio (fuera del GIL de los workers web)
+CV_PDF_RENDER_POOL = config('CV_PDF_RENDER_POOL', default=False, cast=bool)
+CV_PDF_RENDER_WORKERS = config('CV_PDF_RENDER_WORKERS', default=2, cast=int)
+# Renders por proceso hijo antes de reciclarlo (0 = nunca)
+CV_PDF_RENDER_MAX_JOBS = config('CV_PDF_RENDER_MAX_JOBS', default=50, cast=int)
+CV_PDF_RENDER_TIMEOUT = config('CV_PDF_RENDER_TIMEOUT', default=120, cast=int)
+
+# Generación del PDF en segundo plano: 'thread' (pool en cada worker web) o 'db' (manage.py process_pdf_jobs)
+CV_PDF_JOBS_MODE = config('CV_PDF_JOBS_MODE', default='thread')
+CV_PDF_JOB_WORKERS = config('CV_PDF_JOB_WORKERS', default=2, cast=int)
+CV_PDF_JOB_TIMEOUT = config('CV_PDF_JOB_TIMEOUT', default=600, cast=int)
+CV_PDF_JOB_RETENTION = config('CV_PDF_JOB_RETENTION', default=86400, cast=int)
+
+# Variantes redimensionadas de la foto de perfil generadas al subirla (ver pagina_usuario.photo_variants)
+PHOTO_VARIANTS_ENABLED = config('PHOTO_VARIANTS_ENABLED', default=True, cast=bool)
+
+# Caché del HTML de la hoja de vida pública: 'file' o 'db', las dos compartidas entre workers.
+# No hay opción en memoria local: las señales solo borran la copia del worker que guardó el cambio
+# y los demás seguirían sirviendo HTML viejo.
+CV_PAGE_CACHE_ENABLED = config('CV_PAGE_CACHE_ENABLED', default=True, cast=bool)
+CV_PAGE_CACHE_BACKEND = config('CV_PAGE_CACHE_BACKEND', default='file')
+CV_PAGE_CACHE_TIMEOUT = config('CV_PAGE_CACHE_TIMEOUT', default=86400, cast=int)
+CV_PAGE_CACHE_ALIAS = 'cv_pages'
+_CV_PAGE_CACHES = {
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CV_PAGE_CACHE_DIR', default=str(MEDIA_ROOT / '.cv_page_cache')),
+    },
+    # Requiere: python manage.py createcachetable
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cv_page_cache',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    CV_PAGE_CACHE_ALIAS: {
+        **_CV_PAGE_CACHES[CV_PAGE_CACHE_BACKEND],
+        'TIMEOUT': CV_PAGE_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
 # Use Azure storage if credentials are provided, otherwise use local filesystem
 if AZURE_STORAGE_CONNECTION_STRING:
     DEFAULT_FILE_STORAGE = 'Val.azure_storage.AzureBlobStorage'
@@ -135,6 +229,31 @@ LOGIN_REDIRECT_URL = 'tasks'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# --- MÉTRICAS DE RENDIMIENTO ---
+# Server-Timing + línea de log 'perf' por petición (ver pagina_usuario.instrumentation)
+PERF_INSTRUMENTATION = config('PERF_INSTRUMENTATION', default=False, cast=bool)
+# Fracción de peticiones medidas (0.0 - 1.0)
+PERF_SAMPLE_RATE = config('PERF_SAMPLE_RATE', default=1.0, cast=float)
+
+# --- SONDAS DE SALUD ---
+# /health/ready/ memoriza su resultado estos segundos (por proceso)
+HEALTH_CHECK_CACHE_SECONDS = config('HEALTH_CHECK_CACHE_SECONDS', default=5, cast=int)
+# Incluir el contenedor de Azure (get_container_properties) en /health/ready/
+HEALTH_CHECK_AZURE = config('HEALTH_CHECK_AZURE', default=False, cast=bool)
+HEALTH_CHECK_AZURE_TIMEOUT = config('HEALTH_CHECK_AZURE_TIMEOUT', default=5, cast=int)
+
+# Endpoint /metrics en formato Prometheus (ver pagina_usuario.metrics)
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+# Si se define, /metrics exige 'Authorization: Bearer <token>'
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Directorio compartido por los workers de gunicorn: /metrics suma los contadores de todos.
+# Debe estar vacío al arrancar el servicio
+PROMETHEUS_MULTIPROC_DIR = config('PROMETHEUS_MULTIPROC_DIR', default='')
+if METRICS_ENABLED and PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    # prometheus_client lo lee del entorno al importarse
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', PROMETHEUS_MULTIPROC_DIR)
+
 # --- LOGGING ---
 LOGGING = {
     'version': 1,
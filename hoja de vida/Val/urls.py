@@ -20,13 +20,26 @@ from django.conf import settings
 from django.conf.urls.static import static
 from pagina_usuario import views
 
+# Con ASGI (uvicorn) las vistas que solo esperan a Azure usan el cliente aio
+if settings.ASYNC_MEDIA_VIEWS:
+    serve_media_view = views.serve_azure_media_async
+    descargar_certificado_view = views.descargar_certificado_async
+    debug_list_blobs_view = views.debug_list_blobs_async
+else:
+    serve_media_view = views.serve_azure_media
+    descargar_certificado_view = views.descargar_certificado
+    debug_list_blobs_view = views.debug_list_blobs
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('health/', views.health_check, name='health_check'),
-    path('debug/blobs/', views.debug_list_blobs, name='debug_list_blobs'),
+    path('health/live/', views.health_live, name='health_live'),
+    path('health/ready/', views.health_ready, name='health_ready'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('debug/blobs/', debug_list_blobs_view, name='debug_list_blobs'),
     
     # --- MEDIA PROXY (Para servir archivos desde Azure) ---
-    path('media/<path:file_path>', views.serve_azure_media, name='serve_azure_media'),
+    path('media/<path:file_path>', serve_media_view, name='serve_azure_media'),
     
     # --- RUTAS GENERALES ---
     path('', views.home, name='home'),
@@ -45,7 +58,10 @@ urlpatterns = [
     path('hoja-de-vida/', views.ver_hoja_de_vida, name='ver_cv'),
     path('hoja-de-vida/<str:username>/', views.ver_hoja_de_vida, name='ver_cv_usuario'),
     path('cv/descargar/', views.descargar_cv_pdf, name='descargar_cv_pdf'),
-    path('certificado/descargar/<str:cert_type>/<int:cert_id>/', views.descargar_certificado, name='descargar_certificado'),
+    path('cv/generar/', views.encolar_cv_pdf, name='encolar_cv_pdf'),
+    path('cv/trabajos/<uuid:job_id>/', views.estado_cv_pdf, name='estado_cv_pdf'),
+    path('cv/trabajos/<uuid:job_id>/descargar/', views.descargar_trabajo_cv_pdf, name='descargar_trabajo_cv_pdf'),
+    path('certificado/descargar/<str:cert_type>/<int:cert_id>/', descargar_certificado_view, name='descargar_certificado'),
     path('panel-admin/', views.panel_admin_perfil, name='panel_admin_perfil'),
 
     # --- PERFIL Y EDICIÓN ---
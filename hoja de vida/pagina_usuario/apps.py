@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class PaginaUsuarioConfig(AppConfig):
     name = 'pagina_usuario'
+
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
+        # Registra las métricas (y su receptor de connection_created) al arrancar
+        from . import metrics  # noqa: F401
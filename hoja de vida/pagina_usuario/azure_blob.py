@@ -1,13 +1,97 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import requests
 from django.conf import settings
-from azure.storage.blob import BlobServiceClient
+from azure.core import MatchConditions
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobProperties, BlobServiceClient, BlobSasPermissions, generate_blob_sas
 from azure.core.exceptions import ResourceNotFoundError, AzureError
 
+from . import instrumentation
 
-def _get_service_client():
+
+# Registro de clientes por proceso: {connection_string: BlobServiceClient}
+_clients = {}
+_clients_pid = os.getpid()
+_clients_lock = threading.Lock()
+
+
+def _reset_clients():
+    """Forget every cached client (used after fork and in tests)."""
+    global _clients, _clients_pid
+    _clients = {}
+    _clients_pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    # gunicorn hace fork de los workers: cada hijo debe crear su propio pool
+    os.register_at_fork(after_in_child=_reset_clients)
+
+
+def _build_service_client(conn_str):
+    """Create a BlobServiceClient backed by a pooled requests session."""
+    pool_size = getattr(settings, 'AZURE_POOL_MAXSIZE', 10)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    transport = RequestsTransport(session=session, session_owner=False)
+    return BlobServiceClient.from_connection_string(conn_str, transport=transport, **client_options())
+
+
+def client_options() -> dict:
+    """Timeouts and download chunk sizes shared by the sync and async clients."""
+    # Las descargas se piden en trozos de este tamaño: acota la memoria de streaming
+    chunk_size = getattr(settings, 'AZURE_STREAM_CHUNK_SIZE', 4 * 1024 * 1024)
+    return {
+        'connection_timeout': getattr(settings, 'AZURE_CONNECTION_TIMEOUT', 10),
+        'read_timeout': getattr(settings, 'AZURE_READ_TIMEOUT', 60),
+        'max_single_get_size': chunk_size,
+        'max_chunk_get_size': chunk_size,
+        # Llamadas/bytes/tiempo por petición en Server-Timing (PERF_INSTRUMENTATION)
+        **instrumentation.azure_hooks(),
+    }
+
+
+def get_connection_string() -> str:
     conn_str = getattr(settings, 'AZURE_STORAGE_CONNECTION_STRING', None)
     if not conn_str:
         raise RuntimeError('AZURE_STORAGE_CONNECTION_STRING is not configured')
-    return BlobServiceClient.from_connection_string(conn_str)
+    return conn_str
+
+
+def get_service_client(conn_str=None):
+    """Return the process-wide BlobServiceClient for ``conn_str``.
+
+    The client (and its HTTP connection pool) is created once per worker
+    process and reused by every caller, so consecutive blob operations share
+    warm keep-alive connections.
+    """
+    conn_str = conn_str or get_connection_string()
+
+    if _clients_pid != os.getpid():
+        # Plataformas sin register_at_fork
+        _reset_clients()
+
+    client = _clients.get(conn_str)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(conn_str)
+            if client is None:
+                client = _build_service_client(conn_str)
+                _clients[conn_str] = client
+    return client
+
+
+def _get_service_client():
+    return get_service_client()
+
+
+def get_container_name() -> str:
+    return getattr(settings, 'AZURE_CONTAINER_NAME', None) or 'cursos'
 
 
 def download_blob_bytes(blob_name: str) -> bytes | None:
@@ -17,7 +101,7 @@ def download_blob_bytes(blob_name: str) -> bytes | None:
     """
     if not blob_name:
         return None
-    container = getattr(settings, 'AZURE_CONTAINER_NAME', None) or 'cursos'
+    container = get_container_name()
     try:
         svc = _get_service_client()
         blob_client = svc.get_blob_client(container=container, blob=blob_name)
@@ -28,26 +112,357 @@ def download_blob_bytes(blob_name: str) -> bytes | None:
     except AzureError:
         return None
 
+def open_blob_stream(blob_name: str, offset: int | None = None, length: int | None = None,
+                     etag: str | None = None, if_modified_since=None):
+    """Start a (ranged, conditional) download and return the StorageStreamDownloader.
+
+    Only the first chunk is fetched up front; iterate ``.chunks()`` to pull the
+    rest. ``etag``/``if_modified_since`` make the GET conditional: Azure
+    answers 304 (see :func:`is_not_modified`). Missing blobs raise
+    ``ResourceNotFoundError``.
+    """
+    blob_client = _get_service_client().get_blob_client(container=get_container_name(), blob=blob_name)
+    return blob_client.download_blob(
+        offset=offset, length=length, **conditional_kwargs(etag, if_modified_since)
+    )
+
+
+def is_not_modified(error) -> bool:
+    """True if ``error`` is the 304 answer to a conditional GET.
+
+    Azure sends the 304 with the ``ConditionNotMet`` error code, which the SDK
+    raises as ``ResourceModifiedError`` rather than ``ResourceNotModifiedError``:
+    only the status code is reliable.
+    """
+    return getattr(error, 'status_code', None) == 304
+
+
+def conditional_kwargs(etag: str | None = None, if_modified_since=None) -> dict:
+    """``download_blob`` keyword arguments for a GET that Azure answers with 304 if unchanged."""
+    if etag:
+        return {'etag': etag, 'match_condition': MatchConditions.IfModified}
+    if if_modified_since:
+        return {'if_modified_since': if_modified_since}
+    return {}
+
+
+def get_blob_properties(blob_name: str):
+    """Return the blob properties (size, etag, last_modified, content settings)."""
+    blob_client = _get_service_client().get_blob_client(container=get_container_name(), blob=blob_name)
+    return blob_client.get_blob_properties()
+
+
+def save_media_bytes(storage, name: str, data, content_type: str | None = None) -> str:
+    """Store ``data`` (bytes, or a binary file positioned at its start) under exactly ``name``.
+
+    ``AzureBlobStorage`` overwrites in place; other storages would rename on
+    conflict, so the old file is deleted first. Files are copied in chunks.
+    Returns ``name``.
+    """
+    if hasattr(storage, 'upload_bytes'):
+        storage.upload_bytes(name, data, content_type)
+        return name
+    from django.core.files.base import ContentFile, File
+
+    storage.delete(name)
+    return storage.save(name, ContentFile(data) if isinstance(data, (bytes, bytearray)) else File(data, name=name))
+
+
+# --- URLs SAS DE SOLO LECTURA ---
+
+# {(blob_name, content_disposition): (url, expira_en_epoch)}
+_sas_cache = {}
+_sas_lock = threading.Lock()
+_SAS_CACHE_MAX_ENTRIES = 10000
+
+
+def get_blob_sas_url(blob_name: str, content_disposition: str | None = None):
+    """Return ``(url, expires_at)`` for a short-lived read-only SAS URL of ``blob_name``.
+
+    URLs are memoised per blob and reused until ``MEDIA_SAS_REFRESH_MARGIN``
+    seconds before they expire, so repeated requests get the same (cacheable)
+    URL and no new signature. Returns None if the connection string has no
+    account key to sign with.
+    """
+    key = (blob_name, content_disposition)
+    now = time.time()
+    margin = getattr(settings, 'MEDIA_SAS_REFRESH_MARGIN', 300)
+    cached = _sas_cache.get(key)
+    if cached and cached[1] - margin > now:
+        return cached
+
+    client = _get_service_client()
+    account_key = getattr(client.credential, 'account_key', None)
+    if not account_key:
+        return None
+    expiry = datetime.now(dt_timezone.utc) + timedelta(seconds=getattr(settings, 'MEDIA_SAS_TTL', 3600))
+    container = get_container_name()
+    token = generate_blob_sas(
+        account_name=client.account_name,
+        container_name=container,
+        blob_name=blob_name,
+        account_key=account_key,
+        permission=BlobSasPermissions(read=True),
+        expiry=expiry,
+        content_disposition=content_disposition,
+    )
+    entry = (f'{client.get_blob_client(container=container, blob=blob_name).url}?{token}', expiry.timestamp())
+
+    with _sas_lock:
+        if len(_sas_cache) >= _SAS_CACHE_MAX_ENTRIES:
+            for stale in [k for k, (_, expires_at) in _sas_cache.items() if expires_at - margin <= now]:
+                del _sas_cache[stale]
+            if len(_sas_cache) >= _SAS_CACHE_MAX_ENTRIES:
+                _sas_cache.clear()
+        _sas_cache[key] = entry
+    return entry
+
+
 def search_blob_by_basename(basename: str) -> list[str]:
     """Search for blobs matching the basename in the container.
-    
-    Returns a list of matching blob names.
+
+    Uses the blob name index (exact basename, or ``basename`` anywhere in the
+    path) instead of listing the container. Returns a list of matching blob names.
     """
+    from django.db.models import Q
+    from .models import IndiceBlob
+
     if not basename:
         return []
-    
-    container = getattr(settings, 'AZURE_CONTAINER_NAME', None) or 'cursos'
+
+    def search():
+        return list(
+            IndiceBlob.objects.filter(Q(basename=basename) | Q(nombre_blob__contains=basename))
+            .order_by('nombre_blob')
+            .values_list('nombre_blob', flat=True)
+        )
+
     try:
-        svc = _get_service_client()
-        container_client = svc.get_container_client(container=container)
-        
-        matching_blobs = []
-        for blob in container_client.list_blobs():
-            # Check if basename matches (either exact or as filename part)
-            blob_basename = blob.name.split('/')[-1]
-            if blob_basename == basename or basename in blob.name:
-                matching_blobs.append(blob.name)
-        
-        return matching_blobs
+        return search() or (search() if _refresh_blob_index() else [])
     except Exception:
-        return []
\ No newline at end of file
+        return []
+
+
+# --- LISTADO PAGINADO ---
+
+# Máximo de resultados por página que acepta Azure (List Blobs)
+MAX_PAGE_SIZE = 5000
+
+
+def _container_client():
+    return _get_service_client().get_container_client(get_container_name())
+
+
+def list_blobs_page(prefix: str | None = None, cursor: str | None = None, page_size: int = 100,
+                    delimiter: str | None = None) -> dict:
+    """Return one page of the container listing.
+
+    Only the requested page is fetched: ``cursor`` is the Azure continuation
+    token returned as ``next_cursor`` by the previous page (None when there are
+    no more pages). With ``delimiter`` (usually ``'/'``) the listing stops at
+    that level and the sub-"folders" come back in ``prefixes``.
+    Returns ``{'blobs': [BlobProperties], 'prefixes': [str], 'next_cursor': str | None}``.
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    container_client = _container_client()
+    if delimiter:
+        paged = container_client.walk_blobs(name_starts_with=prefix, delimiter=delimiter, results_per_page=page_size)
+    else:
+        paged = container_client.list_blobs(name_starts_with=prefix, results_per_page=page_size)
+    pages = paged.by_page(continuation_token=cursor or None)
+    blobs, prefixes = [], []
+    for item in next(pages, []):
+        if isinstance(item, BlobProperties):
+            blobs.append(item)
+        else:
+            prefixes.append(item.name)
+    return {'blobs': blobs, 'prefixes': prefixes, 'next_cursor': pages.continuation_token or None}
+
+
+def iter_blobs(prefix: str | None = None, page_size: int = MAX_PAGE_SIZE):
+    """Yield every ``BlobProperties`` under ``prefix``, one listing page at a time.
+
+    For scripts and commands: memory stays bounded by ``page_size`` however
+    large the container is.
+    """
+    cursor = None
+    while True:
+        page = list_blobs_page(prefix, cursor=cursor, page_size=page_size)
+        yield from page['blobs']
+        cursor = page['next_cursor']
+        if not cursor:
+            return
+
+
+def list_directory(path: str = '') -> tuple[list[str], list[str]]:
+    """``(directories, files)`` directly under ``path``, relative to it (one level only)."""
+    prefix = path.strip('/') + '/' if path.strip('/') else None
+    directories, files = [], []
+    cursor = None
+    while True:
+        page = list_blobs_page(prefix, cursor=cursor, page_size=MAX_PAGE_SIZE, delimiter='/')
+        start = len(prefix or '')
+        directories += [name[start:].rstrip('/') for name in page['prefixes']]
+        files += [blob.name[start:] for blob in page['blobs']]
+        cursor = page['next_cursor']
+        if not cursor:
+            return directories, files
+
+
+# --- ÍNDICE DE NOMBRES DE BLOB ---
+
+def index_blob(blob_name: str, size: int | None = None, etag: str = '') -> None:
+    """Record (or refresh) ``blob_name`` in the name-resolution index."""
+    from .models import IndiceBlob
+
+    if not blob_name:
+        return
+    IndiceBlob.objects.update_or_create(
+        nombre_blob=blob_name,
+        defaults={
+            'basename': os.path.basename(blob_name),
+            'tamano': size,
+            'etag': (etag or '').strip('"'),
+        },
+    )
+
+
+def unindex_blob(blob_name: str) -> None:
+    """Drop ``blob_name`` from the name-resolution index."""
+    from .models import IndiceBlob
+
+    IndiceBlob.objects.filter(nombre_blob=blob_name).delete()
+
+
+def rebuild_blob_index() -> int:
+    """Bring the index in line with a single listing of the container.
+
+    Listed blobs are upserted and rows not touched since the listing began
+    are deleted, so the table is never empty while it runs and blobs indexed
+    by a concurrent upload are kept. Returns the number of blobs listed.
+    """
+    from django.utils import timezone
+    from .models import IndiceBlob
+
+    started = timezone.now()
+    total = 0
+    batch = []
+    for blob in iter_blobs():
+        batch.append(IndiceBlob(
+            nombre_blob=blob.name,
+            basename=os.path.basename(blob.name),
+            tamano=blob.size,
+            etag=(blob.etag or '').strip('"'),
+        ))
+        if len(batch) == 500:
+            total += _upsert_index(batch)
+            batch = []
+    total += _upsert_index(batch)
+    # Lo que no apareció en el listado ni se indexó mientras tanto ya no existe
+    IndiceBlob.objects.filter(actualizado__lt=started).delete()
+    return total
+
+
+def _upsert_index(entries) -> int:
+    from .models import IndiceBlob
+
+    if entries:
+        IndiceBlob.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=['nombre_blob'],
+            update_fields=['basename', 'tamano', 'etag', 'actualizado'],
+        )
+    return len(entries)
+
+
+def _lookup_blob_names(names) -> dict:
+    """``{name: blob_path or None}`` from the index alone, in two queries at most."""
+    from .models import IndiceBlob
+
+    exact = set(IndiceBlob.objects.filter(nombre_blob__in=names).values_list('nombre_blob', flat=True))
+    by_basename = {}
+    missing = [name for name in names if name not in exact]
+    if missing:
+        rows = (
+            IndiceBlob.objects.filter(basename__in={os.path.basename(name) for name in missing})
+            .order_by('nombre_blob')
+            .values_list('basename', 'nombre_blob')
+        )
+        for basename, blob_name in rows:
+            by_basename.setdefault(basename, []).append(blob_name)
+    return {
+        name: name if name in exact else _pick_candidate(name, by_basename.get(os.path.basename(name), []))
+        for name in names
+    }
+
+
+def _pick_candidate(file_path, candidates):
+    # Varios blobs con el mismo nombre: preferir el de la misma carpeta
+    for candidate in candidates:
+        if candidate.endswith(file_path) or file_path.endswith(candidate):
+            return candidate
+    return candidates[0] if candidates else None
+
+
+def resolve_blob_name(file_path: str) -> str | None:
+    """Map a stored ``FileField.name`` (or a bare basename) to its real blob path.
+
+    Looks the name up in ``IndiceBlob``. On a miss the index is rebuilt from
+    one container listing, at most once every ``BLOB_INDEX_REFRESH_SECONDS``
+    across all processes, so unknown names never trigger a scan on every request.
+    Returns None when the blob cannot be found.
+    """
+    if not file_path:
+        return None
+    return resolve_blob_names([file_path]).get(file_path.lstrip('/'))
+
+
+def _refresh_blob_index() -> bool:
+    """Rebuild the index unless it was rebuilt in the last ``BLOB_INDEX_REFRESH_SECONDS``.
+
+    The last rebuild is recorded in the database, so the interval holds
+    across every worker, job thread and command. Returns True if it was rebuilt.
+    """
+    from datetime import timedelta
+
+    from django.db.models import Q
+    from django.utils import timezone
+    from .models import EstadoIndiceBlob
+
+    now = timezone.now()
+    limit = now - timedelta(seconds=getattr(settings, 'BLOB_INDEX_REFRESH_SECONDS', 300))
+    # UPDATE condicional: solo un proceso gana la reconstrucción de cada intervalo
+    claimed = (
+        EstadoIndiceBlob.objects.filter(pk=1)
+        .filter(Q(reconstruido__isnull=True) | Q(reconstruido__lt=limit))
+        .update(reconstruido=now)
+    )
+    if not claimed:
+        # Primera vez: la gana quien crea la fila
+        _, claimed = EstadoIndiceBlob.objects.get_or_create(pk=1, defaults={'reconstruido': now})
+    if not claimed:
+        return False
+    rebuild_blob_index()
+    return True
+
+
+def resolve_blob_names(file_paths) -> dict:
+    """Resolve many names at once; returns ``{name: blob_path or None}`` (names without a leading ``/``).
+
+    Two index queries, plus, if any name is missing, one index refresh (see
+    :func:`resolve_blob_name`) and two more queries for the missing names.
+    """
+    names = list(dict.fromkeys(name.lstrip('/') for name in file_paths if name))
+    if not names:
+        return {}
+    resolved = _lookup_blob_names(names)
+    missing = [name for name, found in resolved.items() if not found]
+    if missing:
+        try:
+            refreshed = _refresh_blob_index()
+        except (AzureError, RuntimeError):
+            refreshed = False
+        if refreshed:
+            resolved.update(_lookup_blob_names(missing))
+    return resolved
@@ -0,0 +1,116 @@
+"""
+Async counterparts of the blob helpers in :mod:`pagina_usuario.azure_blob`,
+built on ``azure.storage.blob.aio`` for the ASGI views.
+
+An aio client owns an aiohttp session bound to the event loop that created
+it, so clients are cached per loop: under uvicorn that is one client (and one
+connection pool of ``AZURE_AIO_POOL_MAXSIZE`` connections) per worker process.
+Each client is closed when its loop shuts down (``loop.shutdown_asyncgens()``,
+run by ``asyncio.run`` and therefore by uvicorn and ``async_to_sync``).
+Blob names, container and index resolution are shared with the sync module.
+Requires ``aiohttp``.
+"""
+
+import asyncio
+import weakref
+
+from django.conf import settings
+from azure.core.exceptions import AzureError, ResourceNotFoundError
+from azure.storage.blob import BlobProperties
+from azure.storage.blob.aio import BlobServiceClient
+
+from .azure_blob import (
+    MAX_PAGE_SIZE, client_options, conditional_kwargs, get_connection_string, get_container_name,
+)
+
+# {event loop: (BlobServiceClient, generador que lo cierra)}; la entrada desaparece con su loop
+_clients = weakref.WeakKeyDictionary()
+
+
+def _build_service_client(conn_str):
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+
+    connector = aiohttp.TCPConnector(limit=getattr(settings, 'AZURE_AIO_POOL_MAXSIZE', 100))
+    transport = AioHttpTransport(session=aiohttp.ClientSession(connector=connector), session_owner=True)
+    return BlobServiceClient.from_connection_string(conn_str, transport=transport, **client_options())
+
+
+async def _close_with_loop(client):
+    # El loop cierra sus generadores asíncronos pendientes al apagarse: el finally
+    # corre dentro del loop, que es donde se puede cerrar la sesión aiohttp
+    try:
+        yield
+    finally:
+        await client.close()
+
+
+async def get_service_client() -> BlobServiceClient:
+    """Return the aio BlobServiceClient of the running event loop (created on first use)."""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is None:
+        client = _build_service_client(get_connection_string())
+        closer = _close_with_loop(client)
+        await closer.__anext__()
+        entry = _clients[loop] = (client, closer)
+    return entry[0]
+
+
+async def _blob_client(blob_name):
+    service_client = await get_service_client()
+    return service_client.get_blob_client(container=get_container_name(), blob=blob_name)
+
+
+async def open_blob_stream(blob_name: str, offset: int | None = None, length: int | None = None,
+                           etag: str | None = None, if_modified_since=None):
+    """Async version of :func:`pagina_usuario.azure_blob.open_blob_stream`.
+
+    The returned downloader yields chunks with ``async for chunk in downloader.chunks()``.
+    """
+    blob_client = await _blob_client(blob_name)
+    return await blob_client.download_blob(
+        offset=offset, length=length, **conditional_kwargs(etag, if_modified_since)
+    )
+
+
+async def get_blob_properties(blob_name: str):
+    blob_client = await _blob_client(blob_name)
+    return await blob_client.get_blob_properties()
+
+
+async def download_blob_bytes(blob_name: str) -> bytes | None:
+    """Download a whole blob; None if it does not exist or on error."""
+    if not blob_name:
+        return None
+    try:
+        blob_client = await _blob_client(blob_name)
+        downloader = await blob_client.download_blob()
+        return await downloader.readall()
+    except (ResourceNotFoundError, AzureError):
+        return None
+
+
+async def list_blobs_page(prefix: str | None = None, cursor: str | None = None, page_size: int = 100,
+                          delimiter: str | None = None) -> dict:
+    """Async version of :func:`pagina_usuario.azure_blob.list_blobs_page` (one request per page)."""
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    service_client = await get_service_client()
+    container_client = service_client.get_container_client(get_container_name())
+    if delimiter:
+        paged = container_client.walk_blobs(name_starts_with=prefix, delimiter=delimiter, results_per_page=page_size)
+    else:
+        paged = container_client.list_blobs(name_starts_with=prefix, results_per_page=page_size)
+    pages = paged.by_page(continuation_token=cursor or None)
+    blobs, prefixes = [], []
+    try:
+        page = await pages.__anext__()
+    except StopAsyncIteration:
+        page = None
+    if page is not None:
+        async for item in page:
+            if isinstance(item, BlobProperties):
+                blobs.append(item)
+            else:
+                prefixes.append(item.name)
+    return {'blobs': blobs, 'prefixes': prefixes, 'next_cursor': pages.continuation_token or None}
@@ -0,0 +1,248 @@
+"""
+In-process stand-in for Azure Blob Storage, for benchmarks and local runs.
+
+``LocalBlobAdapter`` is a ``requests`` transport adapter that answers the
+Blob REST calls this app makes (download with ranges and conditional headers,
+properties, upload, delete, listings with prefix/delimiter/marker, container
+create/properties) from an in-memory store. The SDK pipeline in front of it
+(signing, retries, hooks, downloader) is the real one, so the code under
+:mod:`pagina_usuario.azure_blob` runs unchanged.
+
+The connection string is Azurite's well-known development account: the same
+setup can point at a real Azurite emulator by not installing the adapter.
+"""
+
+import hashlib
+import io
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+from urllib3 import HTTPResponse
+
+from . import azure_blob
+
+AZURITE_ACCOUNT = 'devstoreaccount1'
+AZURITE_ENDPOINT = f'http://127.0.0.1:10000/{AZURITE_ACCOUNT}'
+AZURITE_CONNECTION_STRING = (
+    f'DefaultEndpointsProtocol=http;AccountName={AZURITE_ACCOUNT};'
+    'AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;'
+    f'BlobEndpoint={AZURITE_ENDPOINT};'
+)
+
+_ERROR_MESSAGES = {
+    'BlobNotFound': 'The specified blob does not exist.',
+    'ContainerNotFound': 'The specified container does not exist.',
+    'ContainerAlreadyExists': 'The specified container already exists.',
+    'ConditionNotMet': 'The condition specified using HTTP conditional header(s) is not met.',
+    'InvalidRange': 'The range specified is invalid for the current size of the resource.',
+    'UnsupportedHttpVerb': 'The resource doesn\'t support the specified HTTP verb.',
+}
+
+
+def _http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+class LocalBlobAdapter(requests.adapters.HTTPAdapter):
+    """Serve the Blob REST API of one storage account from memory.
+
+    ``containers`` maps a container name to ``{blob name: blob}``, where a
+    blob is a dict with ``data``, ``content_type``, ``etag`` and ``modified``.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.containers = {}
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        query = {key: values[-1] for key, values in parse_qs(url.query, keep_blank_values=True).items()}
+        parts = unquote(url.path).lstrip('/').split('/', 2)
+        container = parts[1] if len(parts) > 1 else ''
+        blob_name = parts[2] if len(parts) > 2 else ''
+        with self._lock:
+            if query.get('restype') == 'container' or (not blob_name and query.get('comp') == 'list'):
+                status, headers, body = self._container(request, container, query)
+            else:
+                status, headers, body = self._blob(request, container, blob_name)
+        return self._response(request, status, headers, body)
+
+    def _response(self, request, status, headers, body):
+        headers = {
+            'x-ms-request-id': hashlib.md5(f'{time.monotonic_ns()}'.encode()).hexdigest(),
+            'x-ms-version': request.headers.get('x-ms-version', ''),
+            'Date': _http_date(time.time()),
+            'Content-Length': str(len(body)),
+            **headers,
+        }
+        if request.method == 'HEAD':
+            body = b''  # Solo cabeceras, también en los errores
+        raw = HTTPResponse(
+            body=io.BytesIO(body), headers=headers, status=status, preload_content=False,
+            decode_content=False, request_method=request.method,
+        )
+        return self.build_response(request, raw)
+
+    def _error(self, status, code):
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            f'<Error><Code>{code}</Code><Message>{_ERROR_MESSAGES[code]}</Message></Error>'
+        ).encode()
+        return status, {'x-ms-error-code': code, 'Content-Type': 'application/xml'}, body
+
+    # --- Contenedor ---
+
+    def _container(self, request, container, query):
+        blobs = self.containers.get(container)
+        if request.method == 'PUT':
+            if blobs is not None:
+                return self._error(409, 'ContainerAlreadyExists')
+            self.containers[container] = {}
+            return 201, {'ETag': '"0x1"', 'Last-Modified': _http_date(time.time())}, b''
+        if blobs is None:
+            return self._error(404, 'ContainerNotFound')
+        if request.method != 'GET':
+            return self._error(405, 'UnsupportedHttpVerb')
+        if query.get('comp') == 'list':
+            return 200, {'Content-Type': 'application/xml'}, self._list(container, blobs, query)
+        return 200, {'ETag': '"0x1"', 'Last-Modified': _http_date(time.time())}, b''
+
+    def _list(self, container, blobs, query):
+        prefix = query.get('prefix', '')
+        delimiter = query.get('delimiter', '')
+        marker = query.get('marker', '')
+        max_results = int(query.get('maxresults') or 5000)
+        items, seen_prefixes, next_marker = [], set(), ''
+        for name in sorted(blobs):
+            if not name.startswith(prefix) or (marker and name < marker):
+                continue
+            if len(items) == max_results:
+                next_marker = name
+                break
+            if delimiter:
+                cut = name.find(delimiter, len(prefix))
+                if cut != -1:
+                    sub_prefix = name[:cut + len(delimiter)]
+                    if sub_prefix not in seen_prefixes:
+                        seen_prefixes.add(sub_prefix)
+                        items.append(f'<BlobPrefix><Name>{escape(sub_prefix)}</Name></BlobPrefix>')
+                    continue
+            blob = blobs[name]
+            items.append(
+                f'<Blob><Name>{escape(name)}</Name><Properties>'
+                f'<Last-Modified>{_http_date(blob["modified"])}</Last-Modified>'
+                f'<Etag>{blob["etag"]}</Etag>'
+                f'<Content-Length>{len(blob["data"])}</Content-Length>'
+                f'<Content-Type>{escape(blob["content_type"])}</Content-Type>'
+                '<BlobType>BlockBlob</BlobType></Properties></Blob>'
+            )
+        return (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            f'<EnumerationResults ServiceEndpoint="{AZURITE_ENDPOINT}" ContainerName="{escape(container)}">'
+            f'<Prefix>{escape(prefix)}</Prefix><Marker>{escape(marker)}</Marker>'
+            f'<MaxResults>{max_results}</MaxResults><Delimiter>{escape(delimiter)}</Delimiter>'
+            f'<Blobs>{"".join(items)}</Blobs><NextMarker>{escape(next_marker)}</NextMarker>'
+            '</EnumerationResults>'
+        ).encode()
+
+    # --- Blob ---
+
+    def _blob(self, request, container, blob_name):
+        blobs = self.containers.get(container)
+        if blobs is None:
+            return self._error(404, 'ContainerNotFound')
+        if request.method == 'PUT':
+            return self._put(request, blobs, blob_name)
+        blob = blobs.get(blob_name)
+        if blob is None:
+            return self._error(404, 'BlobNotFound')
+        if request.method == 'DELETE':
+            del blobs[blob_name]
+            return 202, {}, b''
+        if request.method not in ('GET', 'HEAD'):
+            return self._error(405, 'UnsupportedHttpVerb')
+
+        status = self._check_conditions(request, blob)
+        headers = {'ETag': blob['etag'], 'Last-Modified': _http_date(blob['modified'])}
+        if status == 304:
+            # Como Azure: sin cuerpo, con el código de error en la cabecera
+            return 304, {**headers, 'x-ms-error-code': 'ConditionNotMet'}, b''
+        if status == 412:
+            return self._error(412, 'ConditionNotMet')
+
+        data = blob['data']
+        headers.update({
+            'Content-Type': blob['content_type'],
+            'Accept-Ranges': 'bytes',
+            'x-ms-blob-type': 'BlockBlob',
+            'x-ms-creation-time': _http_date(blob['modified']),
+        })
+        if request.method == 'HEAD':
+            headers['Content-Length'] = str(len(data))
+            return 200, headers, b''
+        byte_range = request.headers.get('x-ms-range') or request.headers.get('Range')
+        if not byte_range:
+            return 200, headers, data
+        start, _, end = byte_range.split('=', 1)[1].partition('-')
+        start = int(start)
+        end = min(int(end) if end else len(data) - 1, len(data) - 1)
+        if start >= len(data):
+            return self._error(416, 'InvalidRange')
+        headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+        return 206, headers, data[start:end + 1]
+
+    def _check_conditions(self, request, blob):
+        if_match = request.headers.get('If-Match')
+        if if_match and if_match not in ('*', blob['etag']):
+            return 412
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and if_none_match in ('*', blob['etag']):
+            return 304
+        if_modified_since = request.headers.get('If-Modified-Since')
+        if if_modified_since and int(blob['modified']) <= parsedate_to_datetime(if_modified_since).timestamp():
+            return 304
+        return 200
+
+    def _put(self, request, blobs, blob_name):
+        body = request.body or b''
+        if hasattr(body, 'read'):
+            body = body.read()
+        elif not isinstance(body, (bytes, str)):
+            body = b''.join(body)
+        if isinstance(body, str):
+            body = body.encode()
+        blob = {
+            'data': bytes(body),
+            'content_type': request.headers.get('x-ms-blob-content-type') or 'application/octet-stream',
+            'etag': f'"0x{hashlib.md5(body).hexdigest()[:16].upper()}"',
+            'modified': time.time(),
+        }
+        blobs[blob_name] = blob
+        return 201, {'ETag': blob['etag'], 'Last-Modified': _http_date(blob['modified'])}, b''
+
+
+def build_service_client(adapter, conn_str=AZURITE_CONNECTION_STRING):
+    """BlobServiceClient for ``conn_str`` whose HTTP calls are answered by ``adapter``."""
+    session = requests.Session()
+    session.mount(AZURITE_ENDPOINT.rsplit('/', 1)[0] + '/', adapter)
+    transport = RequestsTransport(session=session, session_owner=False)
+    return BlobServiceClient.from_connection_string(conn_str, transport=transport, **azure_blob.client_options())
+
+
+def install(adapter, conn_str=AZURITE_CONNECTION_STRING):
+    """Register a client backed by ``adapter`` as the process-wide client for ``conn_str``.
+
+    Callers point ``AZURE_STORAGE_CONNECTION_STRING`` at ``conn_str`` and
+    drop the registration with ``azure_blob._reset_clients()`` when done.
+    """
+    client = build_service_client(adapter, conn_str)
+    with azure_blob._clients_lock:
+        azure_blob._clients[conn_str] = client
+    return client
@@ -0,0 +1,196 @@
+"""
+Datos y estadísticas de la suite de benchmarks (``manage.py benchmark_suite``).
+
+Los perfiles sintéticos tienen las mismas formas que los datos de ejemplo de
+``populate_cvs``, repetidas ``items`` veces por sección, con foto (y sus
+variantes) y certificados PDF subidos a Azure. Se insertan con
+``bulk_create``: sin señales, así que no se encargan anexos ni se invalidan
+cachés durante la siembra.
+
+Cada escenario se resume en p50/p95 (rango más cercano), consultas SQL por
+petición (mediana) y el RSS máximo del proceso al terminarlo; ``compare``
+contrasta esas cifras con una referencia guardada.
+"""
+
+import math
+import statistics
+from datetime import date
+from io import BytesIO
+
+from django.contrib.auth.models import User
+
+from . import photo_variants
+from .models import Curso, Educacion, Experiencia, Habilidad, Perfil, Productos, Recomendacion, Task, VentaGarage
+
+SCHEMA_VERSION = 1
+
+# Margen absoluto además de la tolerancia relativa: el ruido de una vista de 1-2 ms
+# o del RSS no cuenta como regresión. Las consultas no toleran ninguna subida.
+MIN_DELTA_MS = 2.0
+MIN_DELTA_MB = 5.0
+
+SKILLS = ['Python', 'Django', 'JavaScript', 'HTML/CSS', 'Git', 'SQL']
+
+
+def sample_photo(size=800):
+    """JPEG de ``size`` px con un degradado (comprime como una foto, no como un color plano)."""
+    from PIL import Image
+
+    image = Image.linear_gradient('L').resize((size, size)).convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def sample_certificate(pages=2):
+    """PDF de ``pages`` páginas A4 en blanco."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=595, height=842)
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _fecha(k):
+    return date(2010 + k % 14, 1 + k % 12, 1)
+
+
+def seed_profiles(perfiles, items, upload):
+    """Crea ``perfiles`` usuarios ``bench_NNN`` con ``items`` elementos por sección.
+
+    ``upload(nombre, datos, content_type)`` guarda un archivo de media (en
+    Azure). Los elementos pares de Experiencia, Curso y Recomendación llevan
+    certificado. Devuelve los usuarios creados.
+    """
+    foto = sample_photo()
+    certificado = sample_certificate()
+    descripcion = (
+        'Desarrollo de aplicaciones web modernas utilizando tecnologías como Django, React '
+        'y bases de datos relacionales. ' * 3
+    ).strip()
+
+    users = User.objects.bulk_create([
+        User(username=f'bench_{i:03d}', first_name='Usuario', last_name=f'Benchmark {i}',
+             email=f'bench_{i:03d}@example.com')
+        for i in range(perfiles)
+    ])
+    if any(user.pk is None for user in users):
+        # Backends sin RETURNING en bulk_create
+        users = list(User.objects.filter(username__startswith='bench_').order_by('username'))
+
+    perfiles_creados = []
+    for i, user in enumerate(users):
+        foto_name = f'perfil_fotos/bench_{i:03d}.jpg'
+        upload(foto_name, foto, 'image/jpeg')
+        if photo_variants.is_enabled():
+            for variant, (data, content_type) in photo_variants.render_variants(foto).items():
+                upload(photo_variants.variant_name(foto_name, variant), data, content_type)
+        perfiles_creados.append(Perfil(
+            user=user,
+            nombre_completo=f'Usuario Benchmark {i}',
+            profesion='Profesional de Tecnología',
+            cedula=f'{i:010d}',
+            telefono='0991234567',
+            direccion_domicilio='Ciudad Principal',
+            nacionalidad='Ecuatoriana',
+            fecha_nacimiento=date(1990, 1, 1),
+            resumen_profesional=descripcion,
+            foto=foto_name,
+        ))
+    perfiles_creados = Perfil.objects.bulk_create(perfiles_creados)
+    if any(perfil.pk is None for perfil in perfiles_creados):
+        perfiles_creados = list(Perfil.objects.filter(user__in=users).order_by('user__username'))
+
+    rows = {model: [] for model in (Experiencia, Educacion, Curso, Habilidad, Productos, Recomendacion,
+                                    Task, VentaGarage)}
+    for i, perfil in enumerate(perfiles_creados):
+        for k in range(items):
+            cert = k % 2 == 0
+            if cert:
+                for prefix in ('certificados', 'certificados_cursos', 'certificados_recomendaciones'):
+                    upload(f'{prefix}/bench_{i:03d}_{k:03d}.pdf', certificado, 'application/pdf')
+            rows[Experiencia].append(Experiencia(
+                perfil=perfil, empresa=f'Empresa Tecnológica {k} S.A.', cargo='Desarrollador Web',
+                puesto='Desarrollador Full Stack', lugar_empresa='Ciudad Principal', fecha_inicio=_fecha(k),
+                descripcion=descripcion, activo=True,
+                certificado=f'certificados/bench_{i:03d}_{k:03d}.pdf' if cert else None,
+            ))
+            rows[Educacion].append(Educacion(
+                perfil=perfil, titulo=f'Licenciatura en Informática {k}', institucion='Universidad Nacional',
+                estado='Completado', graduado=True, fecha_inicio=_fecha(k), fecha_fin=_fecha(k + 4),
+            ))
+            rows[Curso].append(Curso(
+                perfil=perfil, nombre=f'Desarrollo Web con Django {k}', institucion='Plataforma Online',
+                total_horas=60, fecha_inicio=_fecha(k), fecha_fin=_fecha(k + 1),
+                descripcion='Curso completo de desarrollo web con Django framework.', activo=True,
+                certificado=f'certificados_cursos/bench_{i:03d}_{k:03d}.pdf' if cert else None,
+            ))
+            rows[Habilidad].append(Habilidad(perfil=perfil, nombre=f'{SKILLS[k % len(SKILLS)]} {k}'))
+            rows[Productos].append(Productos(
+                perfil=perfil, titulo=f'Sistema de Gestión Web {k}', tipo='Académico',
+                descripcion='Aplicación web para gestión desarrollada como proyecto académico.', activo=True,
+            ))
+            rows[Recomendacion].append(Recomendacion(
+                perfil=perfil, nombre_contacto='Dr. Ana López', telefono_contacto='0991234567',
+                relacion='Profesora', tipo_reconocimiento='Académico', fecha_reconocimiento=_fecha(k),
+                descripcion='Excelente estudiante con gran capacidad de aprendizaje.', activo=True,
+                certificado=f'certificados_recomendaciones/bench_{i:03d}_{k:03d}.pdf' if cert else None,
+            ))
+            rows[Task].append(Task(title=f'Tarea {k}', description=descripcion, user=perfil.user))
+            rows[VentaGarage].append(VentaGarage(
+                perfil=perfil, nombre_producto=f'Producto {k}', estado_producto='Bueno',
+                descripcion='Artículo en buen estado.', valor_bien=10 + k,
+            ))
+    for model, objs in rows.items():
+        model.objects.bulk_create(objs, batch_size=500)
+    return users
+
+
+def percentile(values, pct):
+    """Percentil ``pct`` por rango más cercano (un valor medido, sin interpolar)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(seconds, queries, rss_bytes):
+    """Resumen de un escenario a partir de los tiempos y consultas de cada iteración."""
+    ms = [s * 1000 for s in seconds]
+    return {
+        'iteraciones': len(ms),
+        'p50_ms': round(percentile(ms, 50), 2),
+        'p95_ms': round(percentile(ms, 95), 2),
+        'media_ms': round(statistics.fmean(ms), 2),
+        'min_ms': round(min(ms), 2),
+        'max_ms': round(max(ms), 2),
+        'consultas': int(statistics.median(queries)),
+        'rss_pico_mb': round(rss_bytes / 1048576, 1) if rss_bytes else None,
+    }
+
+
+def _limit(metric, before, tolerance):
+    if metric == 'consultas':
+        return before
+    margin = MIN_DELTA_MB if metric == 'rss_pico_mb' else MIN_DELTA_MS
+    return max(before * (1 + tolerance), before + margin)
+
+
+def compare(results, baseline, tolerance):
+    """Contrasta ``results`` con ``baseline`` (ambos ``{escenario: resumen}``).
+
+    Devuelve ``[(escenario, métrica, antes, ahora, regresión)]`` para las
+    métricas presentes en los dos; los escenarios nuevos o retirados se omiten.
+    """
+    rows = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'consultas', 'rss_pico_mb'):
+            if current.get(metric) is None or before.get(metric) is None:
+                continue
+            regression = current[metric] > _limit(metric, before[metric], tolerance)
+            rows.append((name, metric, before[metric], current[metric], regression))
+    return rows
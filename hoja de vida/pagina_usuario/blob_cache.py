@@ -0,0 +1,444 @@
+"""
+Read-through on-disk cache for Azure media blobs.
+
+Each cached blob is a ``<sha256>.json`` sidecar (ETag, last_modified,
+content type, size) naming its data file, ``<sha256>.<version>.bin``. A new
+version is written to a new data file and the sidecar is then switched to it
+atomically (temp file + ``os.replace``), so gunicorn workers sharing the
+directory never see partial files nor new bytes with the old metadata. The file mtime doubles as the LRU clock: hits touch
+it, and writes evict the least recently used entries once the directory grows
+past ``BLOB_CACHE_MAX_BYTES``. The total size is kept as a running count per
+process (adjusted by every store, invalidation and eviction) and rescanned from
+disk at most every ``_RESCAN_SECONDS`` or when it goes over the limit, so it
+also catches up with the other workers' writes without globbing the directory
+on each request.
+
+Entries are trusted for ``BLOB_CACHE_REVALIDATE_SECONDS``; after that a
+conditional GET against the stored ETag confirms them (304) or replaces them.
+If Azure fails to answer, the stale entry is served.
+Blobs over ``BLOB_CACHE_MAX_FILE_BYTES`` raise :class:`BlobTooLarge` carrying
+the download that is already open, so the caller streams it instead of
+issuing a second GET.
+``AzureBlobStorage._save``/``delete`` call :func:`invalidate`.
+:func:`read_media_bytes` is the byte-level entry point for server-side reads,
+and :func:`open_media_file` its file-level twin for large files.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from azure.core.exceptions import AzureError, ResourceNotFoundError
+
+from . import metrics
+from .azure_blob import download_blob_bytes, is_not_modified, open_blob_stream, resolve_blob_name
+
+logger = logging.getLogger(__name__)
+
+_stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'evictions': 0, 'bypassed': 0}
+_stats_lock = threading.Lock()
+
+# Bytes en disco por directorio de caché: {directorio: (bytes, contado_en)}
+_RESCAN_SECONDS = 60
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+class BlobTooLarge(Exception):
+    """The blob exceeds ``BLOB_CACHE_MAX_FILE_BYTES``; ``downloader`` is the open full download."""
+
+    def __init__(self, blob_path, downloader):
+        super().__init__(blob_path)
+        self.downloader = downloader
+
+
+def _count(counter, amount=1):
+    with _stats_lock:
+        _stats[counter] += amount
+    metrics.record_blob_cache(counter, amount)
+
+
+def stats():
+    """Hit/miss counters of this process plus the current size of the cache."""
+    with _stats_lock:
+        result = dict(_stats)
+    lookups = result['hits'] + result['misses']
+    result['hit_ratio'] = round(result['hits'] / lookups, 4) if lookups else None
+    result['bytes'] = _cached_bytes()
+    return result
+
+
+def _cached_bytes():
+    """Running total of the cache size, rescanned when older than ``_RESCAN_SECONDS``."""
+    directory = str(cache_dir())
+    with _totals_lock:
+        total, counted_at = _totals.get(directory, (None, 0))
+        if total is None or time.time() - counted_at > _RESCAN_SECONDS:
+            total = sum(size for _, size, _ in _entries())
+            _totals[directory] = (total, time.time())
+        return total
+
+
+def _add_bytes(amount, total=None):
+    """Adjust the running total by ``amount``, or reset it to ``total`` after a scan."""
+    directory = str(cache_dir())
+    with _totals_lock:
+        if total is not None:
+            _totals[directory] = (total, time.time())
+        elif directory in _totals:
+            current, counted_at = _totals[directory]
+            _totals[directory] = (max(current + amount, 0), counted_at)
+
+
+def _file_size(path):
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def is_enabled():
+    return getattr(settings, 'BLOB_CACHE_ENABLED', True)
+
+
+def cache_dir() -> Path:
+    directory = getattr(settings, 'BLOB_CACHE_DIR', None) or Path(settings.MEDIA_ROOT) / '.blob_cache'
+    return Path(directory)
+
+
+def _meta_path(blob_path):
+    key = hashlib.sha256(blob_path.encode('utf-8')).hexdigest()
+    return cache_dir() / f'{key}.json'
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_entry(meta_path):
+    """``(data_path, meta)`` named by the sidecar at ``meta_path``, or ``(None, None)``."""
+    meta = _read_meta(meta_path)
+    if meta is None or not meta.get('data'):
+        # Sin entrada (o del formato anterior, <sha256>.bin): cuenta como fallo
+        return None, None
+    return meta_path.with_name(meta['data']), meta
+
+
+def write_atomic(path, data: bytes):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        _silent_remove(tmp)
+        raise
+
+
+def _write_meta(meta_path, meta):
+    write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+
+def _silent_remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def lookup(blob_path):
+    """Return ``(data_path, meta)`` for a fresh cached entry, or None.
+
+    Entries older than the revalidation window are checked with a
+    conditional GET against their ETag before being returned (and returned
+    as they are if that request fails); if the blob changed and no longer
+    fits, :class:`BlobTooLarge` is raised.
+    """
+    meta_path = _meta_path(blob_path)
+    data_path, meta = _read_entry(meta_path)
+    if meta is None or not data_path.exists():
+        return None
+
+    max_age = getattr(settings, 'BLOB_CACHE_REVALIDATE_SECONDS', 3600)
+    if max_age and time.time() - meta.get('validated_at', 0) > max_age:
+        try:
+            downloader = open_blob_stream(blob_path, etag=meta.get('etag'))
+        except ResourceNotFoundError:
+            invalidate(blob_path)
+            raise
+        except AzureError as e:
+            if not is_not_modified(e):
+                # Azure falla o no responde: la copia en disco es la última conocida
+                logger.warning(f'No se pudo revalidar {blob_path}, se sirve la copia en caché: {e}')
+            else:
+                meta['validated_at'] = time.time()
+                _write_meta(meta_path, meta)
+                _count('revalidated')
+        else:
+            # El blob cambió: se reemplaza la entrada con la nueva descarga
+            return _store(blob_path, downloader)
+
+    try:
+        os.utime(data_path)
+    except FileNotFoundError:
+        # Desalojada por otro worker entre la lectura y el acceso
+        return None
+    return data_path, meta
+
+
+def fetch(blob_path):
+    """Read-through: return ``(data_path, meta)``, downloading on a miss.
+
+    Raises :class:`BlobTooLarge` when the blob is larger than
+    ``BLOB_CACHE_MAX_FILE_BYTES`` (the caller should stream its downloader
+    instead) and ``ResourceNotFoundError`` if the blob does not exist.
+    """
+    entry = lookup(blob_path)
+    if entry is not None:
+        _count('hits')
+        return entry
+    _count('misses')
+    return _store(blob_path, open_blob_stream(blob_path))
+
+
+def read_bytes(blob_path) -> bytes:
+    """Return the blob content through the cache (read straight from Azure if it is too large to cache)."""
+    try:
+        entry = fetch(blob_path)
+    except BlobTooLarge as e:
+        return e.downloader.readall()
+    with open(entry[0], 'rb') as f:
+        return f.read()
+
+
+def read_media_bytes(name, blob_path=None) -> bytes:
+    """Bytes of a media file by its stored name: Azure through this cache, else ``MEDIA_ROOT``.
+
+    Server-side code (PDF photo, certificates) reads media through here
+    instead of fetching its own public URL. ``blob_path`` skips the index
+    lookup when the caller already resolved it (``''`` = not in Azure).
+    Raises ``FileNotFoundError`` when neither Azure nor the disk has it.
+    """
+    if blob_path is None:
+        blob_path = resolve_blob_name(name)
+    if blob_path:
+        try:
+            content = read_bytes(blob_path) if is_enabled() else download_blob_bytes(blob_path)
+            if content is not None:
+                return content
+        except ResourceNotFoundError:
+            pass
+        except (AzureError, OSError) as e:
+            logger.warning(f'No se pudo leer {blob_path} de Azure: {e}')
+    with open(os.path.join(settings.MEDIA_ROOT, name.lstrip('/').replace('/', os.sep)), 'rb') as f:
+        return f.read()
+
+
+def open_media_file(name, blob_path=None):
+    """Seekable binary file with a media file, like :func:`read_media_bytes` but never loaded whole.
+
+    Azure blobs are opened from this cache, or spooled to a temporary file
+    (on disk past ``AZURE_STREAM_CHUNK_SIZE``) when they cannot be cached.
+    The caller closes it. Raises ``FileNotFoundError`` when neither Azure
+    nor the disk has it.
+    """
+    if blob_path is None:
+        blob_path = resolve_blob_name(name)
+    if blob_path:
+        try:
+            return _open_blob_file(blob_path)
+        except ResourceNotFoundError:
+            pass
+        except (AzureError, OSError) as e:
+            logger.warning(f'No se pudo leer {blob_path} de Azure: {e}')
+    return open(os.path.join(settings.MEDIA_ROOT, name.lstrip('/').replace('/', os.sep)), 'rb')
+
+
+def _open_blob_file(blob_path):
+    downloader = None
+    if is_enabled():
+        try:
+            data_path, _ = fetch(blob_path)
+            return open(data_path, 'rb')
+        except BlobTooLarge as e:
+            downloader = e.downloader
+        except FileNotFoundError:
+            pass  # Desalojado justo ahora
+    if downloader is None:
+        downloader = open_blob_stream(blob_path)
+    spool = tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'AZURE_STREAM_CHUNK_SIZE', 4 * 1024 * 1024))
+    try:
+        downloader.readinto(spool)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def _check_size(blob_path, downloader):
+    if downloader.size > getattr(settings, 'BLOB_CACHE_MAX_FILE_BYTES', 20 * 1024 * 1024):
+        _count('bypassed')
+        # Una versión anterior cacheada ya no es válida
+        invalidate(blob_path)
+        raise BlobTooLarge(blob_path, downloader)
+
+
+@contextmanager
+def _data_writer(data_path):
+    """Open a temp file next to ``data_path``; it becomes ``data_path`` only if the block succeeds."""
+    fd, tmp = tempfile.mkstemp(dir=data_path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.replace(tmp, data_path)
+    except BaseException:
+        _silent_remove(tmp)
+        raise
+
+
+def _finish_store(blob_path, downloader, data_path):
+    meta_path = _meta_path(blob_path)
+    previous, _ = _read_entry(meta_path)
+    properties = downloader.properties
+    content_type = properties.content_settings.content_type if properties.content_settings else None
+    meta = {
+        'blob_path': blob_path,
+        'data': data_path.name,
+        'etag': properties.etag,
+        'last_modified': properties.last_modified.timestamp() if properties.last_modified else None,
+        'content_type': content_type,
+        'size': downloader.size,
+        'validated_at': time.time(),
+    }
+    # A partir de aquí se lee el par nuevo; quien ya leyó la meta anterior sigue
+    # con su archivo (o no lo encuentra y va a Azure), nunca con bytes de otra versión
+    _write_meta(meta_path, meta)
+    _add_bytes(downloader.size)
+    if previous is not None and previous != data_path:
+        _add_bytes(-_file_size(previous))
+        _silent_remove(previous)
+    _evict()
+    return data_path, meta
+
+
+def _prepare_store(blob_path, downloader):
+    """Size check before a download; returns the new data file to write."""
+    _check_size(blob_path, downloader)
+    meta_path = _meta_path(blob_path)
+    meta_path.parent.mkdir(parents=True, exist_ok=True)
+    return meta_path.with_name(f'{meta_path.stem}.{secrets.token_hex(8)}.bin')
+
+
+def _store(blob_path, downloader):
+    data_path = _prepare_store(blob_path, downloader)
+    with _data_writer(data_path) as f:
+        for chunk in downloader.chunks():
+            f.write(chunk)
+    return _finish_store(blob_path, downloader, data_path)
+
+
+async def _astore(blob_path, downloader):
+    # Todo el acceso a disco va a hilos: el loop solo espera los chunks de Azure
+    def in_thread(func, *args):
+        return sync_to_async(func, thread_sensitive=False)(*args)
+
+    data_path = await in_thread(_prepare_store, blob_path, downloader)
+    writer = _data_writer(data_path)
+    f = await in_thread(writer.__enter__)
+    try:
+        async for chunk in downloader.chunks():
+            await in_thread(f.write, chunk)
+    except BaseException as e:
+        await in_thread(writer.__exit__, type(e), e, e.__traceback__)
+        raise
+    await in_thread(writer.__exit__, None, None, None)
+    return await in_thread(_finish_store, blob_path, downloader, data_path)
+
+
+async def afetch(blob_path):
+    """Async :func:`fetch` for the ASGI views: downloads a miss with the aio client.
+
+    Revalidating a stale entry still uses the sync client, in a worker thread.
+    """
+    from .azure_blob_aio import open_blob_stream as aopen_blob_stream
+
+    try:
+        entry = await sync_to_async(lookup, thread_sensitive=False)(blob_path)
+    except BlobTooLarge:
+        # Cambió y ya no cabe: la entrada quedó invalidada, se sigue como fallo
+        # para devolver una descarga aio
+        entry = None
+    if entry is not None:
+        _count('hits')
+        return entry
+    _count('misses')
+    return await _astore(blob_path, await aopen_blob_stream(blob_path))
+
+
+def invalidate(blob_path):
+    """Remove ``blob_path`` from the cache (no-op if it is not cached)."""
+    meta_path = _meta_path(blob_path)
+    data_path, _ = _read_entry(meta_path)
+    _silent_remove(meta_path)
+    if data_path is not None:
+        size = _file_size(data_path)
+        _silent_remove(data_path)
+        _add_bytes(-size)
+
+
+def _remove_data(data_path):
+    """Delete a data file, and its sidecar if it still names this file."""
+    meta_path = data_path.with_name(f'{data_path.name.split(".", 1)[0]}.json')
+    meta = _read_meta(meta_path)
+    if meta is None or meta.get('data') == data_path.name:
+        _silent_remove(meta_path)
+    _silent_remove(data_path)
+
+
+def _entries():
+    directory = cache_dir()
+    if not directory.is_dir():
+        return []
+    entries = []
+    for path in directory.glob('*.bin'):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((path, st.st_size, st.st_mtime))
+    return entries
+
+
+def _evict():
+    """Delete least recently used entries until the cache fits ``BLOB_CACHE_MAX_BYTES``."""
+    max_bytes = getattr(settings, 'BLOB_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+    if _cached_bytes() <= max_bytes:
+        return
+    # Recuento real: incluye lo que escribieron los otros workers
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        _add_bytes(0, total=total)
+        return
+    for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+        _remove_data(path)
+        total -= size
+        _count('evictions')
+        if total <= max_bytes:
+            break
+    _add_bytes(0, total=total)
+    logger.debug(f'Caché de blobs recortada a {total} bytes')
@@ -0,0 +1,166 @@
+"""
+Anexo de certificados pre-unido por perfil.
+
+Descargar y volver a leer cada certificado es lo más lento de armar el PDF
+del CV, y los certificados cambian mucho menos que el texto. Por eso cada
+perfil tiene un único PDF con todos sus certificados ya unidos
+(``anexos_cv/<perfil>-<clave>.pdf`` en el storage de media), identificado por
+una huella de los archivos incluidos y sus versiones (ETag o mtime).
+
+Cuando cambia una Experiencia, Curso o Recomendación, las señales encargan la
+reconstrucción en segundo plano (pool de ``jobs`` o ``process_pdf_jobs``).
+Mientras el anexo no esté al día, ``write_cv_pdf`` anexa los certificados uno
+a uno como antes. Si una reconstrucción queda incompleta (falla la descarga de
+algún certificado) se anota su clave y ``write_cv_pdf`` no vuelve a encargarla
+para esa misma clave hasta pasados ``CV_CERT_BUNDLE_RETRY_SECONDS``.
+"""
+
+import hashlib
+import json
+import logging
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+from pypdf import PdfWriter
+
+from .azure_blob import save_media_bytes
+from .blob_cache import open_media_file
+from .cert_metadata import certificate_plan
+from .cv_pdf import CERT_RELATIONS, append_certificates, certificate_items, file_versions
+from .jobs import run_in_background
+from .models import AnexoCertificados, Perfil
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_PREFIX = 'anexos_cv/'
+
+
+def is_enabled():
+    return getattr(settings, 'CV_CERT_BUNDLE_ENABLED', True)
+
+
+def bundle_key(items):
+    """Huella de la lista ordenada de certificados y sus versiones."""
+    names = [item.certificado.name for item in items]
+    versions = file_versions(names)
+    payload = json.dumps([[name, versions.get(name, '')] for name in names])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_bundle(perfil, items, clave=None):
+    """Archivo abierto (que cierra quien llama) con el anexo de ``perfil`` si está al día con ``items``; si no, None.
+
+    El anexo puede ocupar decenas de MB: en Azure se lee de la caché de disco
+    (``blob_cache.open_media_file``) y en local del propio archivo, nunca
+    entero en memoria. ``clave`` evita recalcular ``bundle_key(items)``.
+    """
+    if not is_enabled():
+        return None
+    anexo = AnexoCertificados.objects.filter(perfil_id=perfil.pk).first()
+    if anexo is None or not anexo.archivo or anexo.clave != (clave or bundle_key(items)):
+        return None
+    try:
+        if hasattr(default_storage, 'upload_bytes'):
+            # Guardado con save_media_bytes: el blob se llama exactamente así
+            return open_media_file(anexo.archivo, blob_path=anexo.archivo)
+        return default_storage.open(anexo.archivo, 'rb')
+    except Exception as e:
+        logger.warning(f'No se pudo leer el anexo {anexo.archivo}: {e}')
+        return None
+
+
+def schedule_bundle(perfil_id, create=True, clave=None):
+    """Marca el anexo del perfil como pendiente y, en modo 'thread', lo reconstruye en segundo plano.
+
+    Si ya hay una reconstrucción en curso (y no está bloqueada más de
+    ``CV_PDF_JOB_TIMEOUT``) no se encarga otra. Con ``clave`` (la huella
+    actual de los certificados) tampoco se encarga si esa misma clave quedó
+    incompleta hace menos de ``CV_CERT_BUNDLE_RETRY_SECONDS``.
+    """
+    if not is_enabled():
+        return
+    now = timezone.now()
+    limite = now - timedelta(seconds=getattr(settings, 'CV_PDF_JOB_TIMEOUT', 600))
+    anexos = AnexoCertificados.objects.filter(perfil_id=perfil_id)
+    if clave:
+        reintento = now - timedelta(seconds=getattr(settings, 'CV_CERT_BUNDLE_RETRY_SECONDS', 3600))
+        anexos = anexos.exclude(clave_fallida=clave, fallido__gte=reintento)
+    flipped = anexos.filter(
+        Q(pendiente=False) | Q(actualizado__lt=limite)
+    ).update(pendiente=True, actualizado=now)
+    if not flipped:
+        if not create:
+            return
+        _, created = AnexoCertificados.objects.get_or_create(perfil_id=perfil_id)
+        if not created:
+            return  # Ya encargado
+    if getattr(settings, 'CV_PDF_JOBS_MODE', 'thread') == 'thread':
+        run_in_background(rebuild_bundle, perfil_id)
+
+
+def rebuild_bundle(perfil_id):
+    """Reconstruye el anexo del perfil si sus certificados cambiaron. Devuelve el ``AnexoCertificados``."""
+    perfil = Perfil.objects.filter(pk=perfil_id).prefetch_related(*CERT_RELATIONS).first()
+    if perfil is None:
+        return None
+    anexo, _ = AnexoCertificados.objects.get_or_create(perfil=perfil)
+    items = certificate_items(perfil)
+    clave = bundle_key(items) if items else ''
+
+    if anexo.clave == clave and (anexo.archivo or not items):
+        anexo.pendiente = False
+        anexo.save(update_fields=['pendiente', 'actualizado'])
+        return anexo
+
+    anterior = anexo.archivo
+    archivo, certificados, paginas = '', 0, 0
+    if items:
+        writer = PdfWriter()
+        certificados = append_certificates(writer, items)
+        esperados = len(items) - len(certificate_plan(items)['invalidos'])
+        if certificados < esperados:
+            # Falló alguna descarga: no guardar un anexo incompleto con la clave actual
+            logger.warning(f'Anexo del perfil {perfil_id} incompleto ({certificados}/{esperados}), se reintentará')
+            anexo.pendiente = False
+            anexo.clave_fallida, anexo.fallido = clave, timezone.now()
+            anexo.save(update_fields=['pendiente', 'clave_fallida', 'fallido', 'actualizado'])
+            return anexo
+        # Como open_cv_pdf: el anexo (decenas de MB) pasa a disco en lugar de copiarse en memoria
+        with tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'CV_PDF_SPOOL_MAX_BYTES', 8 * 1024 * 1024)) as out:
+            writer.write(out)
+            out.seek(0)
+            paginas = len(writer.pages)
+            archivo = save_media_bytes(
+                default_storage, f'{BUNDLE_PREFIX}{perfil_id}-{clave[:16]}.pdf', out, 'application/pdf'
+            )
+
+    anexo.clave, anexo.archivo = clave, archivo
+    anexo.certificados, anexo.paginas, anexo.pendiente = certificados, paginas, False
+    anexo.clave_fallida, anexo.fallido = '', None
+    anexo.save()
+    logger.info(f'Anexo de certificados del perfil {perfil_id}: {certificados} certificados, {paginas} págs.')
+
+    if anterior and anterior != archivo:
+        delete_bundle_file(anterior)
+    return anexo
+
+
+def delete_bundle_file(archivo):
+    try:
+        default_storage.delete(archivo)
+    except Exception as e:
+        logger.warning(f'No se pudo borrar el anexo {archivo}: {e}')
+
+
+def rebuild_pending(limit=None):
+    """Reconstruye los anexos pendientes (modo 'db'). Devuelve cuántos procesó."""
+    pendientes = AnexoCertificados.objects.filter(pendiente=True).values_list('perfil_id', flat=True)
+    processed = 0
+    for perfil_id in list(pendientes[:limit] if limit else pendientes):
+        rebuild_bundle(perfil_id)
+        processed += 1
+    return processed
@@ -0,0 +1,99 @@
+"""
+Índice persistente de metadatos de los certificados PDF.
+
+Cada certificado se analiza una sola vez (al subirlo a Azure o con
+``manage.py index_certificates``): número de páginas, versión PDF, tamaño,
+ETag y si ``pypdf`` lo puede leer. El armado del PDF del CV usa el índice para
+saltarse de antemano los archivos inválidos y para saber cuántas páginas y
+bytes va a añadir antes de descargar nada.
+"""
+
+import logging
+import re
+from io import BytesIO
+
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+_VERSION_RE = re.compile(rb'%PDF-(\d\.\d)')
+
+
+def certificate_prefixes():
+    """Carpetas ``upload_to`` de los campos ``certificado``."""
+    from .models import Experiencia, Curso, Recomendacion
+
+    return tuple(model._meta.get_field('certificado').upload_to for model in (Experiencia, Curso, Recomendacion))
+
+
+def is_certificate(name):
+    return bool(name) and name.lower().endswith('.pdf') and name.startswith(certificate_prefixes())
+
+
+def inspect_pdf(data):
+    """Analiza los bytes de un PDF. Devuelve un dict con los campos de ``MetadatoCertificado``."""
+    info = {'tamano': len(data), 'paginas': None, 'valido': False, 'version_pdf': '', 'error': ''}
+    match = _VERSION_RE.search(data[:1024])
+    if match:
+        info['version_pdf'] = match.group(1).decode('ascii')
+    try:
+        reader = PdfReader(BytesIO(data))
+        if reader.is_encrypted and not reader.decrypt(''):
+            raise ValueError('PDF cifrado con contraseña')
+        info['paginas'] = len(reader.pages)
+        info['valido'] = info['paginas'] > 0
+        if not info['valido']:
+            info['error'] = 'PDF sin páginas'
+    except Exception as e:
+        info['error'] = str(e)[:1000]
+    return info
+
+
+def record_certificate(nombre, data, nombre_blob='', etag=''):
+    """Analiza ``data`` y guarda (o actualiza) los metadatos de ``nombre``."""
+    from .models import MetadatoCertificado
+
+    info = inspect_pdf(data)
+    metadato, _ = MetadatoCertificado.objects.update_or_create(
+        nombre=nombre,
+        defaults={'nombre_blob': nombre_blob or nombre, 'etag': etag or '', **info},
+    )
+    if not metadato.valido:
+        logger.warning(f'Certificado inválido {nombre}: {metadato.error}')
+    return metadato
+
+
+def forget_certificate(nombre):
+    from .models import MetadatoCertificado
+
+    MetadatoCertificado.objects.filter(nombre=nombre).delete()
+
+
+def get_metadata(nombres):
+    """``{nombre: MetadatoCertificado}`` para los nombres ya indexados (una consulta)."""
+    from .models import MetadatoCertificado
+
+    return {m.nombre: m for m in MetadatoCertificado.objects.filter(nombre__in=list(nombres))}
+
+
+def certificate_plan(items, metadata=None):
+    """Resumen de lo que aportarán los certificados de ``items`` al PDF.
+
+    Devuelve ``{'certificados', 'paginas', 'bytes', 'invalidos', 'sin_indice'}``;
+    ``paginas`` y ``bytes`` solo cuentan certificados indexados y válidos.
+    """
+    nombres = [item.certificado.name for item in items]
+    if metadata is None:
+        metadata = get_metadata(nombres)
+    plan = {'certificados': 0, 'paginas': 0, 'bytes': 0, 'invalidos': [], 'sin_indice': []}
+    for nombre in nombres:
+        metadato = metadata.get(nombre)
+        if metadato is None:
+            plan['sin_indice'].append(nombre)
+        elif not metadato.valido:
+            plan['invalidos'].append(nombre)
+        else:
+            plan['certificados'] += 1
+            plan['paginas'] += metadato.paginas or 0
+            plan['bytes'] += metadato.tamano or 0
+    return plan
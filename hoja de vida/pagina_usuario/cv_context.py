@@ -0,0 +1,83 @@
+"""
+Carga de un perfil con todas sus relaciones para las vistas de la hoja de vida.
+
+Un ``Perfil`` se obtiene con ``select_related('user')`` y un ``prefetch_related``
+por cada relación, así que construir el contexto cuesta siempre el mismo número
+de consultas (1 + una por relación) sin importar cuántas entradas tenga el
+perfil. Las relaciones con columnas que ninguna plantilla muestra se cargan
+con ``only()``.
+"""
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Perfil, Experiencia, Educacion, Curso, Productos, Recomendacion, Habilidad, VentaGarage
+
+# Relación -> (modelo, columnas usadas por las plantillas o None para todas)
+CV_PREFETCH = {
+    'experiencias': (Experiencia, None),
+    'educaciones': (Educacion, ('id', 'perfil', 'titulo', 'institucion', 'estado')),
+    'habilidades': (Habilidad, ('id', 'perfil', 'nombre')),
+    'cursos': (Curso, (
+        'id', 'perfil', 'nombre', 'nombre_curso', 'institucion', 'entidad',
+        'nombre_contacto_auspicia', 'telefono_contacto_auspicia', 'email_empresa_patrocinadora',
+        'total_horas', 'fecha_inicio', 'fecha_fin', 'activo', 'certificado',
+    )),
+    'productos': (Productos, ('id', 'perfil', 'titulo', 'tipo', 'clasificador', 'descripcion', 'activo')),
+    'recomendaciones': (Recomendacion, None),
+    'ventas_garage': (VentaGarage, None),
+}
+
+
+def cv_prefetches():
+    lookups = []
+    for relation, (model, fields) in CV_PREFETCH.items():
+        queryset = model.objects.order_by('pk')
+        if fields:
+            queryset = queryset.only(*fields)
+        lookups.append(Prefetch(relation, queryset=queryset))
+    return lookups
+
+
+def cv_queryset():
+    return Perfil.objects.select_related('user').prefetch_related(*cv_prefetches())
+
+
+def prefetch_cv(perfil):
+    """Precarga las relaciones del CV en un perfil ya obtenido (no repite las ya cargadas)."""
+    prefetch_related_objects([perfil], *cv_prefetches())
+    return perfil
+
+
+def load_cv_perfil(user=None, username=None):
+    """Devuelve ``(perfil, creado)`` con todas las relaciones precargadas.
+
+    Crea el perfil si el usuario aún no tiene uno. Lanza ``User.DoesNotExist``
+    si ``username`` no existe.
+    """
+    from django.contrib.auth.models import User
+
+    lookup = {'user': user} if user is not None else {'user__username': username}
+    perfil = cv_queryset().filter(**lookup).first()
+    if perfil is not None:
+        return perfil, False
+
+    if user is None:
+        user = User.objects.get(username=username)
+    perfil, created = Perfil.objects.get_or_create(user=user)
+    return prefetch_cv(perfil), created
+
+
+def cv_context(perfil, **extra):
+    """Contexto común de las plantillas del CV a partir de un perfil precargado."""
+    context = {
+        'perfil': perfil,
+        'experiencias': perfil.experiencias.all(),
+        'educaciones': perfil.educaciones.all(),
+        'habilidades': perfil.habilidades.all(),
+        'cursos': perfil.cursos.all(),
+        'productos': perfil.productos.all(),
+        'recomendaciones': perfil.recomendaciones.all(),
+        'ventas_garage': perfil.ventas_garage.all(),
+    }
+    context.update(extra)
+    return context
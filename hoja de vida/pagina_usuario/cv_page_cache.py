@@ -0,0 +1,64 @@
+"""
+Caché del HTML ya renderizado de la hoja de vida pública.
+
+Se guarda el cuerpo de ``u_hoja_de_vida_contenido.html`` por perfil (``pk``) y
+por ``es_propietario``; un acierto evita todas las consultas del perfil y el
+render de la plantilla grande. Como la URL trae el nombre de usuario, una
+segunda entrada ``usuario -> pk`` lleva de uno a otro, y cada página guarda el
+usuario con el que se renderizó: tras un cambio de nombre el nombre viejo deja
+de encontrarla aunque otro usuario lo tome. El backend es el alias
+``CV_PAGE_CACHE_ALIAS`` de ``CACHES`` (archivos o base de datos, compartidos
+entre workers, ver ``settings.py``). Las señales de ``pagina_usuario.signals``
+borran las entradas del perfil cuando cambia el ``Perfil``, su usuario o
+cualquier fila relacionada.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.safestring import mark_safe
+
+CV_PAGE_TEMPLATE = 'u_hoja_de_vida_contenido.html'
+
+
+def is_enabled():
+    return getattr(settings, 'CV_PAGE_CACHE_ENABLED', True)
+
+
+def _cache():
+    return caches[getattr(settings, 'CV_PAGE_CACHE_ALIAS', 'cv_pages')]
+
+
+def _key(perfil_id, es_propietario):
+    return f'cv_page:{perfil_id}:{int(bool(es_propietario))}'
+
+
+def _user_key(username):
+    return f'cv_page_user:{username}'
+
+
+def get_cv_page(username, es_propietario):
+    """HTML cacheado del CV de ``username`` o None."""
+    if not is_enabled():
+        return None
+    cache = _cache()
+    perfil_id = cache.get(_user_key(username))
+    if perfil_id is None:
+        return None
+    entry = cache.get(_key(perfil_id, es_propietario))
+    if entry is None or entry[0] != username:
+        return None
+    return mark_safe(entry[1])
+
+
+def set_cv_page(perfil, es_propietario, html):
+    if is_enabled():
+        username = perfil.user.username
+        _cache().set_many(
+            {_user_key(username): perfil.pk, _key(perfil.pk, es_propietario): (username, str(html))},
+            getattr(settings, 'CV_PAGE_CACHE_TIMEOUT', 86400),
+        )
+
+
+def invalidate_cv_page(perfil_id):
+    """Borra las dos variantes (visitante y propietario) del CV del perfil."""
+    _cache().delete_many([_key(perfil_id, False), _key(perfil_id, True)])
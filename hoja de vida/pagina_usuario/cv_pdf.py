@@ -0,0 +1,506 @@
+"""
+Construcción del PDF de la hoja de vida (CV + certificados anexos).
+
+El PDF final se guarda en disco bajo ``CV_PDF_CACHE_DIR`` con una clave que es
+la huella (hash) del contenido del perfil: datos del ``Perfil``, del usuario,
+de todas las filas relacionadas, ETags de la foto y de los certificados y la
+plantilla. Las señales de ``pagina_usuario.signals`` borran los PDFs de un
+perfil cuando algo cambia, así que una descarga repetida es una lectura de
+disco en lugar de segundos de WeasyPrint + pypdf. Un PDF al que le faltan
+partes (foto o certificados que no se pudieron leer, p. ej. por un error de
+Azure) no se guarda con la huella: se vuelve a intentar en la siguiente descarga.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import copy_context
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models.fields.files import FieldFile
+from django.template.loader import get_template
+from django.utils import timezone
+from pypdf import PdfReader, PdfWriter
+
+from . import metrics, render_pool
+from .azure_blob import resolve_blob_names
+from .blob_cache import read_media_bytes
+from .cert_metadata import certificate_plan, get_metadata, record_certificate
+from .cv_context import cv_context, prefetch_cv
+from .instrumentation import phase
+from .models import IndiceBlob
+from .pdf_media import collect_media, make_url_fetcher, media_url
+from .photo_variants import best_variant
+
+logger = logging.getLogger(__name__)
+
+CV_TEMPLATE = 'cv_pdf_template.html'
+CV_STYLESHEET = Path(__file__).resolve().parent / 'templates' / 'cv_pdf_template.css'
+
+# Relaciones que aparecen en el PDF, en el orden en que se hashean
+CV_RELATIONS = ('experiencias', 'educaciones', 'cursos', 'productos', 'recomendaciones', 'habilidades')
+
+# Relaciones cuyos certificados se anexan, en orden de páginas
+CERT_RELATIONS = ('experiencias', 'cursos', 'recomendaciones')
+
+
+def _foto_url(perfil):
+    if not perfil.foto:
+        return None
+    # Variante de 400 px en JPEG si existe (la original puede pesar varios MB)
+    nombre = best_variant(perfil.foto.name, 'pdf')
+    # WeasyPrint la lee del storage con pdf_media.make_url_fetcher (sin base64 en el HTML)
+    return media_url(nombre, file_versions([nombre])[nombre])
+
+
+def build_cv_context(perfil):
+    prefetch_cv(perfil)
+    return cv_context(perfil, foto_url=_foto_url(perfil), timezone=timezone.now())
+
+
+# Tope de imágenes que WeasyPrint deja en la caché de un hilo entre renders
+CV_IMAGE_CACHE_MAX_ENTRIES = 256
+_render_local = threading.local()
+
+
+def _compile_resources():
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    stylesheet = CSS(filename=str(CV_STYLESHEET), font_config=font_config)
+    return stylesheet, font_config
+
+
+def render_resources(fresh=False):
+    """``(stylesheet, font_config)`` para WeasyPrint.
+
+    La hoja de estilos se compila y las fuentes se resuelven una sola vez por
+    hilo (Pango no garantiza que un ``FontConfiguration`` se pueda usar desde
+    varios hilos a la vez); los hilos de los pools se reutilizan, así que en la
+    práctica es una vez por worker. ``fresh=True`` los crea de nuevo (benchmark).
+    """
+    if fresh:
+        return _compile_resources()
+    resources = getattr(_render_local, 'resources', None)
+    if resources is None:
+        resources = _render_local.resources = _compile_resources()
+    return resources
+
+
+def _image_cache():
+    """Caché de imágenes de WeasyPrint del hilo actual para el próximo render.
+
+    WeasyPrint no la trata como una caché con pérdidas: una imagen guardada al
+    empezar el render se vuelve a leer durante el layout. Por eso no se desaloja
+    nada mientras se usa; si creció por encima de ``CV_IMAGE_CACHE_MAX_ENTRIES``
+    se empieza una nueva antes del render. Cada hilo renderiza un CV a la vez.
+    """
+    cache = getattr(_render_local, 'images', None)
+    if cache is None or len(cache) > CV_IMAGE_CACHE_MAX_ENTRIES:
+        cache = _render_local.images = {}
+    return cache
+
+
+def render_cv_pdf(perfil, base_url, fresh_resources=False, missing=None, use_pool=None):
+    """Renderiza solo las páginas del CV con WeasyPrint y devuelve los bytes.
+
+    Las imágenes de media que no se pudieron leer se añaden a ``missing``.
+    ``use_pool`` elige entre ``render_pool`` y este proceso (por defecto,
+    ``CV_PDF_RENDER_POOL``).
+    """
+    if use_pool is None:
+        use_pool = render_pool.is_enabled()
+    with phase('pdf_html'):
+        html_string = get_template(CV_TEMPLATE).render(build_cv_context(perfil))
+    if use_pool and not fresh_resources:
+        # WeasyPrint fuera del proceso web (ver render_pool); las imágenes media: viajan con el HTML
+        resources = collect_media(html_string, missing)
+        with phase('weasyprint'):
+            return render_pool.render_pdf(html_string, base_url, resources)
+
+    from weasyprint import HTML
+
+    stylesheet, font_config = render_resources(fresh=fresh_resources)
+    with phase('weasyprint'):
+        return HTML(string=html_string, base_url=base_url, url_fetcher=make_url_fetcher(base_url, missing)).write_pdf(
+            stylesheets=[stylesheet],
+            font_config=font_config,
+            cache=None if fresh_resources else _image_cache(),
+        )
+
+
+def fetch_certificate(nombre_blob, blob_path=None):
+    """Bytes de un certificado: Azure (ruta resuelta con el índice, vía caché local) o disco local.
+
+    Devuelve ``(contenido, error)``; ``contenido`` es None si no se pudo obtener.
+    """
+    try:
+        return read_media_bytes(nombre_blob, blob_path), None
+    except Exception as e:
+        return None, f'no está en Azure ({blob_path or "sin índice"}) ni en disco: {e}'
+
+
+def fetch_certificates(items):
+    """Descarga en paralelo los certificados de ``items``.
+
+    Las rutas se resuelven primero con una sola consulta al índice; luego un
+    pool de hilos acotado (``CV_PDF_CERT_FETCH_WORKERS``) hace las descargas a
+    la vez. Devuelve ``[(item, contenido, error), ...]`` en el mismo orden que
+    ``items``.
+    """
+    names = [item.certificado.name for item in items]
+    if not names:
+        return []
+    resolved = resolve_blob_names(names)
+    workers = max(1, min(getattr(settings, 'CV_PDF_CERT_FETCH_WORKERS', 8), len(names)))
+    # '' (no None) para que los hilos no vuelvan a consultar el índice en la BD
+    with phase('certificados'), ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cv-cert') as pool:
+        # copy_context: las llamadas a Azure de los hilos cuentan en las métricas de la petición
+        futures = [
+            pool.submit(copy_context().run, fetch_certificate, name, resolved.get(name.lstrip('/')) or '')
+            for name in names
+        ]
+        results = [future.result() for future in futures]
+    return [(item, content, error) for item, (content, error) in zip(items, results)]
+
+
+def certificate_items(perfil):
+    """Filas con certificado, en el orden Experiencia → Curso → Recomendacion."""
+    items = []
+    for relation in CERT_RELATIONS:
+        for item in getattr(perfil, relation).all():
+            certificado_field = getattr(item, 'certificado', None)
+            if certificado_field and getattr(certificado_field, 'name', None):
+                items.append(item)
+    return items
+
+
+def _index_certificate(nombre, content):
+    try:
+        record_certificate(nombre, content)
+    except Exception as e:
+        logger.warning(f'No se pudo indexar el certificado {nombre}: {e}')
+
+
+def _append_pdf(writer, content, nombre):
+    """Añade todas las páginas de ``content`` (bytes o archivo abierto) a ``writer``.
+
+    Devuelve False si no es un PDF legible. pypdf lee las páginas de un
+    archivo al escribir ``writer``: tiene que seguir abierto hasta entonces.
+    """
+    try:
+        with phase('pypdf'):
+            reader = PdfReader(content if hasattr(content, 'read') else BytesIO(content))
+            for page in reader.pages:
+                writer.add_page(page)
+    except Exception as e:
+        logger.error(f'ERROR PDF: {nombre} - {e}')
+        return False
+    return True
+
+
+def append_certificates(writer, items, missing=None):
+    """Descarga y anexa a ``writer`` los certificados de ``items``. Devuelve cuántos añadió.
+
+    Los que no se pudieron descargar se añaden a ``missing``; los inválidos
+    (según el índice o ilegibles para pypdf) no, porque reintentar no los arregla.
+    """
+    # El índice de metadatos dice de antemano qué certificados no se pueden anexar
+    metadata = get_metadata(item.certificado.name for item in items)
+    plan = certificate_plan(items, metadata)
+    logger.debug(
+        f"Certificados: {plan['certificados']} válidos ({plan['paginas']} págs., {plan['bytes']} bytes), "
+        f"{len(plan['invalidos'])} inválidos, {len(plan['sin_indice'])} sin índice"
+    )
+    for nombre in plan['invalidos']:
+        logger.warning(f'Certificado omitido (inválido según el índice): {nombre}')
+    invalidos = set(plan['invalidos'])
+    items = [item for item in items if item.certificado.name not in invalidos]
+
+    certs_added = 0
+    for item, content, error in fetch_certificates(items):
+        nombre_blob = item.certificado.name
+        if not content:
+            logger.warning(f'No se pudo obtener certificado {nombre_blob} ({item.__class__.__name__} {item.pk}): {error}')
+            if missing is not None:
+                missing.append(nombre_blob)
+            continue
+        if nombre_blob not in metadata:
+            # Subido antes del índice: se analiza una vez y queda registrado
+            _index_certificate(nombre_blob, content)
+
+        # Intentar anexar el PDF del certificado
+        if _append_pdf(writer, content, nombre_blob):
+            certs_added += 1
+            logger.debug(f'Certificado anexado: {nombre_blob}')
+
+    logger.debug(f'{certs_added} certificados añadidos')
+    return certs_added
+
+
+def write_cv_pdf(perfil, base_url, out, use_pool=None, schedule=True):
+    """Genera el PDF completo (CV renderizado + certificados anexados) y lo escribe en ``out``.
+
+    ``out`` es un archivo binario (temporal, de caché o ``BytesIO``): pypdf
+    escribe directamente en él, sin una copia intermedia del documento entero.
+    Si el anexo de certificados del perfil está al día se añade de una vez;
+    si no, se arman los certificados uno a uno y se encarga el anexo (salvo
+    con ``schedule=False``: procesos que pueden terminar antes que el hilo que
+    lo reconstruye). ``use_pool`` pasa a :func:`render_cv_pdf`.
+    Devuelve la lista de archivos (foto, certificados) que no se pudieron
+    leer y faltan en el PDF; vacía si está completo.
+    Lanza la excepción de WeasyPrint si el CV no se puede renderizar.
+    """
+    start = time.perf_counter()
+    missing = []
+    with memory_report(f'PDF del perfil {perfil.pk}'), ExitStack() as files:
+        prefetch_cv(perfil)
+        cv_bytes = render_cv_pdf(perfil, base_url, missing=missing, use_pool=use_pool)
+
+        writer = PdfWriter()
+        try:
+            with phase('pypdf'):
+                reader_cv = PdfReader(BytesIO(cv_bytes))
+                for page in reader_cv.pages:
+                    writer.add_page(page)
+        except Exception as e:
+            logger.error(f'ERROR al leer CV PDF: {e}')
+            # Si no se puede leer con pypdf, entregar solo el CV
+            out.write(cv_bytes)
+            return missing
+
+        items = certificate_items(perfil)
+        if items:
+            # Anexo de certificados ya unido en segundo plano (ver cert_bundle)
+            from .cert_bundle import bundle_key, load_bundle, schedule_bundle
+
+            clave = bundle_key(items)
+            anexo = load_bundle(perfil, items, clave)
+            if anexo is not None:
+                files.enter_context(anexo)
+            if anexo is not None and _append_pdf(writer, anexo, 'anexo de certificados'):
+                logger.debug(f'Anexo de certificados reutilizado para el perfil {perfil.pk}')
+            else:
+                append_certificates(writer, items, missing)
+                if schedule:
+                    schedule_bundle(perfil.pk, clave=clave)
+        del cv_bytes
+
+        with phase('pypdf'):
+            writer.write(out)
+    metrics.record_pdf_build(time.perf_counter() - start, len(writer.pages))
+    return missing
+
+
+def build_cv_pdf(perfil, base_url):
+    """``write_cv_pdf`` en memoria; devuelve los bytes del PDF."""
+    out = BytesIO()
+    write_cv_pdf(perfil, base_url, out)
+    return out.getvalue()
+
+
+# --- MEMORIA POR ARMADO ---
+
+def peak_rss():
+    """Máximo de memoria residente del proceso hasta ahora, en bytes (None si no se puede medir)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KiB, macOS en bytes
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def _mb(n):
+    return f'{n / (1024 * 1024):.1f} MB'
+
+
+@contextmanager
+def memory_report(label, trace=None):
+    """Registra duración y memoria de un armado de PDF y deja las cifras en el dict que entrega.
+
+    Siempre anota el máximo de RSS del proceso y cuánto lo subió este armado;
+    con ``CV_PDF_TRACE_MEMORY`` (o ``trace=True``) también el pico de memoria
+    Python del armado medido con tracemalloc, que frena el render y es global
+    al proceso: con armados simultáneos solo lo mide el primero.
+    """
+    if trace is None:
+        trace = getattr(settings, 'CV_PDF_TRACE_MEMORY', False)
+    trace = trace and not tracemalloc.is_tracing()
+    if trace:
+        tracemalloc.start()
+    stats = {}
+    rss_antes = peak_rss()
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats['segundos'] = time.perf_counter() - start
+        partes = [f'{stats["segundos"]:.2f} s']
+        if trace:
+            stats['pico_python'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            partes.append(f'pico Python {_mb(stats["pico_python"])}')
+        rss_max = peak_rss()
+        if rss_max is not None:
+            stats['rss_max'], stats['rss_crecimiento'] = rss_max, rss_max - rss_antes
+            partes.append(f'RSS máx. {_mb(rss_max)} (+{_mb(rss_max - rss_antes)})')
+        logger.info(f'{label}: {", ".join(partes)}')
+
+
+# --- CACHÉ DEL PDF FINAL ---
+
+@lru_cache(maxsize=1)
+def _template_hash():
+    template = get_template(CV_TEMPLATE)
+    digest = hashlib.sha256(template.template.source.encode('utf-8'))
+    digest.update(CV_STYLESHEET.read_bytes())
+    return digest.hexdigest()
+
+
+def file_versions(names):
+    """ETag (Azure) o mtime/tamaño (disco local) de cada archivo referenciado."""
+    etags = dict(
+        IndiceBlob.objects.filter(nombre_blob__in=names).values_list('nombre_blob', 'etag')
+    )
+    versions = {}
+    for name in names:
+        if etags.get(name):
+            versions[name] = etags[name]
+            continue
+        try:
+            st = os.stat(os.path.join(settings.MEDIA_ROOT, name.replace('/', os.sep)))
+            versions[name] = f'{st.st_mtime_ns}-{st.st_size}'
+        except OSError:
+            versions[name] = ''
+    return versions
+
+
+def _loaded_values(obj):
+    values = {}
+    for field in obj._meta.concrete_fields:
+        if field.attname not in obj.__dict__:
+            continue
+        value = getattr(obj, field.attname)
+        # getattr devuelve FieldFile para los FileField: la huella usa el nombre
+        values[field.attname] = value.name if isinstance(value, FieldFile) else value
+    return values
+
+
+def cv_fingerprint(perfil):
+    """Huella del contenido que determina el PDF de ``perfil``."""
+    user = perfil.user
+    data = {
+        'template': _template_hash(),
+        'user': [user.first_name, user.last_name, user.email],
+        'perfil': {
+            field.attname: getattr(perfil, field.attname)
+            for field in perfil._meta.concrete_fields
+        },
+    }
+    names = [perfil.foto.name] if perfil.foto else []
+    prefetch_cv(perfil)
+    for relation in CV_RELATIONS:
+        # Filas precargadas: solo las columnas cargadas (las que usan las plantillas)
+        rows = [_loaded_values(obj) for obj in getattr(perfil, relation).all()]
+        data[relation] = rows
+        names += [row['certificado'] for row in rows if row.get('certificado')]
+    data['files'] = file_versions(names)
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_dir() -> Path:
+    directory = getattr(settings, 'CV_PDF_CACHE_DIR', None) or Path(settings.MEDIA_ROOT) / '.cv_pdf_cache'
+    return Path(directory)
+
+
+def cv_pdf_path(perfil) -> Path:
+    """Ruta en caché del PDF correspondiente al contenido actual del perfil."""
+    return cache_dir() / f'{perfil.pk}-{cv_fingerprint(perfil)}.pdf'
+
+
+def build_cv_pdf_file(perfil, base_url, missing=None, **options) -> Path:
+    """Asegura que el PDF actual del perfil esté en disco y devuelve su ruta.
+
+    Si le faltan partes se guarda como ``<clave>.incompleto.pdf`` (que nunca
+    cuenta como acierto) y sus nombres se añaden a ``missing``. ``options``
+    (``use_pool``, ``schedule``) pasan a :func:`write_cv_pdf`.
+    """
+    path = cv_pdf_path(perfil)
+    if path.exists():
+        logger.debug(f'PDF de CV servido desde caché: {path.name}')
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Se escribe directamente en un temporal del mismo directorio y se renombra
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            faltan = write_cv_pdf(perfil, base_url, f, **options)
+        if faltan:
+            logger.warning(f'PDF del perfil {perfil.pk} incompleto, no se cachea (faltan: {", ".join(faltan)})')
+            if missing is not None:
+                missing.extend(faltan)
+            path = path.with_name(f'{path.stem}.incompleto.pdf')
+        else:
+            invalidate_cv_pdf(perfil.pk)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    return path
+
+
+def open_cv_pdf(perfil, base_url, missing=None, **options):
+    """Archivo binario abierto (en la posición 0) con el PDF del perfil, para ``FileResponse``.
+
+    Con la caché activa es el archivo cacheado; si no, un ``SpooledTemporaryFile``
+    que pasa a disco por encima de ``CV_PDF_SPOOL_MAX_BYTES``. Las partes que
+    faltan se añaden a ``missing``; ``options`` pasan a :func:`write_cv_pdf`.
+    """
+    if getattr(settings, 'CV_PDF_CACHE_ENABLED', True):
+        path = build_cv_pdf_file(perfil, base_url, missing, **options)
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            pass  # Invalidada por otro proceso justo ahora
+
+    spool = tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'CV_PDF_SPOOL_MAX_BYTES', 8 * 1024 * 1024))
+    try:
+        faltan = write_cv_pdf(perfil, base_url, spool, **options)
+        if missing is not None:
+            missing.extend(faltan)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def invalidate_cv_pdf(perfil_id):
+    """Borra los PDFs cacheados de un perfil."""
+    directory = cache_dir()
+    if not directory.is_dir():
+        return
+    for path in directory.glob(f'{perfil_id}-*.pdf'):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,77 @@
+"""
+Comprobaciones de salud para las sondas de la plataforma.
+
+- Liveness (``/health/live/``): el proceso responde; no toca la BD ni Azure.
+- Readiness (``/health/ready/``): ``SELECT 1`` en la BD y, con
+  ``HEALTH_CHECK_AZURE``, ``get_container_properties`` del contenedor de media,
+  cada uno con su latencia.
+
+El resultado de readiness se memoriza ``HEALTH_CHECK_CACHE_SECONDS`` por
+proceso y solo un hilo lo recalcula a la vez: una ráfaga de sondas cuesta una
+comprobación real cada pocos segundos.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from .azure_blob import get_container_name, get_service_client
+
+_lock = threading.Lock()
+_cached = None  # (calculado_en, resultado)
+
+
+def _timed(check):
+    start = time.perf_counter()
+    try:
+        check()
+        result = {'ok': True}
+    except Exception as e:
+        result = {'ok': False, 'error': str(e)}
+    result['ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def _ping_db():
+    with connections['default'].cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def _ping_azure():
+    container_client = get_service_client().get_container_client(get_container_name())
+    container_client.get_container_properties(timeout=getattr(settings, 'HEALTH_CHECK_AZURE_TIMEOUT', 5))
+
+
+def azure_check_enabled():
+    return getattr(settings, 'HEALTH_CHECK_AZURE', False) and bool(
+        getattr(settings, 'AZURE_STORAGE_CONNECTION_STRING', '')
+    )
+
+
+def run_checks():
+    """Ejecuta las comprobaciones sin caché: ``{'ready': bool, 'checks': {nombre: {...}}}``."""
+    checks = {'database': _timed(_ping_db)}
+    if azure_check_enabled():
+        checks['azure'] = _timed(_ping_azure)
+    return {'ready': all(check['ok'] for check in checks.values()), 'checks': checks}
+
+
+def readiness():
+    """Resultado de :func:`run_checks` memorizado; añade ``age_seconds`` (antigüedad del resultado)."""
+    global _cached
+    ttl = getattr(settings, 'HEALTH_CHECK_CACHE_SECONDS', 5)
+    cached = _cached
+    if cached is None or time.monotonic() - cached[0] >= ttl:
+        with _lock:
+            cached = _cached
+            if cached is None or time.monotonic() - cached[0] >= ttl:
+                cached = _cached = (time.monotonic(), run_checks())
+    return {**cached[1], 'age_seconds': round(time.monotonic() - cached[0], 1)}
+
+
+def reset():
+    """Olvida el resultado memorizado (tests)."""
+    global _cached
+    _cached = None
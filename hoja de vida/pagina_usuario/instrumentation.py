@@ -0,0 +1,184 @@
+"""
+Métricas de rendimiento por petición.
+
+``PerformanceMiddleware`` mide, para una muestra de las peticiones
+(``PERF_SAMPLE_RATE``), el tiempo total de la vista, las consultas SQL
+(número y tiempo), las llamadas a Azure (número, bytes y tiempo, con los
+hooks de ``azure_hooks`` en los clientes de ``azure_blob``) y las
+fases del PDF (``phase('weasyprint')``, ``phase('pypdf')``...). Los resultados
+salen en la cabecera ``Server-Timing`` (visible en las DevTools del navegador)
+y en una línea de log ``perf clave=valor`` del logger ``pagina_usuario.perf``.
+
+Con ``PERF_INSTRUMENTATION=False`` el middleware se retira de la cadena
+(``MiddlewareNotUsed``) y cada punto de medición es una lectura de
+``ContextVar`` que devuelve None.
+"""
+
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from urllib.parse import quote
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger('pagina_usuario.perf')
+
+# Métricas de la petición en curso (None = no instrumentada)
+_current = ContextVar('request_metrics', default=None)
+
+
+def is_enabled():
+    return getattr(settings, 'PERF_INSTRUMENTATION', False)
+
+
+class RequestMetrics:
+    """Acumula ``{fase: [llamadas, segundos, bytes]}``; los hilos de una misma petición lo comparten."""
+
+    def __init__(self):
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, count=1, nbytes=0):
+        with self._lock:
+            phase = self.phases.setdefault(name, [0, 0.0, 0])
+            phase[0] += count
+            phase[1] += seconds
+            phase[2] += nbytes
+
+    def server_timing(self, total):
+        entries = [f'total;dur={total * 1000:.1f}']
+        for name, (count, seconds, nbytes) in self.phases.items():
+            desc = f'{count}x' + (f' {nbytes / 1024:.0f}KB' if nbytes else '')
+            entries.append(f'{name};dur={seconds * 1000:.1f};desc="{desc}"')
+        return ', '.join(entries)
+
+    def log_fields(self):
+        fields = {}
+        for name, (count, seconds, nbytes) in self.phases.items():
+            fields[f'{name}_n'] = count
+            fields[f'{name}_ms'] = round(seconds * 1000, 1)
+            if nbytes:
+                fields[f'{name}_bytes'] = nbytes
+        return fields
+
+
+def record(name, seconds, count=1, nbytes=0):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.record(name, seconds, count, nbytes)
+
+
+@contextmanager
+def phase(name):
+    """Suma el tiempo del bloque a la fase ``name`` de la petición en curso."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record(name, time.perf_counter() - start)
+
+
+def _azure_request_hook(request):
+    if _current.get() is not None:
+        request.context['perf_start'] = time.perf_counter()
+
+
+def _azure_response_hook(response):
+    if metrics.is_enabled():
+        metrics.record_azure(response.http_request, response.http_response)
+    start = response.context.get('perf_start')
+    if start is None:
+        return
+    nbytes = 0
+    for message in (response.http_request, response.http_response):
+        length = message.headers.get('Content-Length')
+        if length and length.isdigit():
+            nbytes += int(length)
+    record('azure', time.perf_counter() - start, nbytes=nbytes)
+
+
+def azure_hooks():
+    """Opciones de cliente de Azure que cuentan cada llamada (Server-Timing y /metrics)."""
+    if not (is_enabled() or metrics.is_enabled()):
+        return {}
+    return {'raw_request_hook': _azure_request_hook, 'raw_response_hook': _azure_response_hook}
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record('db', time.perf_counter() - start)
+
+
+class PerformanceMiddleware:
+    """Server-Timing y línea de log ``perf`` para una muestra de las peticiones."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PERF_SAMPLE_RATE', 1.0)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_db_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+        # En modo async el ORM corre en otros hilos: aquí no se miden las consultas
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, total):
+        response['Server-Timing'] = metrics.server_timing(total)
+        match = getattr(request, 'resolver_match', None)
+        fields = {
+            'method': request.method,
+            'path': quote(request.path),
+            'view': match.view_name if match else '-',
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            **metrics.log_fields(),
+        }
+        logger.info('perf ' + ' '.join(f'{key}={value}' for key, value in fields.items()))
+        return response
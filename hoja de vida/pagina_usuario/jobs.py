@@ -0,0 +1,166 @@
+"""
+Generación del PDF de la hoja de vida en segundo plano.
+
+La cola vive en la base de datos (modelo ``TrabajoPDF``), así que no hace falta
+un broker externo. Según ``CV_PDF_JOBS_MODE``:
+
+- ``'thread'`` (por defecto): cada worker web procesa los trabajos que encola
+  en un pool de hilos propio (``CV_PDF_JOB_WORKERS`` hilos).
+- ``'db'``: la vista solo inserta la fila y un proceso aparte
+  (``python manage.py process_pdf_jobs``) drena la cola.
+
+La petición web responde de inmediato con la URL de estado; el cliente hace
+polling y descarga el archivo cuando el trabajo termina. Cada encolado revisa
+los trabajos del perfil: los que llevan más de ``CV_PDF_JOB_TIMEOUT`` sin
+avanzar se reencolan (modo 'db') o se dan por perdidos (modo 'thread', donde
+nadie más los tomaría tras reiniciarse el proceso), y los terminados más
+antiguos que ``CV_PDF_JOB_RETENTION`` se borran.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .cv_pdf import build_cv_pdf_file, cv_pdf_path
+from .models import TrabajoPDF
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Pool de hilos del proceso actual (se recrea tras un fork)."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CV_PDF_JOB_WORKERS', 2),
+                thread_name_prefix='cv-pdf',
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def enqueue_cv_pdf(perfil, base_url):
+    """Encola la generación del PDF de ``perfil`` y devuelve el ``TrabajoPDF``.
+
+    Si el PDF actual ya está en caché se devuelve el trabajo completado que lo
+    generó (o uno nuevo, solo la primera vez); si ya hay un trabajo en curso
+    para el perfil se reutiliza.
+    """
+    thread_mode = getattr(settings, 'CV_PDF_JOBS_MODE', 'thread') == 'thread'
+    if thread_mode:
+        expire_stale_jobs(perfil)
+    else:
+        requeue_stale_jobs(perfil)
+    purge_old_jobs(perfil)
+
+    path = cv_pdf_path(perfil)
+    if path.exists():
+        hecho = TrabajoPDF.objects.filter(perfil=perfil, estado='completado', archivo=str(path)).last()
+        if hecho:
+            return hecho
+        return TrabajoPDF.objects.create(perfil=perfil, estado='completado', base_url=base_url, archivo=str(path))
+
+    activo = TrabajoPDF.objects.filter(perfil=perfil, estado__in=['pendiente', 'procesando']).first()
+    if activo:
+        return activo
+
+    trabajo = TrabajoPDF.objects.create(perfil=perfil, base_url=base_url)
+    if thread_mode:
+        run_in_background(run_job, trabajo.pk)
+    return trabajo
+
+
+def run_in_background(func, *args):
+    """Ejecuta ``func(*args)`` en el pool de este proceso cuando confirme la transacción actual."""
+    transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, func, *args))
+
+
+def _run_in_thread(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception(f'Error en tarea en segundo plano {func.__name__}{args}')
+    finally:
+        # Cada hilo abre su propia conexión a la BD
+        connection.close()
+
+
+def run_job(trabajo_id):
+    """Procesa un trabajo pendiente. Devuelve False si otro worker ya lo tomó."""
+    claimed = TrabajoPDF.objects.filter(pk=trabajo_id, estado='pendiente').update(
+        estado='procesando', actualizado=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    trabajo = TrabajoPDF.objects.select_related('perfil__user').get(pk=trabajo_id)
+    try:
+        path = build_cv_pdf_file(trabajo.perfil, trabajo.base_url)
+    except Exception as e:
+        logger.exception(f'Error generando PDF del trabajo {trabajo_id}')
+        trabajo.estado = 'error'
+        trabajo.error = str(e)
+        trabajo.save(update_fields=['estado', 'error', 'actualizado'])
+        return True
+
+    trabajo.estado = 'completado'
+    trabajo.archivo = str(path)
+    trabajo.save(update_fields=['estado', 'archivo', 'actualizado'])
+    logger.info(f'PDF generado para el trabajo {trabajo_id}: {path.name}')
+    return True
+
+
+def _jobs(perfil=None):
+    trabajos = TrabajoPDF.objects.all()
+    return trabajos if perfil is None else trabajos.filter(perfil=perfil)
+
+
+def _stale_limit():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'CV_PDF_JOB_TIMEOUT', 600))
+
+
+def requeue_stale_jobs(perfil=None):
+    """Devuelve a 'pendiente' los trabajos cuyo worker murió a mitad de proceso."""
+    return _jobs(perfil).filter(estado='procesando', actualizado__lt=_stale_limit()).update(estado='pendiente')
+
+
+def expire_stale_jobs(perfil=None):
+    """Marca como error los trabajos pendientes o en proceso que superaron ``CV_PDF_JOB_TIMEOUT``.
+
+    Para el modo 'thread': el pool que los tenía en memoria ya no existe (o
+    lleva demasiado), así que se liberan para que el siguiente encolado cree uno nuevo.
+    """
+    return _jobs(perfil).filter(
+        estado__in=['pendiente', 'procesando'], actualizado__lt=_stale_limit()
+    ).update(estado='error', error='Tiempo de espera agotado', actualizado=timezone.now())
+
+
+def process_pending(limit=None):
+    """Procesa trabajos pendientes en orden de llegada. Devuelve cuántos procesó."""
+    close_old_connections()
+    processed = 0
+    pendientes = TrabajoPDF.objects.filter(estado='pendiente').values_list('pk', flat=True)
+    for trabajo_id in list(pendientes[:limit] if limit else pendientes):
+        if run_job(trabajo_id):
+            processed += 1
+    return processed
+
+
+def purge_old_jobs(perfil=None):
+    """Borra registros de trabajos terminados más antiguos que ``CV_PDF_JOB_RETENTION``."""
+    limite = timezone.now() - timedelta(seconds=getattr(settings, 'CV_PDF_JOB_RETENTION', 86400))
+    deleted, _ = _jobs(perfil).filter(
+        estado__in=['completado', 'error'], actualizado__lt=limite
+    ).delete()
+    return deleted
@@ -0,0 +1,83 @@
+"""
+Management command to benchmark the WeasyPrint render of the CV
+Usage: python manage.py benchmark_cv_pdf --username ana [--runs 10]
+"""
+
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from pagina_usuario.cv_context import cv_queryset
+from pagina_usuario.cv_pdf import memory_report, render_cv_pdf, write_cv_pdf
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de render del PDF del CV con y sin estilos/fuentes precompilados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            help='Usuario cuyo CV se renderiza (por defecto, el perfil con más experiencias)',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=10,
+            help='Renders por modo',
+        )
+        parser.add_argument(
+            '--base-url',
+            default='http://localhost:8000/',
+            help='base_url pasado a WeasyPrint',
+        )
+
+    def handle(self, *args, **options):
+        runs = max(1, options['runs'])
+        perfil = self.get_perfil(options.get('username'))
+        self.stdout.write(f'Perfil: {perfil.user.username} ({runs} renders por modo)')
+
+        resultados = {}
+        for modo, fresh in (('sin precompilar', True), ('precompilado', False)):
+            # Un render de calentamiento: plantilla de Django, imports, caché del hilo
+            render_cv_pdf(perfil, options['base_url'], fresh_resources=fresh)
+            tiempos = []
+            cpu = []
+            for _ in range(runs):
+                start, start_cpu = time.perf_counter(), time.process_time()
+                render_cv_pdf(perfil, options['base_url'], fresh_resources=fresh)
+                tiempos.append(time.perf_counter() - start)
+                cpu.append(time.process_time() - start_cpu)
+            resultados[modo] = statistics.median(tiempos)
+            self.stdout.write(
+                f'  {modo:<16} mediana {statistics.median(tiempos) * 1000:8.1f} ms  '
+                f'min {min(tiempos) * 1000:8.1f} ms  CPU {statistics.median(cpu) * 1000:8.1f} ms'
+            )
+
+        # Armado completo (CV + certificados) con el pico de memoria, para dimensionar workers
+        with tempfile.TemporaryFile() as out, memory_report('benchmark', trace=True) as stats:
+            write_cv_pdf(perfil, options['base_url'], out)
+        self.stdout.write(
+            f'  armado completo  {stats["segundos"] * 1000:8.1f} ms  '
+            f'pico Python {stats.get("pico_python", 0) / 1048576:.1f} MB  '
+            f'RSS máx. {stats.get("rss_max", 0) / 1048576:.1f} MB'
+        )
+
+        antes, despues = resultados['sin precompilar'], resultados['precompilado']
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Mejora: {(1 - despues / antes) * 100:.1f}% ({antes / despues:.2f}x)'
+        ))
+
+    def get_perfil(self, username):
+        queryset = cv_queryset()
+        if username:
+            perfil = queryset.filter(user__username=username).first()
+            if perfil is None:
+                raise CommandError(f'No existe perfil para {username}')
+            return perfil
+        perfil = queryset.annotate(n_experiencias=Count('experiencias')).order_by('-n_experiencias').first()
+        if perfil is None:
+            raise CommandError('No hay perfiles; ejecuta populate_cvs primero')
+        return perfil
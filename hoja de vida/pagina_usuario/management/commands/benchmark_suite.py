@@ -0,0 +1,296 @@
+"""
+Management command to benchmark the CV hot paths against a seeded throwaway database
+Usage: python manage.py benchmark_suite [--perfiles 5] [--items 10] [--iteraciones 20]
+                                        [--referencia benchmarks/cv_baseline.json] [--actualizar] [--azurite]
+"""
+
+import copy
+import json
+import logging
+import platform
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases, setup_test_environment,
+    teardown_databases, teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+from azure.core.exceptions import ResourceExistsError
+from azure.storage.blob import ContentSettings
+
+from pagina_usuario import azure_blob, azure_blob_local, cert_bundle
+from pagina_usuario.benchmark import SCHEMA_VERSION, compare, seed_profiles, summarize
+from pagina_usuario.cv_page_cache import invalidate_cv_page
+from pagina_usuario.cv_pdf import invalidate_cv_pdf, peak_rss
+from pagina_usuario.models import Perfil
+
+BENCH_CONTAINER = 'cv-benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide p50/p95, consultas y RSS máximo de la hoja de vida, el PDF, el proxy de media y el admin '
+        'con perfiles sintéticos en una base de datos de pruebas, y los compara con una referencia JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--perfiles', type=int, default=5, help='Perfiles sintéticos a crear')
+        parser.add_argument('--items', type=int, default=10, help='Elementos por sección de cada perfil')
+        parser.add_argument('--iteraciones', type=int, default=20, help='Peticiones medidas por escenario')
+        parser.add_argument('--calentamiento', type=int, default=1, help='Peticiones sin medir antes de cada escenario')
+        parser.add_argument(
+            '--escenarios',
+            help='Solo los escenarios que empiecen por estos nombres, separados por comas (p. ej. ver_cv,admin)',
+        )
+        parser.add_argument(
+            '--referencia',
+            default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'cv_baseline.json'),
+            help='JSON de referencia: se crea si no existe; si existe, se compara con él',
+        )
+        parser.add_argument('--actualizar', action='store_true', help='Sobrescribe la referencia con esta ejecución')
+        parser.add_argument('--salida', help='Guarda también los resultados de esta ejecución en este JSON')
+        parser.add_argument(
+            '--tolerancia',
+            type=float,
+            default=0.25,
+            help='Subida relativa de p50/p95/RSS que se acepta frente a la referencia',
+        )
+        parser.add_argument(
+            '--azurite',
+            action='store_true',
+            help=f'Usa un emulador Azurite en {azure_blob_local.AZURITE_ENDPOINT} en lugar del doble en memoria',
+        )
+
+    def handle(self, *args, **options):
+        if settings.ASYNC_MEDIA_VIEWS and not options['azurite']:
+            raise CommandError('Con ASYNC_MEDIA_VIEWS el proxy usa el cliente aio: ejecuta con --azurite')
+
+        tmp = Path(tempfile.mkdtemp(prefix='cv-benchmark-'))
+        caches = copy.deepcopy(settings.CACHES)
+        for cache in caches.values():
+            if cache['BACKEND'].endswith('FileBasedCache'):
+                cache['LOCATION'] = str(tmp / 'cache')
+        overrides = override_settings(
+            MEDIA_ROOT=str(tmp / 'media'),
+            BLOB_CACHE_DIR=str(tmp / 'blob_cache'),
+            CV_PDF_CACHE_DIR=str(tmp / 'cv_pdf_cache'),
+            CACHES=caches,
+            AZURE_STORAGE_CONNECTION_STRING=azure_blob_local.AZURITE_CONNECTION_STRING,
+            AZURE_CONTAINER_NAME=BENCH_CONTAINER,
+            # El proxy sirve los bytes: se mide el camino completo, no una redirección
+            MEDIA_SAS_REDIRECT_TYPES=[],
+        )
+
+        setup_test_environment()
+        overrides.enable()
+        azure_blob._reset_clients()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        # Logs de cada petición y del SDK fuera de la medición
+        logging.disable(logging.INFO)
+        try:
+            results, skipped = self.run_suite(options)
+        finally:
+            logging.disable(logging.NOTSET)
+            if options['azurite']:
+                self.delete_container()
+            teardown_databases(old_config, verbosity=0)
+            azure_blob._reset_clients()
+            overrides.disable()
+            teardown_test_environment()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.report(results, skipped, options)
+
+    # --- Preparación ---
+
+    def container_client(self):
+        return azure_blob.get_service_client().get_container_client(BENCH_CONTAINER)
+
+    def delete_container(self):
+        try:
+            self.container_client().delete_container()
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f'No se pudo borrar el contenedor {BENCH_CONTAINER}: {e}'))
+
+    def seed(self, options):
+        if not options['azurite']:
+            azure_blob_local.install(azure_blob_local.LocalBlobAdapter())
+        try:
+            self.container_client().create_container()
+        except ResourceExistsError:
+            pass
+
+        def upload(name, data, content_type):
+            self.container_client().get_blob_client(name).upload_blob(
+                data, overwrite=True, content_settings=ContentSettings(content_type=content_type)
+            )
+
+        start = time.perf_counter()
+        users = seed_profiles(max(1, options['perfiles']), max(1, options['items']), upload)
+        total = azure_blob.rebuild_blob_index()
+        admin_user = User.objects.create_superuser('bench_admin', 'bench_admin@example.com', None)
+        perfil = Perfil.objects.get(user=users[0])
+        if cert_bundle.is_enabled():
+            # El PDF se mide con el anexo de certificados al día, como en producción
+            cert_bundle.rebuild_bundle(perfil.pk)
+        self.stdout.write(
+            f'Sembrados {len(users)} perfiles con {options["items"]} elementos por sección '
+            f'y {total} blobs en {time.perf_counter() - start:.1f} s'
+        )
+        return users[0], perfil, admin_user
+
+    def scenarios(self, owner, perfil, admin_user):
+        """``[(nombre, cliente, url, antes, ajustes)]``; ``antes`` corre fuera de la medición."""
+        anonimo = Client()
+        propietario = Client()
+        propietario.force_login(owner)
+        administrador = Client()
+        administrador.force_login(admin_user)
+
+        cv_url = reverse('ver_cv_usuario', args=[owner.username])
+        pdf_url = reverse('descargar_cv_pdf')
+        certificado = perfil.experiencias.exclude(certificado='').exclude(certificado=None).first().certificado.name
+        escenarios = [
+            ('ver_cv_frio', anonimo, cv_url, lambda: invalidate_cv_page(perfil.pk), {}),
+            ('ver_cv_cache', anonimo, cv_url, None, {}),
+            ('descargar_cv_pdf_frio', propietario, pdf_url, lambda: invalidate_cv_pdf(perfil.pk), {}),
+            ('descargar_cv_pdf_cache', propietario, pdf_url, None, {}),
+            ('media_foto', anonimo, reverse('serve_azure_media', args=[perfil.foto.name]), None, {}),
+            (
+                'media_certificado_sin_cache', anonimo, reverse('serve_azure_media', args=[certificado]), None,
+                {'BLOB_CACHE_ENABLED': False},
+            ),
+        ]
+        for model in admin.site._registry:
+            meta = model._meta
+            if meta.app_label == 'pagina_usuario':
+                url = reverse(f'admin:{meta.app_label}_{meta.model_name}_changelist')
+                escenarios.append((f'admin_{meta.model_name}', administrador, url, None, {}))
+        return escenarios
+
+    # --- Medición ---
+
+    def run_suite(self, options):
+        owner, perfil, admin_user = self.seed(options)
+        filtros = tuple(f.strip() for f in (options['escenarios'] or '').split(',') if f.strip())
+        skipped = {}
+        try:
+            import weasyprint  # noqa: F401
+        except Exception as e:  # OSError si faltan Pango/Cairo
+            skipped['descargar_cv_pdf'] = f'WeasyPrint no disponible: {e}'
+
+        results = {}
+        for nombre, client, url, antes, ajustes in self.scenarios(owner, perfil, admin_user):
+            if filtros and not nombre.startswith(filtros):
+                continue
+            if nombre.startswith('descargar_cv_pdf') and 'descargar_cv_pdf' in skipped:
+                continue
+            with override_settings(**ajustes):
+                results[nombre] = self.measure(nombre, client, url, antes, options)
+            r = results[nombre]
+            self.stdout.write(
+                f'  {nombre:<30} p50 {r["p50_ms"]:9.1f} ms  p95 {r["p95_ms"]:9.1f} ms  '
+                f'{r["consultas"]:3d} consultas  RSS {r["rss_pico_mb"] or 0:7.1f} MB'
+            )
+        return results, skipped
+
+    def measure(self, nombre, client, url, antes, options):
+        tiempos, consultas = [], []
+        calentamiento = max(0, options['calentamiento'])
+        for i in range(calentamiento + max(1, options['iteraciones'])):
+            if antes:
+                antes()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url)
+                # El cuerpo se consume dentro de la medición: los streaming se generan al leerlos
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                else:
+                    response.content
+                elapsed = time.perf_counter() - start
+            response.close()
+            if response.status_code != 200:
+                raise CommandError(f'{nombre}: {url} respondió {response.status_code}')
+            if i >= calentamiento:
+                tiempos.append(elapsed)
+                consultas.append(len(queries))
+        # Máximo del proceso hasta ahora: los escenarios corren siempre en el mismo orden
+        return summarize(tiempos, consultas, peak_rss())
+
+    # --- Informe ---
+
+    def environment(self, options):
+        return {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'plataforma': platform.platform(),
+            'base_de_datos': connection.vendor,
+            'azure': 'azurite' if options['azurite'] else 'local',
+            'perfiles': options['perfiles'],
+            'items': options['items'],
+            'iteraciones': options['iteraciones'],
+        }
+
+    def write_json(self, path, data):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+
+    def report(self, results, skipped, options):
+        for nombre, motivo in skipped.items():
+            self.stdout.write(self.style.WARNING(f'  {nombre} omitido: {motivo}'))
+
+        data = {
+            'version': SCHEMA_VERSION,
+            'fecha': timezone.now().isoformat(),
+            'entorno': self.environment(options),
+            'escenarios': results,
+            'omitidos': skipped,
+        }
+        if options['salida']:
+            self.write_json(options['salida'], data)
+
+        referencia = Path(options['referencia'])
+        if options['actualizar'] or not referencia.exists():
+            self.write_json(referencia, data)
+            self.stdout.write(self.style.SUCCESS(f'Completado. Referencia guardada en {referencia}'))
+            return
+
+        baseline = json.loads(referencia.read_text(encoding='utf-8'))
+        if baseline.get('version') != SCHEMA_VERSION:
+            raise CommandError(f'{referencia} tiene otro formato; regenérala con --actualizar')
+        distintos = [
+            key for key in ('perfiles', 'items', 'base_de_datos', 'azure')
+            if baseline.get('entorno', {}).get(key) != data['entorno'][key]
+        ]
+        if distintos:
+            self.stdout.write(self.style.WARNING(
+                f'La referencia se midió con otros parámetros ({", ".join(distintos)}): las cifras no son comparables'
+            ))
+
+        filas = compare(results, baseline.get('escenarios', {}), options['tolerancia'])
+        regresiones = [fila for fila in filas if fila[4]]
+        for nombre in results:
+            propias = [fila for fila in regresiones if fila[0] == nombre]
+            if nombre not in baseline.get('escenarios', {}):
+                self.stdout.write(self.style.WARNING(f'  {nombre}: sin referencia'))
+            elif not propias:
+                self.stdout.write(self.style.SUCCESS(f'✓ {nombre}'))
+            for _, metrica, antes, ahora, _ in propias:
+                cambio = f' ({(ahora / antes - 1) * 100:+.0f}%)' if antes else ''
+                self.stdout.write(self.style.ERROR(f'✗ {nombre} {metrica}: {antes} → {ahora}{cambio}'))
+        if regresiones:
+            raise CommandError(f'{len(regresiones)} regresiones frente a {referencia}')
+        self.stdout.write(self.style.SUCCESS(f'Completado. Sin regresiones frente a {referencia}'))
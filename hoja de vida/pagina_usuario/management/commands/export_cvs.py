@@ -0,0 +1,216 @@
+"""
+Management command to export the CV PDFs of many profiles at once
+Usage: python manage.py export_cvs --salida exportacion/ [--username ana luis] [--procesos 4]
+       python manage.py export_cvs --salida cvs.zip [--incluir-inactivos] [--force]
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+from pagina_usuario.blob_cache import write_atomic
+from pagina_usuario.cv_context import cv_queryset
+from pagina_usuario.cv_pdf import cv_fingerprint, open_cv_pdf, render_resources
+from pagina_usuario.models import Perfil
+
+MANIFEST = '.export_manifest.json'
+
+
+def pdf_filename(username):
+    return f'Hoja_de_Vida_y_Certificados_{username}.pdf'
+
+
+def _init_worker():
+    try:
+        # Hoja de estilos y fuentes compiladas una vez por proceso
+        render_resources()
+    except Exception:
+        pass  # El error real aparecerá (y se reportará) en el primer render
+
+
+def export_one(perfil_id, destino, base_url, huella_previa=None, use_pool=None):
+    """Exporta el CV de un perfil a ``destino``. Devuelve un dict con el resultado.
+
+    ``use_pool=False`` renderiza en este proceso (los hijos de la exportación
+    ya son workers de render: no se anida ``render_pool``). El anexo de
+    certificados no se encarga: el hilo que lo reconstruye moriría con el
+    proceso y lo dejaría pendiente; lo encarga la próxima descarga web.
+    """
+    close_old_connections()
+    start = time.perf_counter()
+    perfil = cv_queryset().filter(pk=perfil_id).first()
+    if perfil is None:
+        return {'perfil_id': perfil_id, 'estado': 'error', 'error': 'El perfil ya no existe'}
+
+    result = {'perfil_id': perfil_id, 'username': perfil.user.username, 'archivo': pdf_filename(perfil.user.username)}
+    path = Path(destino) / result['archivo']
+    result['huella'] = cv_fingerprint(perfil)
+    if result['huella'] == huella_previa and path.exists():
+        return {**result, 'estado': 'omitido', 'bytes': 0, 'segundos': 0.0}
+
+    fd, tmp = tempfile.mkstemp(dir=destino, prefix='.tmp-')
+    faltan = []
+    try:
+        with os.fdopen(fd, 'wb') as out, open_cv_pdf(perfil, base_url, faltan, use_pool=use_pool, schedule=False) as pdf:
+            shutil.copyfileobj(pdf, out)
+        os.replace(tmp, path)
+    except Exception as e:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        return {**result, 'estado': 'error', 'error': str(e)}
+    if faltan:
+        # Sin huella en el manifiesto: la próxima ejecución lo vuelve a exportar
+        result.update(huella=None, faltan=faltan)
+    return {**result, 'estado': 'exportado', 'bytes': path.stat().st_size, 'segundos': time.perf_counter() - start}
+
+
+class Command(BaseCommand):
+    help = 'Exporta en paralelo los PDF (CV + certificados) de varios perfiles a una carpeta o a un ZIP'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--salida',
+            required=True,
+            help='Carpeta de destino, o archivo .zip',
+        )
+        parser.add_argument(
+            '--username',
+            nargs='+',
+            help='Exportar solo estos usuarios',
+        )
+        parser.add_argument(
+            '--incluir-inactivos',
+            action='store_true',
+            help='Incluir perfiles inactivos y usuarios desactivados',
+        )
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=os.cpu_count() or 2,
+            help='Procesos de exportación en paralelo (1 = en este proceso)',
+        )
+        parser.add_argument(
+            '--base-url',
+            default='http://localhost:8000/',
+            help='base_url pasado a WeasyPrint',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Volver a exportar también los CV que no cambiaron desde la última exportación',
+        )
+
+    def handle(self, *args, **options):
+        salida = Path(options['salida'])
+        es_zip = salida.suffix.lower() == '.zip'
+        # En modo ZIP los PDF se acumulan en una carpeta de trabajo que permite reanudar
+        destino = salida.with_name(salida.name + '.partes') if es_zip else salida
+        destino.mkdir(parents=True, exist_ok=True)
+
+        perfiles = Perfil.objects.order_by('pk')
+        if not options['incluir_inactivos']:
+            perfiles = perfiles.filter(activo=True, user__is_active=True)
+        if options['username']:
+            perfiles = perfiles.filter(user__username__in=options['username'])
+        perfil_ids = list(perfiles.values_list('pk', flat=True))
+        if not perfil_ids:
+            raise CommandError('No hay perfiles que coincidan con los filtros')
+
+        manifest_path = destino / MANIFEST
+        manifest = {} if options['force'] else self.load_manifest(manifest_path)
+        procesos = max(1, options['procesos'])
+        self.stdout.write(f'Exportando {len(perfil_ids)} CV a {salida} con {procesos} procesos...')
+
+        contadores = {'exportado': 0, 'omitido': 0, 'error': 0}
+        total_bytes = 0
+        start = time.perf_counter()
+        for n, result in enumerate(self.run(perfil_ids, destino, options['base_url'], manifest, procesos), 1):
+            contadores[result['estado']] += 1
+            prefijo = f'[{n}/{len(perfil_ids)}] {result.get("username", result["perfil_id"])}'
+            if result['estado'] == 'error':
+                self.stdout.write(self.style.ERROR(f'✗ {prefijo}: {result["error"]}'))
+                continue
+            manifest[str(result['perfil_id'])] = {'archivo': result['archivo'], 'huella': result['huella']}
+            write_atomic(manifest_path, json.dumps(manifest, indent=1).encode('utf-8'))
+            if result['estado'] == 'omitido':
+                self.stdout.write(f'- {prefijo}: sin cambios')
+            else:
+                total_bytes += result['bytes']
+                self.stdout.write(f'✓ {prefijo}: {result["bytes"] / 1024:.0f} KB en {result["segundos"]:.1f} s')
+                if result.get('faltan'):
+                    self.stdout.write(self.style.WARNING(f'  Incompleto, se reintentará (faltan: {", ".join(result["faltan"])})'))
+        elapsed = max(time.perf_counter() - start, 1e-6)
+
+        if es_zip:
+            self.write_zip(salida, destino, [manifest[str(pk)]['archivo'] for pk in perfil_ids if str(pk) in manifest])
+            if not contadores['error']:
+                shutil.rmtree(destino, ignore_errors=True)
+
+        exportados = contadores['exportado']
+        self.stdout.write(
+            f'Tiempo: {elapsed:.1f} s, {exportados / elapsed * 60:.1f} CV/min, '
+            f'{total_bytes / (1024 * 1024) / elapsed:.2f} MB/s ({total_bytes / (1024 * 1024):.1f} MB)'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Completado. Exportados: {exportados}, Sin cambios: {contadores["omitido"]}, Errores: {contadores["error"]}'
+        ))
+        if contadores['error']:
+            self.stdout.write(self.style.WARNING('Vuelve a ejecutar el comando para reintentar solo los que fallaron'))
+
+    def run(self, perfil_ids, destino, base_url, manifest, procesos):
+        def huella(pk):
+            return manifest.get(str(pk), {}).get('huella')
+
+        if procesos == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            for pk in perfil_ids:
+                yield export_one(pk, str(destino), base_url, huella(pk))
+            return
+
+        # Los hijos heredan Django ya configurado; cada uno abre su propia conexión a la BD
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=procesos,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker,
+        ) as executor:
+            futures = {
+                executor.submit(export_one, pk, str(destino), base_url, huella(pk), use_pool=False): pk
+                for pk in perfil_ids
+            }
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield {'perfil_id': futures[future], 'estado': 'error', 'error': str(e)}
+
+    def load_manifest(self, path):
+        try:
+            return json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def write_zip(self, salida, destino, archivos):
+        fd, tmp = tempfile.mkstemp(dir=salida.parent, prefix='.tmp-', suffix='.zip')
+        os.close(fd)
+        try:
+            # Los PDF ya vienen comprimidos: ZIP_STORED evita gastar CPU en recomprimirlos
+            with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for archivo in archivos:
+                    if (destino / archivo).exists():
+                        zf.write(destino / archivo, arcname=archivo)
+            os.replace(tmp, salida)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.stdout.write(f'✓ ZIP escrito: {salida} ({len(archivos)} archivos)')
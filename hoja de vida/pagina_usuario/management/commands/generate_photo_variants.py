@@ -0,0 +1,53 @@
+"""
+Management command to generate the resized variants of existing profile photos
+Usage: python manage.py generate_photo_variants [--force]
+"""
+
+from django.core.management.base import BaseCommand
+
+from pagina_usuario.models import Perfil
+from pagina_usuario.photo_variants import existing_variants, is_photo, store_variants, variant_names
+from pagina_usuario.signals import invalidate_perfil
+
+
+class Command(BaseCommand):
+    help = 'Genera las variantes (avatar, retina, PDF) de las fotos de perfil que aún no las tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerar también las fotos que ya tienen todas sus variantes',
+        )
+
+    def handle(self, *args, **options):
+        force = options.get('force', False)
+        generated = skipped = errors = 0
+
+        perfiles = Perfil.objects.exclude(foto='').exclude(foto=None).select_related('user')
+        for perfil in perfiles:
+            name = perfil.foto.name
+            if not is_photo(name):
+                skipped += 1
+                continue
+            if not force and existing_variants(name) >= set(variant_names(name)):
+                skipped += 1
+                continue
+
+            try:
+                with perfil.foto.storage.open(name, 'rb') as f:
+                    data = f.read()
+                store_variants(perfil.foto.storage, name, data)
+            except Exception as e:
+                errors += 1
+                self.stdout.write(self.style.ERROR(f'✗ {perfil.user.username}: {str(e)}'))
+                continue
+
+            # La página pública y el PDF cacheados apuntan todavía a la original
+            invalidate_perfil(perfil.pk, username=perfil.user.username)
+            generated += 1
+            self.stdout.write(f'✓ {perfil.user.username}: {name}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Completado. Generadas: {generated}, Omitidas: {skipped}, Errores: {errors}'
+        ))
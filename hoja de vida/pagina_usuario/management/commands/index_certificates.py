@@ -0,0 +1,62 @@
+"""
+Management command to backfill the certificate metadata index
+Usage: python manage.py index_certificates [--force]
+"""
+
+from django.core.management.base import BaseCommand
+
+from pagina_usuario.azure_blob import resolve_blob_names
+from pagina_usuario.cert_metadata import record_certificate
+from pagina_usuario.cv_pdf import fetch_certificates
+from pagina_usuario.models import Experiencia, Curso, Recomendacion, IndiceBlob, MetadatoCertificado
+
+
+class Command(BaseCommand):
+    help = 'Analiza los certificados PDF (páginas, versión, validez) que aún no están en el índice'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Volver a analizar también los certificados ya indexados',
+        )
+
+    def handle(self, *args, **options):
+        force = options.get('force', False)
+
+        # Un solo item por archivo aunque varias filas apunten al mismo certificado
+        items = {}
+        for model in (Experiencia, Curso, Recomendacion):
+            for item in model.objects.exclude(certificado='').exclude(certificado=None).only('id', 'certificado'):
+                items.setdefault(item.certificado.name, item)
+        if not force:
+            indexados = set(MetadatoCertificado.objects.filter(nombre__in=list(items)).values_list('nombre', flat=True))
+            items = {nombre: item for nombre, item in items.items() if nombre not in indexados}
+
+        if not items:
+            self.stdout.write(self.style.SUCCESS('✓ Todos los certificados están indexados'))
+            return
+        self.stdout.write(f'Analizando {len(items)} certificados...')
+
+        resolved = resolve_blob_names(list(items))
+        etags = dict(IndiceBlob.objects.filter(nombre_blob__in=list(resolved.values())).values_list('nombre_blob', 'etag'))
+
+        validos = invalidos = faltantes = 0
+        for item, content, error in fetch_certificates(list(items.values())):
+            nombre = item.certificado.name
+            if content is None:
+                faltantes += 1
+                self.stdout.write(self.style.ERROR(f'✗ {nombre}: {error}'))
+                continue
+            nombre_blob = resolved.get(nombre.lstrip('/'), '')
+            metadato = record_certificate(nombre, content, nombre_blob=nombre_blob, etag=etags.get(nombre_blob, ''))
+            if metadato.valido:
+                validos += 1
+                self.stdout.write(f'✓ {nombre}: {metadato.paginas} págs., PDF {metadato.version_pdf or "?"}')
+            else:
+                invalidos += 1
+                self.stdout.write(self.style.WARNING(f'✗ {nombre}: inválido ({metadato.error})'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Completado. Válidos: {validos}, Inválidos: {invalidos}, No encontrados: {faltantes}'
+        ))
@@ -0,0 +1,53 @@
+"""
+Management command to process queued CV PDF jobs
+Usage: python manage.py process_pdf_jobs [--loop] [--interval 2]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from pagina_usuario.cert_bundle import rebuild_pending
+from pagina_usuario.jobs import process_pending, purge_old_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Procesa los trabajos de generación de PDF encolados (CV_PDF_JOBS_MODE=db)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Seguir esperando trabajos nuevos en lugar de terminar al vaciar la cola',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Segundos entre consultas a la cola en modo --loop',
+        )
+
+    def handle(self, *args, **options):
+        loop = options.get('loop', False)
+        interval = options.get('interval', 2.0)
+
+        while True:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                self.stdout.write(self.style.WARNING(f'{requeued} trabajos bloqueados devueltos a la cola'))
+
+            processed = process_pending()
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f'✓ {processed} trabajos procesados'))
+
+            bundles = rebuild_pending()
+            if bundles:
+                self.stdout.write(self.style.SUCCESS(f'✓ {bundles} anexos de certificados actualizados'))
+            processed += bundles
+
+            purge_old_jobs()
+
+            if not loop:
+                break
+            if not processed:
+                time.sleep(interval)
@@ -0,0 +1,28 @@
+"""
+Management command to rebuild the blob name index from Azure
+Usage: python manage.py rebuild_blob_index
+"""
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from azure.core.exceptions import AzureError
+
+from pagina_usuario.azure_blob import rebuild_blob_index
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de nombres de blob (IndiceBlob) con un solo listado del contenedor'
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'AZURE_STORAGE_CONNECTION_STRING', ''):
+            self.stdout.write(self.style.WARNING('Azure no configurado, nada que indexar'))
+            return
+
+        self.stdout.write(f'Listando contenedor {settings.AZURE_CONTAINER_NAME}...')
+        try:
+            total = rebuild_blob_index()
+        except AzureError as e:
+            self.stdout.write(self.style.ERROR(f'✗ Error al listar blobs: {str(e)}'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Índice reconstruido: {total} blobs'))
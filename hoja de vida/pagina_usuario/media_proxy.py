@@ -0,0 +1,367 @@
+"""
+HTTP responses that stream Azure blobs to the client.
+
+Supports single ``Range`` requests (206 Partial Content) so the browser PDF
+viewer can seek, and ``If-None-Match``/``If-Modified-Since`` (304) validated by
+Azure itself against the blob ETag/last_modified. Memory per request is
+bounded by ``AZURE_STREAM_CHUNK_SIZE``. :func:`serve_blob` (and its async
+twin :func:`aserve_blob`, used by the ASGI views) first tries the
+local disk cache (:mod:`pagina_usuario.blob_cache`), or skips the proxy
+entirely with a 302 to a short-lived SAS URL for the content types listed in
+``MEDIA_SAS_REDIRECT_TYPES``.
+"""
+
+import mimetypes
+import os
+import re
+import time
+from fnmatch import fnmatch
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from azure.core.exceptions import HttpResponseError
+
+from . import azure_blob_aio, blob_cache
+from .azure_blob import open_blob_stream, get_blob_properties, get_blob_sas_url, is_not_modified
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range_header(header):
+    """Parse a single-range ``Range`` header.
+
+    Returns ``(start, end)`` where ``start`` is None for suffix ranges
+    (``bytes=-N`` -> ``(None, N)``) and ``end`` is None for open ranges.
+    Returns None when there is no usable range (absent, malformed or
+    multi-range), in which case the whole file is served.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        return None, int(end)
+    if end and int(end) < int(start):
+        return None
+    return int(start), int(end) if end else None
+
+
+def guess_content_type(name):
+    content_type, _ = mimetypes.guess_type(name)
+    return content_type or 'application/octet-stream'
+
+
+def _content_type(stored, filename):
+    if not stored or stored == 'application/octet-stream':
+        return guess_content_type(filename)
+    return stored
+
+
+def _total_size(properties):
+    # content_range: 'bytes 0-99/1234'
+    content_range = getattr(properties, 'content_range', None) or ''
+    total = content_range.rpartition('/')[2]
+    return total if total.isdigit() else '*'
+
+
+def _conditional_headers(request):
+    """Return (etag, if_modified_since) to forward to Azure."""
+    etag = request.headers.get('If-None-Match', '').strip()
+    if etag and ',' not in etag and etag != '*':
+        return etag, None
+    timestamp = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if timestamp is not None:
+        return None, datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+    return None, None
+
+
+def _requested_window(byte_range, size=None):
+    """``(offset, length)`` to download for a parsed ``Range``, or None if it cannot be satisfied.
+
+    ``size`` (the blob size) is only needed for suffix ranges.
+    """
+    if not byte_range:
+        return None, None
+    start, end = byte_range
+    if start is None:
+        # Rango sufijo (últimos N bytes)
+        if end == 0 or size == 0:
+            return None
+        offset = max(size - end, 0)
+        return offset, size - offset
+    return start, end - start + 1 if end is not None else None
+
+
+def _not_modified(etag):
+    response = HttpResponseNotModified()
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+def _downloader_response(downloader, byte_range, offset, filename, disposition):
+    """Streaming response over a sync or aio ``StorageStreamDownloader``."""
+    properties = downloader.properties
+    content_type = None
+    if properties.content_settings:
+        content_type = properties.content_settings.content_type
+
+    response = StreamingHttpResponse(
+        downloader.chunks(),
+        content_type=_content_type(content_type, filename),
+        status=206 if byte_range else 200,
+    )
+    first = offset or 0
+    _set_headers(
+        response, filename, disposition, downloader.size, properties.etag,
+        properties.last_modified.timestamp() if properties.last_modified else None,
+        f'bytes {first}-{first + downloader.size - 1}/{_total_size(properties)}' if byte_range else None,
+    )
+    return response
+
+
+def stream_blob_response(request, blob_path, filename=None, disposition='inline'):
+    """Build a streaming response for ``blob_path``.
+
+    Raises ``ResourceNotFoundError`` if the blob does not exist; the caller
+    decides how to report it.
+    """
+    filename = filename or os.path.basename(blob_path)
+    byte_range = parse_range_header(request.headers.get('Range'))
+    # Un rango sufijo necesita el tamaño total
+    size = get_blob_properties(blob_path).size if byte_range and byte_range[0] is None else None
+    window = _requested_window(byte_range, size)
+    if window is None:
+        return _range_not_satisfiable(size)
+    offset, length = window
+
+    etag, if_modified_since = _conditional_headers(request)
+    try:
+        downloader = open_blob_stream(
+            blob_path, offset=offset, length=length,
+            etag=etag, if_modified_since=if_modified_since,
+        )
+    except HttpResponseError as e:
+        if is_not_modified(e):
+            return _not_modified(etag)
+        if e.status_code == 416:
+            return _range_not_satisfiable(None)
+        raise
+    return _downloader_response(downloader, byte_range, offset, filename, disposition)
+
+
+async def astream_blob_response(request, blob_path, filename=None, disposition='inline'):
+    """Async :func:`stream_blob_response` (aio client; chunks are pulled without blocking a thread)."""
+    filename = filename or os.path.basename(blob_path)
+    byte_range = parse_range_header(request.headers.get('Range'))
+    size = (await azure_blob_aio.get_blob_properties(blob_path)).size if byte_range and byte_range[0] is None else None
+    window = _requested_window(byte_range, size)
+    if window is None:
+        return _range_not_satisfiable(size)
+    offset, length = window
+
+    etag, if_modified_since = _conditional_headers(request)
+    try:
+        downloader = await azure_blob_aio.open_blob_stream(
+            blob_path, offset=offset, length=length,
+            etag=etag, if_modified_since=if_modified_since,
+        )
+    except HttpResponseError as e:
+        if is_not_modified(e):
+            return _not_modified(etag)
+        if e.status_code == 416:
+            return _range_not_satisfiable(None)
+        raise
+    return _downloader_response(downloader, byte_range, offset, filename, disposition)
+
+
+def _set_headers(response, filename, disposition, content_length, etag, last_modified, content_range):
+    response['Content-Length'] = str(content_length)
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    if content_range:
+        response['Content-Range'] = content_range
+    response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+
+
+def _is_not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        candidates = [value.strip() for value in if_none_match.split(',')]
+        return bool(etag) and (etag in candidates or '*' in candidates)
+    timestamp = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return timestamp is not None and last_modified is not None and int(last_modified) <= timestamp
+
+
+def _file_chunks(f, offset, length):
+    chunk_size = getattr(settings, 'AZURE_STREAM_CHUNK_SIZE', 4 * 1024 * 1024)
+    try:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+async def _afile_chunks(f, offset, length):
+    # Las lecturas de disco van a un hilo para no bloquear el event loop
+    read = sync_to_async(f.read, thread_sensitive=False)
+    chunk_size = getattr(settings, 'AZURE_STREAM_CHUNK_SIZE', 4 * 1024 * 1024)
+    try:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            data = await read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def file_response(request, f, meta, filename, disposition='inline', chunks=_file_chunks):
+    """Serve an already opened cached file with the same Range/304 semantics as Azure.
+
+    ``chunks`` is the body generator: ``_afile_chunks`` under ASGI.
+    """
+    etag = meta.get('etag')
+    last_modified = meta.get('last_modified')
+    if _is_not_modified(request, etag, last_modified):
+        f.close()
+        return _not_modified(etag)
+
+    size = meta['size']
+    offset, length = 0, size
+    byte_range = parse_range_header(request.headers.get('Range'))
+    if byte_range:
+        start, end = byte_range
+        if start is None:
+            offset = max(size - end, 0)
+        else:
+            offset = start
+        last = min(end if start is not None and end is not None else size - 1, size - 1)
+        if offset >= size or (start is None and end == 0):
+            f.close()
+            return _range_not_satisfiable(size)
+        length = last - offset + 1
+
+    response = StreamingHttpResponse(
+        chunks(f, offset, length),
+        content_type=_content_type(meta.get('content_type'), filename),
+        status=206 if byte_range else 200,
+    )
+    _set_headers(
+        response, filename, disposition, length, etag, last_modified,
+        f'bytes {offset}-{offset + length - 1}/{size}' if byte_range else None,
+    )
+    return response
+
+
+def _uncached_response(request, downloader, filename, disposition):
+    """Response over the full download the cache opened for a blob too large to keep.
+
+    Returns None for ``Range`` requests: they need their own ranged download.
+    """
+    if parse_range_header(request.headers.get('Range')):
+        return None
+    properties = downloader.properties
+    last_modified = properties.last_modified.timestamp() if properties.last_modified else None
+    if _is_not_modified(request, properties.etag, last_modified):
+        return _not_modified(properties.etag)
+    return _downloader_response(downloader, None, None, filename, disposition)
+
+
+def wants_redirect(content_type):
+    """True if ``content_type`` matches a ``MEDIA_SAS_REDIRECT_TYPES`` pattern (e.g. ``image/*``)."""
+    patterns = getattr(settings, 'MEDIA_SAS_REDIRECT_TYPES', None) or []
+    return any(fnmatch(content_type, pattern.strip()) for pattern in patterns if pattern.strip())
+
+
+def sas_redirect(blob_path, filename, disposition='inline'):
+    """302 to a read-only SAS URL for ``blob_path``, or None if no SAS can be signed."""
+    content_disposition = f'attachment; filename="{filename}"' if disposition == 'attachment' else None
+    entry = get_blob_sas_url(blob_path, content_disposition=content_disposition)
+    if entry is None:
+        return None
+    url, expires_at = entry
+    response = HttpResponseRedirect(url)
+    # El navegador puede reutilizar la redirección mientras el token siga siendo válido
+    margin = getattr(settings, 'MEDIA_SAS_REFRESH_MARGIN', 300)
+    response['Cache-Control'] = f'private, max-age={max(int(expires_at - time.time() - margin), 0)}'
+    return response
+
+
+def serve_blob(request, blob_path, filename=None, disposition='inline'):
+    """Serve ``blob_path``: SAS redirect, local disk cache or streaming from Azure.
+
+    Raises ``ResourceNotFoundError`` if the blob does not exist (not checked
+    for redirects: Azure answers the 404 itself).
+    """
+    filename = filename or os.path.basename(blob_path)
+    if wants_redirect(guess_content_type(blob_path)):
+        response = sas_redirect(blob_path, filename, disposition)
+        if response is not None:
+            return response
+    if blob_cache.is_enabled():
+        try:
+            entry = blob_cache.fetch(blob_path)
+        except blob_cache.BlobTooLarge as e:
+            response = _uncached_response(request, e.downloader, filename, disposition)
+            if response is not None:
+                return response
+        else:
+            data_path, meta = entry
+            try:
+                f = open(data_path, 'rb')
+            except FileNotFoundError:
+                pass  # Desalojado justo ahora: se sirve desde Azure
+            else:
+                return file_response(request, f, meta, filename, disposition)
+    return stream_blob_response(request, blob_path, filename=filename, disposition=disposition)
+
+
+async def aserve_blob(request, blob_path, filename=None, disposition='inline'):
+    """Async :func:`serve_blob` for the ASGI views (same redirect/cache/stream order)."""
+    filename = filename or os.path.basename(blob_path)
+    if wants_redirect(guess_content_type(blob_path)):
+        response = sas_redirect(blob_path, filename, disposition)
+        if response is not None:
+            return response
+    if blob_cache.is_enabled():
+        try:
+            entry = await blob_cache.afetch(blob_path)
+        except blob_cache.BlobTooLarge as e:
+            response = _uncached_response(request, e.downloader, filename, disposition)
+            if response is not None:
+                return response
+        else:
+            data_path, meta = entry
+            try:
+                f = open(data_path, 'rb')
+            except FileNotFoundError:
+                pass  # Desalojado justo ahora: se sirve desde Azure
+            else:
+                return file_response(request, f, meta, filename, disposition, chunks=_afile_chunks)
+    return await astream_blob_response(request, blob_path, filename=filename, disposition=disposition)
+
+
+def _range_not_satisfiable(size):
+    response = HttpResponse(status=416)
+    response['Content-Range'] = f'bytes */{size if size is not None else "*"}'
+    return response
@@ -0,0 +1,150 @@
+"""
+Métricas en formato Prometheus (``/metrics``).
+
+Con ``METRICS_ENABLED`` se cuentan:
+
+- latencia de cada petición por nombre de URL (``MetricsMiddleware``);
+- duración y páginas de cada PDF armado (``cv_pdf.write_cv_pdf``);
+- aciertos/fallos de la caché de blobs (``blob_cache``);
+- llamadas a Azure y errores por operación (hooks de ``instrumentation.azure_hooks``);
+- conexiones nuevas a la BD frente a peticiones (reutilización de ``CONN_MAX_AGE``).
+
+Cada worker de gunicorn es un proceso con sus propios contadores: con
+``PROMETHEUS_MULTIPROC_DIR`` (directorio vacío al arrancar, compartido por los
+workers) ``prometheus_client`` los escribe en archivos mmap y ``/metrics``
+devuelve la suma de todos, sin importar qué worker atienda el scrape.
+"""
+
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess, REGISTRY,
+)
+
+REQUEST_LATENCY = Histogram(
+    'cv_http_request_duration_seconds', 'Duración de las peticiones por nombre de URL',
+    ['view', 'method', 'status'],
+)
+PDF_BUILD_SECONDS = Histogram(
+    'cv_pdf_build_duration_seconds', 'Duración del armado del PDF (CV + certificados)',
+    buckets=(0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+PDF_PAGES = Histogram(
+    'cv_pdf_pages', 'Páginas de cada PDF armado',
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100),
+)
+BLOB_CACHE_LOOKUPS = Counter(
+    'cv_blob_cache_events_total', 'Eventos de la caché de blobs (hits, misses, revalidated, evictions, bypassed)',
+    ['event'],
+)
+AZURE_REQUESTS = Counter(
+    'cv_azure_requests_total', 'Llamadas HTTP a Azure Blob Storage por operación',
+    ['operation'],
+)
+AZURE_ERRORS = Counter(
+    'cv_azure_request_errors_total', 'Respuestas de error de Azure (>= 400 salvo 404) por operación',
+    ['operation', 'status'],
+)
+DB_CONNECTIONS = Counter(
+    'cv_db_connections_opened_total', 'Conexiones nuevas a la base de datos (comparar con las peticiones)',
+    ['alias'],
+)
+
+
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def is_enabled():
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+def azure_operation(request):
+    """Nombre corto de la operación de Azure de una petición HTTP del SDK."""
+    query = request.query or {}
+    comp = query.get('comp')
+    if comp == 'list' or (query.get('restype') == 'container' and request.method == 'GET'):
+        return 'list'
+    if comp in ('block', 'blocklist'):
+        return 'upload'
+    return {'GET': 'download', 'HEAD': 'properties', 'PUT': 'upload', 'DELETE': 'delete'}.get(
+        request.method, request.method.lower()
+    )
+
+
+def record_azure(http_request, http_response):
+    operation = azure_operation(http_request)
+    AZURE_REQUESTS.labels(operation).inc()
+    status = http_response.status_code
+    # 404 y 304 son respuestas esperadas (blob inexistente, caché válida)
+    if status >= 400 and status != 404:
+        AZURE_ERRORS.labels(operation, str(status)).inc()
+
+
+def record_blob_cache(event, amount=1):
+    if is_enabled():
+        BLOB_CACHE_LOOKUPS.labels(event).inc(amount)
+
+
+def record_pdf_build(seconds, pages):
+    if is_enabled():
+        PDF_BUILD_SECONDS.observe(seconds)
+        PDF_PAGES.observe(pages)
+
+
+def _connection_created(sender, connection, **kwargs):
+    if is_enabled():
+        DB_CONNECTIONS.labels(connection.alias).inc()
+
+
+connection_created.connect(_connection_created, dispatch_uid='cv_metrics_connection_created')
+
+
+def render_latest():
+    """``(cuerpo, content_type)`` de la exposición: suma de todos los procesos en modo multiproceso."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """Latencia de cada petición por nombre de URL (``cv_http_request_duration_seconds``)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, seconds):
+        match = getattr(request, 'resolver_match', None)
+        # Sin nombre de URL (404, estáticos) todo va a una sola serie: evita etiquetas sin límite
+        view = match.view_name if match and match.view_name else 'sin_ruta'
+        method = request.method if request.method in HTTP_METHODS else 'OTRO'
+        REQUEST_LATENCY.labels(view, method, f'{response.status_code // 100}xx').observe(seconds)
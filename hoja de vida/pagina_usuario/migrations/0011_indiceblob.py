@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagina_usuario', '0010_azure_media_support'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndiceBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre_blob', models.CharField(max_length=500, unique=True)),
+                ('basename', models.CharField(db_index=True, max_length=255)),
+                ('tamano', models.BigIntegerField(blank=True, null=True)),
+                ('etag', models.CharField(blank=True, default='', max_length=100)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Índice de blob',
+                'verbose_name_plural': 'Índice de blobs',
+            },
+        ),
+    ]
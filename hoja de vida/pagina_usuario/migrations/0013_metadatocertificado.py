@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagina_usuario', '0012_trabajopdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetadatoCertificado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(help_text='Valor del campo certificado', max_length=500, unique=True)),
+                ('nombre_blob', models.CharField(blank=True, default='', max_length=500)),
+                ('tamano', models.BigIntegerField(blank=True, null=True)),
+                ('etag', models.CharField(blank=True, default='', max_length=100)),
+                ('paginas', models.PositiveIntegerField(blank=True, null=True)),
+                ('valido', models.BooleanField(default=False)),
+                ('version_pdf', models.CharField(blank=True, default='', max_length=10)),
+                ('error', models.TextField(blank=True, default='')),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Metadato de certificado',
+                'verbose_name_plural': 'Metadatos de certificados',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagina_usuario', '0013_metadatocertificado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnexoCertificados',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(blank=True, default='', help_text='Huella de los certificados incluidos', max_length=64)),
+                ('archivo', models.CharField(blank=True, default='', max_length=500)),
+                ('paginas', models.PositiveIntegerField(default=0)),
+                ('certificados', models.PositiveIntegerField(default=0)),
+                ('pendiente', models.BooleanField(default=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('perfil', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='anexo_certificados', to='pagina_usuario.perfil')),
+            ],
+            options={
+                'verbose_name': 'Anexo de certificados',
+                'verbose_name_plural': 'Anexos de certificados',
+            },
+        ),
+    ]
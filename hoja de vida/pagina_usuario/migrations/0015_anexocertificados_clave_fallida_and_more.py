@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagina_usuario', '0014_anexocertificados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anexocertificados',
+            name='clave_fallida',
+            field=models.CharField(blank=True, default='', help_text='Huella del último intento incompleto', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='anexocertificados',
+            name='fallido',
+            field=models.DateTimeField(blank=True, help_text='Cuándo falló ese intento', null=True),
+        ),
+    ]
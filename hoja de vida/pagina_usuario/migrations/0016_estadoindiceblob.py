@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagina_usuario', '0015_anexocertificados_clave_fallida_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoIndiceBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reconstruido', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Estado del índice de blobs',
+                'verbose_name_plural': 'Estado del índice de blobs',
+            },
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -181,4 +183,98 @@ class VentaGarage(models.Model):
         verbose_name_plural = 'Ventas Garage'
     
     def __str__(self):
-        return self.nombre_producto
\ No newline at end of file
+        return self.nombre_producto
+
+class IndiceBlob(models.Model):
+    """Mapa nombre de archivo -> ruta real del blob en Azure (ver azure_blob.resolve_blob_name)."""
+    nombre_blob = models.CharField(max_length=500, unique=True)
+    basename = models.CharField(max_length=255, db_index=True)
+    tamano = models.BigIntegerField(null=True, blank=True)
+    etag = models.CharField(max_length=100, blank=True, default='')
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Índice de blob'
+        verbose_name_plural = 'Índice de blobs'
+
+    def __str__(self):
+        return self.nombre_blob
+
+
+class EstadoIndiceBlob(models.Model):
+    """Fila única con la última reconstrucción automática del índice (compartida por todos los procesos)."""
+    reconstruido = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Estado del índice de blobs'
+        verbose_name_plural = 'Estado del índice de blobs'
+
+    def __str__(self):
+        return f'Índice reconstruido {self.reconstruido or "nunca"}'
+
+
+class MetadatoCertificado(models.Model):
+    """Páginas y validez de un certificado PDF, calculadas al subirlo (ver pagina_usuario.cert_metadata)."""
+    nombre = models.CharField(max_length=500, unique=True, help_text='Valor del campo certificado')
+    nombre_blob = models.CharField(max_length=500, blank=True, default='')
+    tamano = models.BigIntegerField(null=True, blank=True)
+    etag = models.CharField(max_length=100, blank=True, default='')
+    paginas = models.PositiveIntegerField(null=True, blank=True)
+    valido = models.BooleanField(default=False)
+    version_pdf = models.CharField(max_length=10, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Metadato de certificado'
+        verbose_name_plural = 'Metadatos de certificados'
+
+    def __str__(self):
+        return f'{self.nombre} ({self.paginas or 0} págs.)'
+
+
+class AnexoCertificados(models.Model):
+    """PDF con todos los certificados de un perfil ya unidos (ver pagina_usuario.cert_bundle)."""
+    perfil = models.OneToOneField(Perfil, on_delete=models.CASCADE, related_name='anexo_certificados')
+    clave = models.CharField(max_length=64, blank=True, default='', help_text='Huella de los certificados incluidos')
+    archivo = models.CharField(max_length=500, blank=True, default='')
+    paginas = models.PositiveIntegerField(default=0)
+    certificados = models.PositiveIntegerField(default=0)
+    pendiente = models.BooleanField(default=True)
+    clave_fallida = models.CharField(max_length=64, blank=True, default='', help_text='Huella del último intento incompleto')
+    fallido = models.DateTimeField(null=True, blank=True, help_text='Cuándo falló ese intento')
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Anexo de certificados'
+        verbose_name_plural = 'Anexos de certificados'
+
+    def __str__(self):
+        return f'Anexo de {self.perfil_id} ({self.certificados} certificados)'
+
+
+class TrabajoPDF(models.Model):
+    """Generación en segundo plano del PDF de la hoja de vida (ver pagina_usuario.jobs)."""
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    perfil = models.ForeignKey(Perfil, on_delete=models.CASCADE, related_name='trabajos_pdf')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', db_index=True)
+    base_url = models.CharField(max_length=200, blank=True, default='')
+    archivo = models.CharField(max_length=500, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Trabajo PDF'
+        verbose_name_plural = 'Trabajos PDF'
+        ordering = ['creado']
+
+    def __str__(self):
+        return f"{self.perfil_id} - {self.estado}"
@@ -0,0 +1,113 @@
+"""
+Imágenes del PDF servidas a WeasyPrint desde el storage de media.
+
+La plantilla del PDF referencia las imágenes por URL (``media:<nombre>`` o
+``/media/<nombre>`` relativo al ``base_url``) en lugar de incrustarlas en
+base64: el HTML queda pequeño y WeasyPrint recibe los bytes por su
+``url_fetcher``, que los lee con ``blob_cache.read_media_bytes`` (Azure vía
+caché local, o disco) y detecta el tipo MIME por el contenido.
+
+Las URL ``media:`` llevan ``?v=<versión>`` (ETag o mtime): la caché de
+imágenes de WeasyPrint, indexada por URL, no sirve una foto ya reemplazada.
+Con ``CV_PDF_RENDER_POOL`` el proceso de render no tiene Django, así que el
+proceso web lee antes las URL ``media:`` del HTML (``collect_media``) y las
+envía junto con él.
+"""
+
+import logging
+import re
+from urllib.parse import quote, unquote, urljoin, urlsplit
+
+from django.conf import settings
+
+from .blob_cache import read_media_bytes
+from .media_proxy import guess_content_type
+
+logger = logging.getLogger(__name__)
+
+MEDIA_SCHEME = 'media'
+
+_MEDIA_URL_RE = re.compile(r'''\bmedia:[^"'\s)<>]+''')
+
+# Firmas de los formatos de imagen que WeasyPrint sabe pintar
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def media_url(name, version=''):
+    """URL ``media:`` de un archivo de media para las plantillas del PDF."""
+    url = f'{MEDIA_SCHEME}:{quote(name.lstrip("/"))}'
+    return f'{url}?v={quote(version, safe="")}' if version else url
+
+
+def media_name(url, base_url=None):
+    """Nombre del archivo de media al que apunta ``url``, o None si no es de media."""
+    parts = urlsplit(url)
+    if parts.scheme == MEDIA_SCHEME:
+        return unquote(parts.path)
+    media_prefix = urlsplit(urljoin(base_url or '', settings.MEDIA_URL))
+    if (parts.scheme, parts.netloc) == (media_prefix.scheme, media_prefix.netloc) \
+            and parts.path.startswith(media_prefix.path):
+        return unquote(parts.path[len(media_prefix.path):])
+    return None
+
+
+def sniff_mime_type(name, data):
+    """Tipo MIME por el contenido (una foto .jpg puede ser un PNG); si no, por la extensión."""
+    for signature, mime_type in _SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if b'<svg' in data[:1024]:
+        return 'image/svg+xml'
+    return guess_content_type(name)
+
+
+def media_resource(url, name):
+    """Respuesta para ``url_fetcher`` con los bytes de ``name``. Lanza ``FileNotFoundError`` si no existe."""
+    data = read_media_bytes(name)
+    return {'string': data, 'mime_type': sniff_mime_type(name, data), 'redirected_url': url}
+
+
+def make_url_fetcher(base_url, missing=None):
+    """``url_fetcher`` de WeasyPrint: media desde el storage, el resto con el fetcher por defecto.
+
+    Los nombres de media que no se pudieron leer se añaden a ``missing`` (si se pasa una lista).
+    """
+    from weasyprint import default_url_fetcher
+
+    def fetch(url, *args, **kwargs):
+        name = media_name(url, base_url)
+        if name is None:
+            return default_url_fetcher(url, *args, **kwargs)
+        try:
+            return media_resource(url, name)
+        except Exception:
+            if missing is not None:
+                missing.append(name)
+            raise
+
+    return fetch
+
+
+def collect_media(html_string, missing=None):
+    """``{url: recurso}`` de las URL ``media:`` de ``html_string`` (para el pool de render).
+
+    Como en :func:`make_url_fetcher`, lo que no se pudo leer se añade a ``missing``.
+    """
+    resources = {}
+    for url in set(_MEDIA_URL_RE.findall(html_string)):
+        url = url.replace('&amp;', '&')
+        try:
+            resources[url] = media_resource(url, media_name(url))
+        except Exception as e:
+            # WeasyPrint registra la imagen que falta y sigue sin ella
+            logger.error(f'No se pudo leer {url} para el PDF: {e}')
+            if missing is not None:
+                missing.append(media_name(url))
+    return resources
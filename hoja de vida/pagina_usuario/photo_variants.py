@@ -0,0 +1,121 @@
+"""
+Variantes redimensionadas de la foto de perfil.
+
+Al subir ``perfil_fotos/<nombre>.<ext>`` se guardan a su lado versiones de
+tamaño fijo (recorte cuadrado centrado):
+
+- ``<nombre>__avatar.webp``   150 px, avatar de la hoja de vida pública
+- ``<nombre>__avatar2x.webp`` 300 px, el mismo avatar para pantallas retina
+- ``<nombre>__pdf.jpg``       400 px, foto incrustada en el PDF (130 px a ~300 dpi)
+
+Las plantillas y el PDF usan la variante si existe y la original si no (fotos
+antiguas o almacenamiento local sin ``generate_photo_variants``).
+"""
+
+import os
+import re
+from io import BytesIO
+
+from django.conf import settings
+
+PHOTO_PREFIX = 'perfil_fotos/'
+
+# variante -> (lado en px, formato de Pillow, extensión, content type)
+VARIANTS = {
+    'avatar': (150, 'WEBP', 'webp', 'image/webp'),
+    'avatar2x': (300, 'WEBP', 'webp', 'image/webp'),
+    'pdf': (400, 'JPEG', 'jpg', 'image/jpeg'),
+}
+
+_VARIANT_RE = re.compile(r'__(%s)\.(webp|jpg)$' % '|'.join(VARIANTS))
+
+
+def is_enabled():
+    return getattr(settings, 'PHOTO_VARIANTS_ENABLED', True)
+
+
+def is_photo(name):
+    """True si ``name`` es una foto de perfil original (no una variante)."""
+    return bool(name) and name.startswith(PHOTO_PREFIX) and not _VARIANT_RE.search(name)
+
+
+def variant_name(name, variant):
+    ext = VARIANTS[variant][2]
+    return f'{os.path.splitext(name)[0]}__{variant}.{ext}'
+
+
+def variant_names(name):
+    return [variant_name(name, variant) for variant in VARIANTS]
+
+
+def render_variants(data):
+    """Genera todas las variantes a partir de los bytes de la foto original.
+
+    Devuelve ``{variante: (bytes, content_type)}``. Lanza la excepción de
+    Pillow si los bytes no son una imagen.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        variants = {}
+        for variant, (side, fmt, ext, content_type) in VARIANTS.items():
+            resized = ImageOps.fit(image, (side, side), Image.LANCZOS)
+            if fmt == 'JPEG' and resized.mode != 'RGB':
+                # JPEG no tiene canal alfa: fondo blanco como en la plantilla
+                background = Image.new('RGB', resized.size, 'white')
+                background.paste(resized, mask=resized.getchannel('A'))
+                resized = background
+            out = BytesIO()
+            if fmt == 'JPEG':
+                resized.save(out, fmt, quality=85, optimize=True, progressive=True)
+            else:
+                resized.save(out, fmt, quality=80, method=4)
+            variants[variant] = (out.getvalue(), content_type)
+    return variants
+
+
+def store_variants(storage, name, data):
+    """Genera y guarda las variantes de ``name`` en ``storage``. Devuelve los nombres guardados."""
+    from .azure_blob import save_media_bytes
+
+    return [
+        save_media_bytes(storage, variant_name(name, variant), content, content_type)
+        for variant, (content, content_type) in render_variants(data).items()
+    ]
+
+
+def existing_variants(name):
+    """Nombres de las variantes de ``name`` que existen (índice de Azure o disco local)."""
+    from .models import IndiceBlob
+
+    names = variant_names(name)
+    existing = set(IndiceBlob.objects.filter(nombre_blob__in=names).values_list('nombre_blob', flat=True))
+    for candidate in names:
+        if candidate not in existing and os.path.exists(os.path.join(settings.MEDIA_ROOT, candidate.replace('/', os.sep))):
+            existing.add(candidate)
+    return existing
+
+
+def best_variant(name, variant, existing=None):
+    """La variante pedida si existe; si no, la foto original."""
+    if not name:
+        return name
+    if existing is None:
+        existing = existing_variants(name)
+    candidate = variant_name(name, variant)
+    return candidate if candidate in existing else name
+
+
+def foto_context(perfil):
+    """Rutas de la foto para las plantillas (una sola consulta al índice)."""
+    if not perfil.foto:
+        return {'foto_avatar': None, 'foto_avatar_2x': None}
+    existing = existing_variants(perfil.foto.name)
+    return {
+        'foto_avatar': best_variant(perfil.foto.name, 'avatar', existing),
+        'foto_avatar_2x': best_variant(perfil.foto.name, 'avatar2x', existing),
+    }
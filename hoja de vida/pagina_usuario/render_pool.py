@@ -0,0 +1,237 @@
+"""
+Pool de procesos dedicado al render de WeasyPrint.
+
+WeasyPrint usa CPU y retiene el GIL: varios renders a la vez en un worker de
+gunicorn bloquean el resto de sus peticiones. Con ``CV_PDF_RENDER_POOL`` el
+HTML (renderizado con las plantillas de Django en el proceso web) se envía a
+un ``ProcessPoolExecutor`` y vuelven los bytes del PDF.
+
+- Cada hijo importa WeasyPrint y compila la hoja de estilos y las fuentes una
+  sola vez, al arrancar.
+- ``CV_PDF_RENDER_WORKERS`` hijos por proceso (web o ``process_pdf_jobs``);
+  cada uno se recicla tras ``CV_PDF_RENDER_MAX_JOBS`` renders para contener el
+  crecimiento de memoria (caché de imágenes, fragmentación de Pango/cairo).
+- ``stats()`` expone la profundidad de la cola (ver ``health_check``).
+
+Este módulo no importa Django a nivel de módulo: los hijos arrancan con
+``spawn`` y solo necesitan WeasyPrint.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+# --- LADO DEL PROCESO HIJO ---
+
+_worker_resources = None
+_worker_images = {}
+
+
+def _init_worker(stylesheet_path, max_images):
+    global _worker_resources
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    stylesheet = CSS(filename=stylesheet_path, font_config=font_config)
+    _worker_resources = (stylesheet, font_config, max_images)
+
+
+def _render_in_worker(html_string, base_url, resources=None):
+    from weasyprint import HTML, default_url_fetcher
+
+    def url_fetcher(url, *args, **kwargs):
+        # Imágenes media: ya leídas por el proceso web (ver pdf_media.collect_media)
+        if resources and url in resources:
+            return resources[url]
+        return default_url_fetcher(url, *args, **kwargs)
+
+    global _worker_images
+    stylesheet, font_config, max_images = _worker_resources
+    # Como cv_pdf._image_cache: nada se desaloja durante un render; si creció
+    # por encima del tope (p. ej. con CV_PDF_RENDER_MAX_JOBS=0) se empieza otra
+    if len(_worker_images) > max_images:
+        _worker_images = {}
+    return HTML(string=html_string, base_url=base_url, url_fetcher=url_fetcher).write_pdf(
+        stylesheets=[stylesheet],
+        font_config=font_config,
+        cache=_worker_images,
+    )
+
+
+# --- LADO DEL PROCESO WEB ---
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+_counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'restarts': 0, 'seconds': 0.0}
+# Futures sin terminar -> pool al que pertenecen (profundidad de la cola)
+_inflight = {}
+# Pools retirados por un timeout: sus hijos se matan cuando acaban los demás renders
+_retiring = set()
+
+
+def _setting(name, default):
+    from django.conf import settings
+
+    return getattr(settings, name, default)
+
+
+def is_enabled():
+    return _setting('CV_PDF_RENDER_POOL', False)
+
+
+def _get_executor():
+    """Pool del proceso actual (se recrea tras un fork o si un hijo murió)."""
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            from .cv_pdf import CV_IMAGE_CACHE_MAX_ENTRIES, CV_STYLESHEET
+
+            max_jobs = _setting('CV_PDF_RENDER_MAX_JOBS', 50)
+            _executor = ProcessPoolExecutor(
+                max_workers=_setting('CV_PDF_RENDER_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(str(CV_STYLESHEET), CV_IMAGE_CACHE_MAX_ENTRIES),
+                max_tasks_per_child=max_jobs or None,
+            )
+            if _executor_pid != os.getpid():
+                # Contadores heredados del padre tras un fork
+                _counters.update(submitted=0, completed=0, failed=0, restarts=0, seconds=0.0)
+                _inflight.clear()
+                _retiring.clear()
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _kill(executor):
+    terminate_workers = getattr(executor, 'terminate_workers', None)
+    if terminate_workers is not None:
+        terminate_workers()  # Python 3.14+
+        return
+    # Antes no hay API pública: se usa la lista interna de hijos, si sigue ahí
+    processes = getattr(executor, '_processes', None)
+    if isinstance(processes, dict):
+        for process in list(processes.values()):
+            if hasattr(process, 'terminate'):
+                process.terminate()
+    else:
+        logger.warning('No se pueden matar los hijos del pool de render: quedan hasta que terminen')
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _discard(executor, hung=None):
+    """Retira ``executor``: las peticiones siguientes van a un pool nuevo.
+
+    Sin ``hung`` (``BrokenProcessPool``) el pool ya no sirve: todo lo que tenía
+    en vuelo cuenta como fallido y cada llamador lo reintenta una vez.
+
+    Con ``hung`` (el future que superó el timeout) solo ese render falla. Los
+    demás renders en vuelo en el pool siguen, cada uno con su propio timeout, y
+    al terminar el último se matan los hijos, incluido el colgado. Si otro de
+    ellos también supera el timeout, el pool se mata en ese momento.
+    """
+    global _executor
+    kill = False
+    with _lock:
+        if _executor is executor:
+            _executor = None
+            _counters['restarts'] += 1
+        if hung is None:
+            abandonados = [future for future, owner in _inflight.items() if owner is executor]
+        else:
+            abandonados = [hung] if hung in _inflight else []
+        for future in abandonados:
+            del _inflight[future]
+        _counters['failed'] += len(abandonados)
+        if hung is not None:
+            kill = not any(owner is executor for owner in _inflight.values())
+            if kill:
+                _retiring.discard(executor)
+            else:
+                _retiring.add(executor)
+    if kill:
+        _kill(executor)
+    elif hung is None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _track(future, executor):
+    start = time.perf_counter()
+    with _lock:
+        _inflight[future] = executor
+        _counters['submitted'] += 1
+
+    def done(f):
+        with _lock:
+            if _inflight.pop(f, None) is None:
+                return  # Ya contado al descartar su pool
+            _counters['seconds'] += time.perf_counter() - start
+            if f.cancelled() or f.exception() is not None:
+                _counters['failed'] += 1
+            else:
+                _counters['completed'] += 1
+            # Último render de un pool retirado: ya se pueden matar sus hijos
+            kill = executor in _retiring and not any(owner is executor for owner in _inflight.values())
+            if kill:
+                _retiring.discard(executor)
+        if kill:
+            _kill(executor)
+
+    future.add_done_callback(done)
+
+
+def render_pdf(html_string, base_url, resources=None):
+    """Renderiza ``html_string`` en el pool y devuelve los bytes del PDF.
+
+    ``resources`` (``{url: respuesta de url_fetcher}``) sirve esas URL sin red.
+
+    Lanza ``TimeoutError`` si tarda más de ``CV_PDF_RENDER_TIMEOUT`` segundos
+    (contando la espera en cola) y la excepción de WeasyPrint si el render falla.
+    Un timeout solo hace fallar este render (ver ``_discard``).
+    """
+    timeout = _setting('CV_PDF_RENDER_TIMEOUT', 120)
+    for intento in (1, 2):
+        executor = _get_executor()
+        try:
+            future = executor.submit(_render_in_worker, html_string, base_url, resources)
+            _track(future, executor)
+            return future.result(timeout=timeout)
+        except BrokenProcessPool:
+            # Un hijo murió (p. ej. sin memoria): pool nuevo y un reintento
+            logger.error(f'Pool de render roto (intento {intento}), se recrea')
+            _discard(executor)
+            if intento == 2:
+                raise
+        except TimeoutError:
+            # Un hijo colgado no debe retener el pool para las siguientes peticiones
+            logger.error(f'Render sin respuesta tras {timeout} s, se recrea el pool')
+            _discard(executor, hung=future)
+            raise
+
+
+def stats():
+    """Profundidad de la cola y contadores del pool de este proceso (cada proceso web tiene el suyo)."""
+    workers = _setting('CV_PDF_RENDER_WORKERS', 2)
+    with _lock:
+        result = dict(_counters)
+        pending = len(_inflight)
+    seconds = result.pop('seconds')
+    finished = result['completed'] + result['failed']
+    result.update(
+        enabled=is_enabled(),
+        workers=workers,
+        max_jobs_per_worker=_setting('CV_PDF_RENDER_MAX_JOBS', 50),
+        running=min(pending, workers),
+        queued=max(0, pending - workers),
+        avg_seconds=round(seconds / finished, 3) if finished else None,
+    )
+    return result
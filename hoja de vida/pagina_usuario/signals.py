@@ -0,0 +1,67 @@
+"""
+Señales que mantienen las cachés del CV coherentes con la base de datos.
+"""
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+
+from .cert_bundle import delete_bundle_file, schedule_bundle
+from .cv_page_cache import invalidate_cv_page
+from .cv_pdf import invalidate_cv_pdf
+from .models import (
+    Perfil, Experiencia, Educacion, Curso, Productos, Recomendacion, Habilidad, VentaGarage, AnexoCertificados,
+)
+
+# Modelos con FK ``perfil`` que aparecen en la hoja de vida
+CV_RELATED_MODELS = (Experiencia, Educacion, Curso, Productos, Recomendacion, Habilidad, VentaGarage)
+# Modelos con campo ``certificado`` que forman el anexo del PDF
+CERT_MODELS = (Experiencia, Curso, Recomendacion)
+
+
+def invalidate_perfil(perfil_id):
+    """Invalida todo lo cacheado para un perfil (PDF y página pública)."""
+    invalidate_cv_pdf(perfil_id)
+    invalidate_cv_page(perfil_id)
+
+
+def _perfil_changed(sender, instance, **kwargs):
+    invalidate_perfil(instance.pk)
+
+
+def _related_changed(sender, instance, **kwargs):
+    invalidate_perfil(instance.perfil_id)
+
+
+def _certificate_saved(sender, instance, **kwargs):
+    # Sin certificado solo hace falta revisar el anexo si el perfil ya tenía uno
+    schedule_bundle(instance.perfil_id, create=bool(instance.certificado))
+
+
+def _certificate_deleted(sender, instance, **kwargs):
+    schedule_bundle(instance.perfil_id, create=False)
+
+
+def _anexo_deleted(sender, instance, **kwargs):
+    if instance.archivo:
+        delete_bundle_file(instance.archivo)
+
+
+def _user_changed(sender, instance, update_fields=None, **kwargs):
+    # El login solo actualiza last_login: no afecta al CV
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    for perfil_id in Perfil.objects.filter(user_id=instance.pk).values_list('pk', flat=True):
+        invalidate_perfil(perfil_id)
+
+
+def connect_signals():
+    post_save.connect(_perfil_changed, sender=Perfil, dispatch_uid='cv_perfil_saved')
+    post_delete.connect(_perfil_changed, sender=Perfil, dispatch_uid='cv_perfil_deleted')
+    post_save.connect(_user_changed, sender=User, dispatch_uid='cv_user_saved')
+    for model in CV_RELATED_MODELS:
+        post_save.connect(_related_changed, sender=model, dispatch_uid=f'cv_{model.__name__}_saved')
+        post_delete.connect(_related_changed, sender=model, dispatch_uid=f'cv_{model.__name__}_deleted')
+    for model in CERT_MODELS:
+        post_save.connect(_certificate_saved, sender=model, dispatch_uid=f'cv_bundle_{model.__name__}_saved')
+        post_delete.connect(_certificate_deleted, sender=model, dispatch_uid=f'cv_bundle_{model.__name__}_deleted')
+    post_delete.connect(_anexo_deleted, sender=AnexoCertificados, dispatch_uid='cv_bundle_anexo_deleted')
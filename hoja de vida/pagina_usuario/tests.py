@@ -1,3 +1,1608 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from azure.core.paging import ItemPaged
+from azure.storage.blob import BlobProperties
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from pypdf import PdfReader
+
+from . import azure_blob, azure_blob_local, blob_cache, health
+from .azure_blob import iter_blobs, list_blobs_page
+from .benchmark import compare, percentile, summarize
+from .blob_cache import read_media_bytes
+from .cert_bundle import load_bundle, rebuild_bundle
+from .cv_context import load_cv_perfil, cv_context
+from .cert_metadata import certificate_plan, inspect_pdf, is_certificate
+from .cv_page_cache import get_cv_page
+from .cv_pdf import build_cv_pdf, build_cv_pdf_file, certificate_items, cv_fingerprint
+from .media_proxy import aserve_blob, serve_blob
+from .pdf_media import collect_media, media_name, media_url, sniff_mime_type
+from .photo_variants import foto_context, is_photo, render_variants, store_variants, variant_name
+from .models import (
+    Perfil, Experiencia, Educacion, Curso, Productos, Recomendacion, Habilidad, VentaGarage,
+    MetadatoCertificado, AnexoCertificados, EstadoIndiceBlob, IndiceBlob, TrabajoPDF,
+)
+
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'cv_pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-cv-pages'},
+}
+
+
+def poblar_perfil(perfil, n):
+    """Crea ``n`` entradas de cada relación del CV."""
+    for i in range(n):
+        Experiencia.objects.create(perfil=perfil, empresa=f'Empresa {i}', cargo='Dev', fecha_inicio=date(2020, 1, i + 1))
+        Educacion.objects.create(perfil=perfil, titulo=f'Título {i}', institucion='UNI')
+        Curso.objects.create(perfil=perfil, nombre=f'Curso {i}', institucion='Academia', descripcion='x' * 500)
+        Productos.objects.create(perfil=perfil, titulo=f'Producto {i}', tipo='Laboral')
+        Recomendacion.objects.create(perfil=perfil, nombre_contacto=f'Contacto {i}', telefono_contacto='099')
+        Habilidad.objects.create(perfil=perfil, nombre=f'Habilidad {i}')
+        VentaGarage.objects.create(perfil=perfil, nombre_producto=f'Silla {i}', estado_producto='Bueno', valor_bien=10)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CV_PAGE_CACHE_ENABLED=False)
+class CVContextQueryCountTests(TestCase):
+    # 1 consulta para Perfil+User y 7 prefetch (una por relación)
+    CV_QUERIES = 8
+
+    def crear_perfil(self, username, n):
+        user = User.objects.create_user(username, password='clave-segura-123')
+        perfil = Perfil.objects.create(user=user)
+        poblar_perfil(perfil, n)
+        return user
+
+    def test_load_cv_perfil_consultas_fijas(self):
+        for username, n in (('uno', 1), ('muchos', 12)):
+            user = self.crear_perfil(username, n)
+            with self.assertNumQueries(self.CV_QUERIES):
+                perfil, created = load_cv_perfil(user=user)
+                context = cv_context(perfil)
+                for key in ('experiencias', 'educaciones', 'habilidades', 'cursos',
+                            'productos', 'recomendaciones', 'ventas_garage'):
+                    self.assertEqual(len(list(context[key])), n)
+            self.assertFalse(created)
+
+    def test_hoja_de_vida_publica_consultas_fijas(self):
+        for username, n in (('uno', 1), ('muchos', 12)):
+            self.crear_perfil(username, n)
+            with self.assertNumQueries(self.CV_QUERIES):
+                response = self.client.get(reverse('ver_cv_usuario', args=[username]))
+            self.assertEqual(response.status_code, 200)
+            self.assertTemplateUsed(response, 'u_hoja_de_vida.html')
+
+    def test_hoja_de_vida_ordena_experiencias_por_fecha(self):
+        self.crear_perfil('uno', 3)
+        response = self.client.get(reverse('ver_cv_usuario', args=['uno']))
+        fechas = [exp.fecha_inicio for exp in response.context['experiencias']]
+        self.assertEqual(fechas, sorted(fechas, reverse=True))
+
+    def test_hoja_de_vida_usuario_inexistente(self):
+        response = self.client.get(reverse('ver_cv_usuario', args=['nadie']))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CV_PAGE_CACHE_ENABLED=True)
+class CVPageCacheTests(TestCase):
+
+    def setUp(self):
+        caches['cv_pages'].clear()
+        self.user = User.objects.create_user('ana', password='clave-segura-123')
+        self.perfil = Perfil.objects.create(user=self.user)
+        poblar_perfil(self.perfil, 2)
+        self.url = reverse('ver_cv_usuario', args=['ana'])
+
+    def test_acierto_sin_consultas(self):
+        primera = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            segunda = self.client.get(self.url)
+        self.assertEqual(primera.content, segunda.content)
+        self.assertContains(segunda, 'Empresa 1')
+
+    def test_varia_por_propietario(self):
+        self.client.get(self.url)
+        self.assertNotContains(self.client.get(self.url), reverse('add_experiencia'))
+
+        self.client.force_login(self.user)
+        propietario = self.client.get(self.url)
+        self.assertContains(propietario, reverse('add_experiencia'))
+        self.assertIsNotNone(get_cv_page('ana', False))
+        self.assertIsNotNone(get_cv_page('ana', True))
+
+    def test_invalidacion_por_relacion(self):
+        self.client.get(self.url)
+        Experiencia.objects.create(perfil=self.perfil, empresa='Nueva SA', cargo='QA', fecha_inicio=date(2024, 5, 1))
+        self.assertIsNone(get_cv_page('ana', False))
+        self.assertContains(self.client.get(self.url), 'Nueva SA')
+
+    def test_invalidacion_por_perfil_y_usuario(self):
+        self.client.get(self.url)
+        self.perfil.descripcion = 'Backend'
+        self.perfil.save()
+        self.assertIsNone(get_cv_page('ana', False))
+
+        self.client.get(self.url)
+        self.user.first_name = 'Anabel'
+        self.user.save()
+        self.assertContains(self.client.get(self.url), 'Anabel')
+
+    def test_login_no_invalida(self):
+        self.client.get(self.url)
+        self.client.login(username='ana', password='clave-segura-123')
+        self.assertIsNotNone(get_cv_page('ana', False))
+
+    def test_cambio_de_nombre_de_usuario(self):
+        self.client.get(self.url)
+        self.user.username = 'anabel'
+        self.user.save()
+        # Otro usuario toma el nombre: no recibe la página cacheada del perfil anterior
+        otra = User.objects.create_user('ana', first_name='Otra', password='clave-segura-123')
+        Perfil.objects.create(user=otra)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Otra')
+        self.assertNotContains(response, 'Empresa 1')
+        self.assertContains(self.client.get(reverse('ver_cv_usuario', args=['anabel'])), 'Empresa 1')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PerformanceMiddlewareTests(TestCase):
+
+    def setUp(self):
+        caches['cv_pages'].clear()
+        Perfil.objects.create(user=User.objects.create_user('ana', password='clave-segura-123'))
+        self.url = reverse('ver_cv_usuario', args=['ana'])
+
+    @override_settings(PERF_INSTRUMENTATION=True)
+    def test_server_timing(self):
+        with self.assertLogs('pagina_usuario.perf', 'INFO') as logs:
+            response = self.client.get(self.url)
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+x"')
+        self.assertIn('view=ver_cv_usuario status=200', logs.output[0])
+
+    def test_desactivado_o_fuera_de_muestra(self):
+        self.assertNotIn('Server-Timing', self.client.get(self.url))
+        with self.settings(PERF_INSTRUMENTATION=True, PERF_SAMPLE_RATE=0.0):
+            self.client = self.client_class()
+            self.assertNotIn('Server-Timing', self.client.get(self.url))
+
+
+class HealthProbeTests(TestCase):
+
+    def setUp(self):
+        health.reset()
+        self.addCleanup(health.reset)
+
+    def test_liveness_sin_consultas(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/health/live/').status_code, 200)
+
+    def test_readiness_memorizada(self):
+        with self.assertNumQueries(1):
+            primera = self.client.get('/health/ready/').json()
+        with self.assertNumQueries(0):
+            self.client.get('/health/ready/')
+            self.client.get('/health/')
+        self.assertTrue(primera['ready'])
+        self.assertIn('ms', primera['checks']['database'])
+
+    @override_settings(HEALTH_CHECK_AZURE=True, AZURE_STORAGE_CONNECTION_STRING='UseDevelopmentStorage=true')
+    def test_azure_caido(self):
+        with mock.patch('pagina_usuario.health._ping_azure', side_effect=RuntimeError('sin red')):
+            response = self.client.get('/health/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['azure']['error'], 'sin red')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, METRICS_ENABLED=True)
+class MetricsEndpointTests(TestCase):
+
+    def test_latencia_por_url(self):
+        caches['cv_pages'].clear()
+        Perfil.objects.create(user=User.objects.create_user('ana', password='clave-segura-123'))
+        self.client.get(reverse('ver_cv_usuario', args=['ana']))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'cv_http_request_duration_seconds_count{method="GET",status="2xx",view="ver_cv_usuario"}')
+        self.assertContains(response, 'cv_pdf_build_duration_seconds_bucket')
+
+    def test_token_y_desactivado(self):
+        with self.settings(METRICS_TOKEN='secreto'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer secreto'}).status_code, 200)
+        with self.settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class PhotoVariantsTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def foto_bytes(self, size=(1200, 800), mode='RGB'):
+        from PIL import Image
+        out = BytesIO()
+        Image.new(mode, size, 'red').save(out, 'PNG')
+        return out.getvalue()
+
+    def test_render_variants_tamanos_y_formatos(self):
+        from PIL import Image
+        variants = render_variants(self.foto_bytes(mode='RGBA'))
+        self.assertEqual(set(variants), {'avatar', 'avatar2x', 'pdf'})
+        for variant, side, fmt in (('avatar', 150, 'WEBP'), ('avatar2x', 300, 'WEBP'), ('pdf', 400, 'JPEG')):
+            with Image.open(BytesIO(variants[variant][0])) as image:
+                self.assertEqual((image.size, image.format), ((side, side), fmt))
+
+    def test_nombres(self):
+        self.assertEqual(variant_name('perfil_fotos/ana.jpeg', 'pdf'), 'perfil_fotos/ana__pdf.jpg')
+        self.assertTrue(is_photo('perfil_fotos/ana.jpeg'))
+        self.assertFalse(is_photo('perfil_fotos/ana__avatar.webp'))
+        self.assertFalse(is_photo('certificados/ana.pdf'))
+
+    def test_plantilla_usa_variante_si_existe(self):
+        from django.core.files.storage import FileSystemStorage
+
+        with self.settings(MEDIA_ROOT=self.media_root):
+            user = User.objects.create_user('ana')
+            perfil = Perfil.objects.create(user=user, foto='perfil_fotos/ana.png')
+            self.assertEqual(foto_context(perfil)['foto_avatar'], 'perfil_fotos/ana.png')
+
+            store_variants(FileSystemStorage(location=self.media_root), 'perfil_fotos/ana.png', self.foto_bytes())
+            context = foto_context(perfil)
+            self.assertEqual(context['foto_avatar'], 'perfil_fotos/ana__avatar.webp')
+            self.assertEqual(context['foto_avatar_2x'], 'perfil_fotos/ana__avatar2x.webp')
+
+
+@override_settings(
+    AZURE_STORAGE_CONNECTION_STRING='DefaultEndpointsProtocol=https;AccountName=cuenta;AccountKey=Y2xhdmU=;EndpointSuffix=core.windows.net',
+    MEDIA_SAS_REDIRECT_TYPES=['image/*'],
+)
+class MediaSasRedirectTests(TestCase):
+
+    def setUp(self):
+        self.request = RequestFactory().get('/media/perfil_fotos/ana.jpg')
+
+    def test_redireccion_memoizada(self):
+        primera = serve_blob(self.request, 'perfil_fotos/ana.jpg')
+        segunda = serve_blob(self.request, 'perfil_fotos/ana.jpg')
+        self.assertEqual(primera.status_code, 302)
+        self.assertTrue(primera['Location'].startswith('https://cuenta.blob.core.windows.net/'))
+        self.assertIn('sp=r', primera['Location'])
+        self.assertEqual(primera['Location'], segunda['Location'])
+        self.assertIn('max-age=', primera['Cache-Control'])
+
+    def test_descarga_como_adjunto(self):
+        response = serve_blob(self.request, 'perfil_fotos/ana.jpg', disposition='attachment')
+        self.assertIn('rscd=attachment', response['Location'])
+
+
+class FakeAioDownloader:
+    """Imita el StorageStreamDownloader de azure.storage.blob.aio sobre unos bytes."""
+
+    def __init__(self, data, offset=None, length=None):
+        offset = offset or 0
+        self.data = data[offset:offset + length if length is not None else None]
+        self.size = len(self.data)
+        self.properties = SimpleNamespace(
+            content_settings=SimpleNamespace(content_type='application/pdf'),
+            etag='"v1"', last_modified=None, size=len(data), content_range=f'bytes {offset}-{offset + self.size - 1}/{len(data)}',
+        )
+
+    async def chunks(self):
+        for i in range(0, self.size, 4):
+            yield self.data[i:i + 4]
+
+
+@override_settings(MEDIA_SAS_REDIRECT_TYPES='', BLOB_CACHE_ENABLED=False)
+class AsyncMediaTests(TestCase):
+    DATA = b'0123456789abcdef'
+
+    def serve(self, **headers):
+        async def open_blob_stream(blob_name, offset=None, length=None, **kwargs):
+            return FakeAioDownloader(self.DATA, offset, length)
+
+        async def get_blob_properties(blob_name):
+            return SimpleNamespace(size=len(self.DATA))
+
+        async def run():
+            response = await aserve_blob(RequestFactory().get('/media/certificados/a.pdf', headers=headers), 'certificados/a.pdf')
+            body = b''.join([chunk async for chunk in response.streaming_content])
+            return response, body
+
+        with mock.patch('pagina_usuario.azure_blob_aio.open_blob_stream', open_blob_stream), \
+                mock.patch('pagina_usuario.azure_blob_aio.get_blob_properties', get_blob_properties):
+            return async_to_sync(run)()
+
+    def test_descarga_completa(self):
+        response, body = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.DATA)
+        self.assertEqual(response['Content-Length'], str(len(self.DATA)))
+
+    def test_rango_sufijo(self):
+        response, body = self.serve(Range='bytes=-6')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b'abcdef')
+        self.assertEqual(response['Content-Range'], 'bytes 10-15/16')
+
+
+class AioClientTests(TestCase):
+
+    def test_un_cliente_por_loop_que_se_cierra_con_el(self):
+        from . import azure_blob_aio
+
+        clients = []
+
+        def build(conn_str):
+            clients.append(mock.Mock(close=mock.AsyncMock()))
+            return clients[-1]
+
+        async def run():
+            first = await azure_blob_aio.get_service_client()
+            self.assertIs(await azure_blob_aio.get_service_client(), first)
+            first.close.assert_not_awaited()
+            return first
+
+        with mock.patch('pagina_usuario.azure_blob_aio._build_service_client', side_effect=build), \
+                mock.patch('pagina_usuario.azure_blob_aio.get_connection_string', return_value='conn'):
+            first, second = async_to_sync(run)(), async_to_sync(run)()
+        self.assertIsNot(first, second)
+        self.assertEqual(len(clients), 2)
+        for client in clients:
+            client.close.assert_awaited_once()
+
+
+class FakeDownloader(FakeAioDownloader):
+    """Versión síncrona de :class:`FakeAioDownloader`."""
+
+    def chunks(self):
+        for i in range(0, self.size, 4):
+            yield self.data[i:i + 4]
+
+    def readall(self):
+        return self.data
+
+    def readinto(self, stream):
+        stream.write(self.data)
+        return self.size
+
+
+def not_modified_error():
+    # Azure responde el 304 con x-ms-error-code ConditionNotMet -> ResourceModifiedError
+    from azure.core.exceptions import ResourceModifiedError
+    response = SimpleNamespace(status_code=304, reason='Not Modified', headers={}, text=lambda *a: '', body=lambda: b'')
+    return ResourceModifiedError(message='The condition specified using HTTP conditional header(s) is not met.', response=response)
+
+
+@override_settings(MEDIA_SAS_REDIRECT_TYPES='', BLOB_CACHE_ENABLED=False)
+class StreamBlobResponseTests(TestCase):
+    DATA = b'0123456789abcdef'
+
+    def serve(self, **headers):
+        request = RequestFactory().get('/media/certificados/a.pdf', headers=headers)
+        return serve_blob(request, 'certificados/a.pdf')
+
+    def test_304_condicional(self):
+        with mock.patch('pagina_usuario.media_proxy.open_blob_stream', side_effect=not_modified_error()) as open_stream:
+            response = self.serve(**{'If-None-Match': '"v1"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"v1"')
+        self.assertEqual(open_stream.call_args.kwargs['etag'], '"v1"')
+
+    def test_rango(self):
+        def open_blob_stream(blob_name, offset=None, length=None, **kwargs):
+            return FakeDownloader(self.DATA, offset, length)
+
+        with mock.patch('pagina_usuario.media_proxy.open_blob_stream', open_blob_stream):
+            response = self.serve(Range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/16')
+        self.assertEqual(response['Content-Length'], '4')
+
+
+@override_settings(MEDIA_SAS_REDIRECT_TYPES='', BLOB_CACHE_MAX_BYTES=40, BLOB_CACHE_REVALIDATE_SECONDS=30)
+class BlobCacheTests(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, True)
+        override = self.settings(BLOB_CACHE_DIR=self.cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.blobs = {}
+        self.requests = []
+        patcher = mock.patch('pagina_usuario.blob_cache.open_blob_stream', self.open_blob_stream)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def open_blob_stream(self, blob_path, etag=None, **kwargs):
+        self.requests.append((blob_path, etag))
+        data = self.blobs[blob_path]
+        if isinstance(data, Exception):
+            raise data
+        return FakeDownloader(data)
+
+    def archivos(self):
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_desaloja_la_menos_usada(self):
+        for i, name in enumerate(('a', 'b', 'c')):
+            self.blobs[name] = bytes([65 + i]) * 16
+            data_path, meta = blob_cache.fetch(name)
+            # mtime escalonado: 'a' es la más antigua
+            os.utime(data_path, (1000 + i, 1000 + i))
+        self.assertIsNone(blob_cache.lookup('a'))
+        self.assertEqual(blob_cache.read_bytes('c'), b'C' * 16)
+        self.assertEqual(len(self.archivos()), 4)
+        with mock.patch('pagina_usuario.blob_cache._entries', side_effect=AssertionError('glob')):
+            self.assertEqual(blob_cache.stats()['bytes'], 32)
+        blob_cache.invalidate('b')
+        self.assertEqual(blob_cache.stats()['bytes'], 16)
+
+    def test_escritura_atomica(self):
+        self.blobs['a'] = b'v1' * 4
+        blob_cache.fetch('a')
+
+        class Cortada(FakeDownloader):
+            def chunks(self):
+                yield self.data[:4]
+                raise OSError('conexión cortada')
+
+        with mock.patch('pagina_usuario.blob_cache.open_blob_stream', return_value=Cortada(b'v2' * 4)), \
+                self.assertRaises(OSError):
+            blob_cache._store('a', blob_cache.open_blob_stream('a'))
+        # Ni temporales ni una entrada a medias: sigue la versión anterior
+        self.assertFalse([name for name in self.archivos() if name.startswith('.tmp-')])
+        self.assertEqual(blob_cache.read_bytes('a'), b'v1' * 4)
+
+    def test_revalidacion(self):
+        self.blobs['a'] = b'v1' * 4
+        blob_cache.fetch('a')
+        antes = blob_cache.stats()['revalidated']
+        self.blobs['a'] = not_modified_error()
+        with mock.patch('pagina_usuario.blob_cache.time.time', return_value=time.time() + 60):
+            data_path, meta = blob_cache.fetch('a')
+        self.assertEqual(self.requests[-1], ('a', '"v1"'))
+        self.assertEqual(blob_cache.stats()['revalidated'], antes + 1)
+        self.assertEqual(blob_cache.read_bytes('a'), b'v1' * 4)
+
+        # Cambió en Azure: la descarga condicional reemplaza la entrada
+        self.blobs['a'] = b'v2' * 4
+        with mock.patch('pagina_usuario.blob_cache.time.time', return_value=time.time() + 120):
+            blob_cache.fetch('a')
+        self.assertEqual(blob_cache.read_bytes('a'), b'v2' * 4)
+
+    def test_version_nueva_en_archivo_nuevo(self):
+        from azure.core.exceptions import HttpResponseError
+
+        self.blobs['a'] = b'v1' * 4
+        viejo, meta_vieja = blob_cache.fetch('a')
+        self.blobs['a'] = b'version 2'
+        with mock.patch('pagina_usuario.blob_cache.time.time', return_value=time.time() + 3601):
+            nuevo, meta = blob_cache.fetch('a')
+        # La meta anterior no acaba apuntando a los bytes nuevos: su archivo ya no está
+        self.assertNotEqual(nuevo, viejo)
+        self.assertFalse(viejo.exists())
+        self.assertEqual((meta['size'], nuevo.read_bytes()), (9, b'version 2'))
+        self.assertEqual(meta_vieja['size'], 8)
+        self.assertEqual(len(self.archivos()), 2)
+        self.assertEqual(blob_cache.stats()['bytes'], 9)
+
+        # Si Azure falla al revalidar se sirve la copia en disco
+        self.blobs['a'] = HttpResponseError('Server Busy')
+        with mock.patch('pagina_usuario.blob_cache.time.time', return_value=time.time() + 7202), \
+                self.assertLogs('pagina_usuario.blob_cache', 'WARNING'):
+            self.assertEqual(blob_cache.fetch('a'), (nuevo, meta))
+        response = serve_blob(RequestFactory().get('/media/a'), 'a')
+        self.assertEqual(b''.join(response.streaming_content), b'version 2')
+
+    def test_entrada_del_formato_anterior_es_un_fallo(self):
+        self.blobs['a'] = b'v1' * 4
+        data_path, meta = blob_cache.fetch('a')
+        del meta['data']
+        blob_cache._write_meta(data_path.with_name(f'{data_path.name.split(".")[0]}.json'), meta)
+        self.assertIsNone(blob_cache.lookup('a'))
+        self.assertEqual(blob_cache.read_bytes('a'), b'v1' * 4)
+
+    def test_archivo_sin_cargar_en_memoria(self):
+        self.blobs['anexos_cv/1.pdf'] = b'x' * 16
+        with blob_cache.open_media_file('anexos_cv/1.pdf', blob_path='anexos_cv/1.pdf') as f:
+            # El propio archivo de la caché
+            self.assertEqual(f.name, str(blob_cache.lookup('anexos_cv/1.pdf')[0]))
+            self.assertEqual(f.read(), b'x' * 16)
+        self.blobs['anexos_cv/2.pdf'] = b'y' * 16
+        with self.settings(BLOB_CACHE_MAX_FILE_BYTES=8), \
+                blob_cache.open_media_file('anexos_cv/2.pdf', blob_path='anexos_cv/2.pdf') as f:
+            f.seek(8)
+            self.assertEqual(f.read(), b'y' * 8)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_afetch_escribe_fuera_del_loop(self):
+        import asyncio
+        from contextlib import contextmanager
+
+        def en_loop():
+            try:
+                return asyncio.get_running_loop() is not None
+            except RuntimeError:
+                return False
+
+        disk_calls = []
+        data_writer = blob_cache._data_writer
+
+        @contextmanager
+        def spy_writer(data_path):
+            with data_writer(data_path) as f:
+                disk_calls.append(en_loop())
+                yield SimpleNamespace(write=lambda chunk: disk_calls.append(en_loop()) or f.write(chunk))
+
+        class Cortada(FakeAioDownloader):
+            async def chunks(self):
+                yield self.data[:4]
+                raise OSError('conexión cortada')
+
+        async def afetch(name, downloader):
+            with mock.patch('pagina_usuario.azure_blob_aio.open_blob_stream', mock.AsyncMock(return_value=downloader)):
+                return await blob_cache.afetch(name)
+
+        with mock.patch('pagina_usuario.blob_cache._data_writer', spy_writer):
+            data_path, meta = async_to_sync(afetch)('a', FakeAioDownloader(b'v1' * 8))
+            with self.assertRaises(OSError):
+                async_to_sync(afetch)('b', Cortada(b'v2' * 8))
+        self.assertEqual(data_path.read_bytes(), b'v1' * 8)
+        self.assertEqual(meta['size'], 16)
+        # Dos aperturas y 4 + 1 escrituras, ninguna en el hilo del loop
+        self.assertEqual(disk_calls, [False] * 7)
+        self.assertFalse([name for name in self.archivos() if name.startswith('.tmp-')])
+        self.assertIsNone(blob_cache.lookup('b'))
+
+    @override_settings(BLOB_CACHE_MAX_FILE_BYTES=8)
+    def test_demasiado_grande_una_sola_descarga(self):
+        self.blobs['certificados/a.pdf'] = b'0123456789abcdef'
+        response = serve_blob(RequestFactory().get('/media/certificados/a.pdf'), 'certificados/a.pdf')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789abcdef')
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.archivos(), [])
+        self.assertEqual(blob_cache.read_bytes('certificados/a.pdf'), b'0123456789abcdef')
+        self.assertEqual(len(self.requests), 2)
+
+
+class FakeContainerClient:
+    """list_blobs paginado con tokens de continuación, como Azure (el token es el índice siguiente)."""
+
+    def __init__(self, names):
+        self.names = sorted(names)
+        self.requests = 0
+
+    def list_blobs(self, name_starts_with=None, results_per_page=None):
+        names = [name for name in self.names if name.startswith(name_starts_with or '')]
+
+        def get_next(token):
+            self.requests += 1
+            return int(token or 0)
+
+        def extract_data(start):
+            end = start + results_per_page
+            return (str(end) if end < len(names) else None), [BlobProperties(name=n) for n in names[start:end]]
+
+        return ItemPaged(get_next, extract_data)
+
+
+class AzureClientRegistryTests(TestCase):
+
+    def setUp(self):
+        azure_blob._reset_clients()
+        self.addCleanup(azure_blob._reset_clients)
+        patcher = mock.patch('pagina_usuario.azure_blob.BlobServiceClient.from_connection_string',
+                             side_effect=lambda conn_str, **kwargs: mock.Mock(conn_str=conn_str, options=kwargs))
+        self.from_connection_string = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(AZURE_STORAGE_CONNECTION_STRING='conn-a', AZURE_READ_TIMEOUT=30, AZURE_STREAM_CHUNK_SIZE=1024)
+    def test_un_cliente_por_cadena_de_conexion(self):
+        client = azure_blob.get_service_client()
+        self.assertIs(azure_blob.get_service_client('conn-a'), client)
+        self.assertIs(azure_blob.get_service_client(), client)
+        otro = azure_blob.get_service_client('conn-b')
+        self.assertIsNot(otro, client)
+        self.assertEqual([call.args[0] for call in self.from_connection_string.call_args_list], ['conn-a', 'conn-b'])
+        self.assertEqual(
+            {key: client.options[key] for key in ('read_timeout', 'max_single_get_size', 'max_chunk_get_size')},
+            {'read_timeout': 30, 'max_single_get_size': 1024, 'max_chunk_get_size': 1024},
+        )
+
+    @override_settings(AZURE_STORAGE_CONNECTION_STRING='conn-a')
+    def test_registro_nuevo_tras_fork(self):
+        client = azure_blob.get_service_client()
+        # El hook registrado con os.register_at_fork
+        azure_blob._reset_clients()
+        nuevo = azure_blob.get_service_client()
+        self.assertIsNot(nuevo, client)
+        # Sin register_at_fork: el cambio de PID también lo detecta
+        with mock.patch('pagina_usuario.azure_blob.os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(azure_blob.get_service_client(), nuevo)
+        self.assertEqual(self.from_connection_string.call_count, 3)
+
+    @skipUnless(hasattr(os, 'fork'), 'Sin os.fork')
+    @override_settings(AZURE_STORAGE_CONNECTION_STRING='conn-a')
+    def test_hijo_de_fork_empieza_sin_clientes(self):
+        azure_blob.get_service_client()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write_fd, b'vacio' if not azure_blob._clients else b'heredado')
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as f:
+            resultado = f.read()
+        os.waitpid(pid, 0)
+        self.assertEqual(resultado, b'vacio')
+        self.assertEqual(len(azure_blob._clients), 1)
+
+
+class BlobListingTests(TestCase):
+
+    def setUp(self):
+        self.container = FakeContainerClient([f'certificados/c{i:02}.pdf' for i in range(25)] + ['perfil_fotos/ana.jpg'])
+        patcher = mock.patch('pagina_usuario.azure_blob._container_client', return_value=self.container)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_paginas_con_cursor(self):
+        primera = list_blobs_page('certificados/', page_size=10)
+        self.assertEqual([b.name for b in primera['blobs']][:2], ['certificados/c00.pdf', 'certificados/c01.pdf'])
+        self.assertEqual(self.container.requests, 1)
+        ultima = list_blobs_page('certificados/', cursor='20', page_size=10)
+        self.assertEqual(len(ultima['blobs']), 5)
+        self.assertIsNone(ultima['next_cursor'])
+
+    def test_iterador(self):
+        self.assertEqual(len(list(iter_blobs('certificados/', page_size=10))), 25)
+        self.assertEqual(self.container.requests, 3)
+
+    @override_settings(AZURE_CONTAINER_NAME='cursos')
+    def test_endpoint_debug(self):
+        data = self.client.get('/debug/blobs/', {'prefix': 'certificados/', 'limit': 10}).json()
+        self.assertEqual(data['count'], 10)
+        siguiente = self.client.get('/debug/blobs/', {'prefix': 'certificados/', 'limit': 10, 'cursor': data['next_cursor']}).json()
+        self.assertEqual(siguiente['blobs'][0], 'certificados/c10.pdf')
+
+
+class BlobIndexTests(TestCase):
+
+    def listar(self, *names, during=None):
+        def iter_blobs():
+            for name in names:
+                if during:
+                    during()
+                yield SimpleNamespace(name=name, size=1, etag='"e"')
+        return mock.patch('pagina_usuario.azure_blob.iter_blobs', iter_blobs)
+
+    def indexados(self):
+        return sorted(IndiceBlob.objects.values_list('nombre_blob', flat=True))
+
+    def test_acierto_una_consulta_sin_listado(self):
+        IndiceBlob.objects.create(nombre_blob='certificados/a.pdf', basename='a.pdf')
+        with mock.patch('pagina_usuario.azure_blob.iter_blobs', side_effect=AssertionError('listado')), \
+                self.assertNumQueries(1):
+            self.assertEqual(azure_blob.resolve_blob_name('/certificados/a.pdf'), 'certificados/a.pdf')
+
+    def test_reconstruccion_sin_vaciar_la_tabla(self):
+        IndiceBlob.objects.create(nombre_blob='certificados/a.pdf', basename='a.pdf')
+        IndiceBlob.objects.create(nombre_blob='borrado.pdf', basename='borrado.pdf')
+
+        def durante_el_listado():
+            # Nunca vacía durante la reconstrucción; una subida concurrente no se pierde
+            self.assertIn('certificados/a.pdf', self.indexados())
+            azure_blob.index_blob('subido/nuevo.pdf', size=3, etag='"n"')
+
+        with self.listar('certificados/a.pdf', 'certificados/b.pdf', during=durante_el_listado):
+            self.assertEqual(azure_blob.rebuild_blob_index(), 2)
+        self.assertEqual(self.indexados(), ['certificados/a.pdf', 'certificados/b.pdf', 'subido/nuevo.pdf'])
+        self.assertEqual(IndiceBlob.objects.get(nombre_blob='certificados/a.pdf').etag, 'e')
+
+    def test_reconstruccion_limitada_para_todos_los_procesos(self):
+        with self.listar('a.pdf'), \
+                mock.patch('pagina_usuario.azure_blob.rebuild_blob_index', wraps=azure_blob.rebuild_blob_index) as rebuild:
+            self.assertEqual(azure_blob.resolve_blob_name('a.pdf'), 'a.pdf')
+            # Otro proceso (sin nada en su caché local) tampoco vuelve a listar
+            caches['default'].clear()
+            self.assertIsNone(azure_blob.resolve_blob_name('y.pdf'))
+            self.assertEqual(rebuild.call_count, 1)
+            estado = EstadoIndiceBlob.objects.get()
+            EstadoIndiceBlob.objects.update(reconstruido=estado.reconstruido - timedelta(seconds=301))
+            self.assertIsNone(azure_blob.resolve_blob_name('y.pdf'))
+            self.assertEqual(rebuild.call_count, 2)
+
+    @override_settings(AZURE_STORAGE_CONNECTION_STRING='AccountName=cuenta;AccountKey=a2V5', BLOB_CACHE_ENABLED=False)
+    def test_subida_y_borrado_actualizan_el_indice(self):
+        from Val.azure_storage import AzureBlobStorage
+
+        service = mock.Mock()
+        service.get_blob_client.return_value.upload_blob.return_value = {'etag': '"v1"'}
+        with mock.patch('Val.azure_storage.get_service_client', return_value=service):
+            storage = AzureBlobStorage()
+            storage._save('documentos/carta.txt', ContentFile(b'hola', name='carta.txt'))
+            fila = IndiceBlob.objects.get(nombre_blob='documentos/carta.txt')
+            self.assertEqual((fila.basename, fila.tamano, fila.etag), ('carta.txt', 4, 'v1'))
+            storage.delete('documentos/carta.txt')
+        self.assertFalse(IndiceBlob.objects.exists())
+
+
+class MediaBytesTests(TestCase):
+
+    def test_url_media_para_el_pdf(self):
+        url = media_url('perfil_fotos/ana maría_pdf.jpg', 'v1')
+        self.assertEqual(url, 'media:perfil_fotos/ana%20mar%C3%ADa_pdf.jpg?v=v1')
+        self.assertEqual(media_name(url), 'perfil_fotos/ana maría_pdf.jpg')
+        self.assertEqual(media_name('http://testserver/media/perfil_fotos/a.jpg', 'http://testserver/'), 'perfil_fotos/a.jpg')
+        self.assertIsNone(media_name('https://otro.com/media/a.jpg', 'http://testserver/'))
+        # Tipo por contenido aunque la extensión diga otra cosa
+        self.assertEqual(sniff_mime_type('a.jpg', b'\x89PNG\r\n\x1a\n...'), 'image/png')
+
+    def test_recursos_del_html(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, True)
+        with open(os.path.join(media_root, 'ana.jpg'), 'wb') as f:
+            f.write(b'\xff\xd8\xff\xe0jpeg')
+        with self.settings(MEDIA_ROOT=media_root), \
+                mock.patch('pagina_usuario.blob_cache.resolve_blob_name', return_value=None):
+            resources = collect_media('<img src="media:ana.jpg?v=1"><img src="media:falta.jpg">')
+        self.assertEqual(list(resources), ['media:ana.jpg?v=1'])
+        self.assertEqual(resources['media:ana.jpg?v=1']['mime_type'], 'image/jpeg')
+
+    def test_lectura_local_sin_http(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, True)
+        os.makedirs(os.path.join(media_root, 'perfil_fotos'))
+        with open(os.path.join(media_root, 'perfil_fotos', 'ana.jpg'), 'wb') as f:
+            f.write(b'jpeg')
+        with self.settings(MEDIA_ROOT=media_root):
+            self.assertEqual(read_media_bytes('perfil_fotos/ana.jpg', blob_path=''), b'jpeg')
+            with self.assertRaises(FileNotFoundError):
+                read_media_bytes('perfil_fotos/luis.jpg', blob_path='')
+
+
+@override_settings(
+    AZURE_STORAGE_CONNECTION_STRING=azure_blob_local.AZURITE_CONNECTION_STRING,
+    AZURE_CONTAINER_NAME='media',
+    AZURE_STREAM_CHUNK_SIZE=1000,
+    MEDIA_SAS_REDIRECT_TYPES='',
+)
+class LocalBlobServiceTests(TestCase):
+    """El SDK real contra el doble en memoria de ``azure_blob_local``."""
+
+    DATA = bytes(range(256)) * 10
+
+    def setUp(self):
+        self.addCleanup(azure_blob._reset_clients)
+        client = azure_blob_local.install(azure_blob_local.LocalBlobAdapter())
+        client.get_container_client('media').create_container()
+        for name in ('certificados/a.pdf', 'certificados/b.pdf', 'perfil_fotos/ana.jpg'):
+            client.get_blob_client('media', name).upload_blob(self.DATA)
+
+    def test_descarga_por_trozos_y_listado(self):
+        self.assertEqual(azure_blob.download_blob_bytes('certificados/a.pdf'), self.DATA)
+        self.assertEqual(azure_blob.open_blob_stream('certificados/a.pdf', offset=10, length=5).readall(), self.DATA[10:15])
+        self.assertEqual(azure_blob.list_directory(''), (['certificados', 'perfil_fotos'], []))
+        pagina = list_blobs_page(page_size=2)
+        self.assertEqual([b.name for b in pagina['blobs']], ['certificados/a.pdf', 'certificados/b.pdf'])
+        self.assertEqual(len(list_blobs_page(cursor=pagina['next_cursor'])['blobs']), 1)
+
+    def test_304_en_proxy_y_cache(self):
+        etag = azure_blob.get_blob_properties('certificados/a.pdf').etag
+        request = RequestFactory().get('/media/certificados/a.pdf', HTTP_IF_NONE_MATCH=etag)
+        with self.settings(BLOB_CACHE_ENABLED=False):
+            self.assertEqual(serve_blob(request, 'certificados/a.pdf').status_code, 304)
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        with self.settings(BLOB_CACHE_DIR=cache_dir, BLOB_CACHE_REVALIDATE_SECONDS=1):
+            blob_cache.fetch('certificados/a.pdf')
+            antes = blob_cache.stats()['revalidated']
+            with mock.patch('pagina_usuario.blob_cache.time.time', return_value=time.time() + 60):
+                data_path, meta = blob_cache.fetch('certificados/a.pdf')
+        self.assertEqual(blob_cache.stats()['revalidated'], antes + 1)
+        self.assertEqual(meta['etag'], etag)
+
+
+class BenchmarkStatsTests(TestCase):
+
+    def test_percentiles_y_resumen(self):
+        self.assertEqual(percentile([5, 1, 4, 2, 3], 50), 3)
+        self.assertEqual(percentile(range(1, 21), 95), 19)
+        resumen = summarize([0.010, 0.020, 0.030], [4, 5, 5], 100 * 1048576)
+        self.assertEqual((resumen['p50_ms'], resumen['consultas'], resumen['rss_pico_mb']), (20.0, 5, 100.0))
+
+    def test_regresiones_frente_a_la_referencia(self):
+        referencia = {'ver_cv': {'p50_ms': 1.0, 'p95_ms': 100.0, 'consultas': 9, 'rss_pico_mb': None}}
+        actual = {
+            'ver_cv': {'p50_ms': 2.5, 'p95_ms': 130.0, 'consultas': 10, 'rss_pico_mb': 120.0},
+            'nuevo': {'p50_ms': 1.0, 'p95_ms': 1.0, 'consultas': 1, 'rss_pico_mb': 1.0},
+        }
+        filas = {(nombre, metrica): regresion for nombre, metrica, _, _, regresion in compare(actual, referencia, 0.25)}
+        # p50 sube 1.5 ms: por debajo del margen absoluto; p95 +30% y una consulta más sí son regresiones
+        self.assertEqual(filas, {('ver_cv', 'p50_ms'): False, ('ver_cv', 'p95_ms'): True, ('ver_cv', 'consultas'): True})
+
+
+@override_settings(
+    AZURE_STORAGE_CONNECTION_STRING='DefaultEndpointsProtocol=https;AccountName=cuenta;AccountKey=Y2xhdmU=;EndpointSuffix=core.windows.net',
+    AZURE_URL_SAS_BUCKET_SECONDS=3600,
+)
+class AzureStorageUrlTests(TestCase):
+
+    def test_url_estable_dentro_de_la_ventana(self):
+        from Val.azure_storage import AzureBlobStorage
+
+        storage = AzureBlobStorage()
+        url = storage.url('perfil_fotos/ana.jpg')
+        self.assertTrue(url.startswith('https://cuenta.blob.core.windows.net/media/perfil_fotos/ana.jpg?'))
+        self.assertIs(storage.url('perfil_fotos/ana.jpg'), url)
+        # Otro worker firma exactamente la misma URL
+        self.assertEqual(AzureBlobStorage().url('perfil_fotos/ana.jpg'), url)
+        self.assertNotEqual(storage.url('perfil_fotos/otra.jpg'), url)
+
+
+def pdf_bytes(paginas):
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for _ in range(paginas):
+        writer.add_blank_page(width=595, height=842)
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+class CertificateMetadataTests(TestCase):
+
+    def test_inspect_pdf(self):
+        info = inspect_pdf(pdf_bytes(3))
+        self.assertTrue(info['valido'])
+        self.assertEqual(info['paginas'], 3)
+        self.assertTrue(info['version_pdf'].startswith('1.'))
+
+        roto = inspect_pdf(b'esto no es un pdf')
+        self.assertFalse(roto['valido'])
+        self.assertIsNone(roto['paginas'])
+        self.assertTrue(roto['error'])
+
+    def test_is_certificate(self):
+        self.assertTrue(is_certificate('certificados_cursos/curso.pdf'))
+        self.assertFalse(is_certificate('perfil_fotos/ana.jpg'))
+
+    def test_plan_omite_invalidos(self):
+        perfil = Perfil.objects.create(user=User.objects.create_user('ana'))
+        for i, nombre in enumerate(('certificados/bueno.pdf', 'certificados/roto.pdf', 'certificados/nuevo.pdf')):
+            Experiencia.objects.create(perfil=perfil, empresa=f'E{i}', cargo='Dev', fecha_inicio=date(2020, 1, 1), certificado=nombre)
+        MetadatoCertificado.objects.create(nombre='certificados/bueno.pdf', paginas=2, tamano=1000, valido=True)
+        MetadatoCertificado.objects.create(nombre='certificados/roto.pdf', valido=False, error='EOF marker not found')
+
+        plan = certificate_plan(list(perfil.experiencias.all()))
+        self.assertEqual((plan['certificados'], plan['paginas'], plan['bytes']), (1, 2, 1000))
+        self.assertEqual(plan['invalidos'], ['certificados/roto.pdf'])
+        self.assertEqual(plan['sin_indice'], ['certificados/nuevo.pdf'])
+
+
+@override_settings(CV_PDF_JOBS_MODE='db')
+class CertificateBundleTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def crear_certificado(self, nombre, paginas):
+        import os
+        ruta = os.path.join(self.media_root, nombre)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, 'wb') as f:
+            f.write(pdf_bytes(paginas))
+
+    def test_anexo_se_reconstruye_al_cambiar_certificados(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            self.crear_certificado('certificados/a.pdf', 2)
+            self.crear_certificado('certificados_cursos/b.pdf', 1)
+            perfil = Perfil.objects.create(user=User.objects.create_user('ana'))
+            Experiencia.objects.create(perfil=perfil, empresa='E', cargo='Dev', fecha_inicio=date(2020, 1, 1), certificado='certificados/a.pdf')
+            Curso.objects.create(perfil=perfil, nombre='C', institucion='I', certificado='certificados_cursos/b.pdf')
+
+            # La señal deja el anexo pendiente; en modo 'db' lo construye el worker
+            self.assertTrue(AnexoCertificados.objects.get(perfil=perfil).pendiente)
+            anexo = rebuild_bundle(perfil.pk)
+            self.assertEqual((anexo.certificados, anexo.paginas, anexo.pendiente), (2, 3, False))
+
+            perfil = Perfil.objects.get(pk=perfil.pk)
+            with load_bundle(perfil, certificate_items(perfil)) as f:
+                self.assertEqual(len(PdfReader(f).pages), 3)
+            # El anexo se lee del archivo mientras pypdf escribe el PDF completo
+            with mock.patch('pagina_usuario.cv_pdf.render_cv_pdf', return_value=pdf_bytes(1)), \
+                    mock.patch('pagina_usuario.cv_pdf.append_certificates') as uno_a_uno:
+                self.assertEqual(len(PdfReader(BytesIO(build_cv_pdf(perfil, 'http://testserver/'))).pages), 4)
+            uno_a_uno.assert_not_called()
+
+            # Otro certificado invalida el anexo hasta reconstruirlo
+            Recomendacion.objects.create(perfil=perfil, nombre_contacto='X', telefono_contacto='1', certificado='certificados/a.pdf')
+            perfil = Perfil.objects.get(pk=perfil.pk)
+            self.assertIsNone(load_bundle(perfil, certificate_items(perfil)))
+            anterior = anexo.archivo
+            anexo = rebuild_bundle(perfil.pk)
+            self.assertEqual(anexo.paginas, 5)
+            self.assertNotEqual(anexo.archivo, anterior)
+            self.assertFalse(default_storage.exists(anterior))
+
+    @override_settings(CV_PDF_SPOOL_MAX_BYTES=64)
+    def test_anexo_se_sube_desde_archivo(self):
+        subidos = {}
+
+        class AzureFalso:
+            def upload_bytes(self, name, data, content_type=None):
+                # Un archivo (ya en disco por encima de CV_PDF_SPOOL_MAX_BYTES), no bytes
+                subidos[name] = (data._rolled, data.read())
+
+        with self.settings(MEDIA_ROOT=self.media_root, CV_PDF_JOBS_MODE='db'):
+            self.crear_certificado('certificados/a.pdf', 3)
+            perfil = Perfil.objects.create(user=User.objects.create_user('ana'))
+            Experiencia.objects.create(perfil=perfil, empresa='E', cargo='Dev', fecha_inicio=date(2020, 1, 1), certificado='certificados/a.pdf')
+            with mock.patch('pagina_usuario.cert_bundle.default_storage', AzureFalso()):
+                anexo = rebuild_bundle(perfil.pk)
+        en_disco, contenido = subidos[anexo.archivo]
+        self.assertTrue(en_disco)
+        self.assertEqual(len(PdfReader(BytesIO(contenido)).pages), 3)
+
+    @override_settings(AZURE_STORAGE_CONNECTION_STRING='AccountName=cuenta;AccountKey=a2V5', BLOB_CACHE_ENABLED=False)
+    def test_upload_bytes_acepta_archivos(self):
+        from Val.azure_storage import AzureBlobStorage
+
+        service = mock.Mock()
+        blob_client = service.get_blob_client.return_value
+        blob_client.upload_blob.return_value = {'etag': '"v1"'}
+        archivo = BytesIO(b'xx%PDF-anexo')
+        archivo.seek(2)
+        with mock.patch('Val.azure_storage.get_service_client', return_value=service):
+            AzureBlobStorage().upload_bytes('anexos_cv/1-a.pdf', archivo, 'application/pdf')
+        self.assertIs(blob_client.upload_blob.call_args.args[0], archivo)
+        self.assertEqual(archivo.tell(), 2)
+        self.assertEqual(IndiceBlob.objects.get(nombre_blob='anexos_cv/1-a.pdf').tamano, 10)
+
+    def test_anexo_incompleto_no_se_reencarga(self):
+        from .cert_bundle import bundle_key, schedule_bundle
+
+        with self.settings(MEDIA_ROOT=self.media_root, CV_PDF_JOBS_MODE='db'):
+            self.crear_certificado('certificados/a.pdf', 1)
+            perfil = Perfil.objects.create(user=User.objects.create_user('ana'))
+            Experiencia.objects.create(perfil=perfil, empresa='E', cargo='Dev', fecha_inicio=date(2020, 1, 1), certificado='certificados/a.pdf')
+            Curso.objects.create(perfil=perfil, nombre='C', institucion='I', certificado='certificados_cursos/falta.pdf')
+
+            anexo = rebuild_bundle(perfil.pk)
+            clave = bundle_key(certificate_items(Perfil.objects.get(pk=perfil.pk)))
+            self.assertEqual((anexo.archivo, anexo.pendiente, anexo.clave_fallida), ('', False, clave))
+
+            # Cada PDF armado con la misma clave no vuelve a encargarlo...
+            schedule_bundle(perfil.pk, clave=clave)
+            self.assertFalse(AnexoCertificados.objects.get(perfil=perfil).pendiente)
+            # ...salvo pasado el plazo de reintento, o si los certificados cambian
+            with self.settings(CV_CERT_BUNDLE_RETRY_SECONDS=0):
+                schedule_bundle(perfil.pk, clave=clave)
+            self.assertTrue(AnexoCertificados.objects.get(perfil=perfil).pendiente)
+            rebuild_bundle(perfil.pk)
+            schedule_bundle(perfil.pk, clave='otra')
+            self.assertTrue(AnexoCertificados.objects.get(perfil=perfil).pendiente)
+
+            self.crear_certificado('certificados_cursos/falta.pdf', 2)
+            anexo = rebuild_bundle(perfil.pk)
+            self.assertEqual((anexo.paginas, anexo.clave_fallida, anexo.fallido), (3, '', None))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CV_PDF_JOBS_MODE='db', CV_PDF_SPOOL_MAX_BYTES=1024)
+class CVPdfStreamingTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('ana', password='x')
+        perfil = Perfil.objects.create(user=self.user)
+        Experiencia.objects.create(perfil=perfil, empresa='E', cargo='Dev', fecha_inicio=date(2020, 1, 1), certificado='certificados/a.pdf')
+        self.client.force_login(self.user)
+
+    def descargar(self):
+        os.makedirs(os.path.join(self.media_root, 'certificados'))
+        with open(os.path.join(self.media_root, 'certificados', 'a.pdf'), 'wb') as f:
+            f.write(pdf_bytes(3))
+        # WeasyPrint no hace falta para probar el ensamblado
+        with mock.patch('pagina_usuario.cv_pdf.render_cv_pdf', return_value=pdf_bytes(2)):
+            response = self.client.get(reverse('descargar_cv_pdf'))
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        contenido = b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(int(response['Content-Length']), len(contenido))
+        self.assertEqual(len(PdfReader(BytesIO(contenido)).pages), 5)
+
+    def test_sin_cache_usa_temporal(self):
+        with self.settings(MEDIA_ROOT=self.media_root, CV_PDF_CACHE_ENABLED=False):
+            self.descargar()
+
+    def test_con_cache_sirve_el_archivo(self):
+        with self.settings(MEDIA_ROOT=self.media_root, CV_PDF_CACHE_DIR=os.path.join(self.media_root, 'cache')):
+            self.descargar()
+
+
+class CVFingerprintTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.perfil = Perfil.objects.create(user=User.objects.create_user('ana'))
+        Experiencia.objects.create(perfil=self.perfil, empresa='E', cargo='Dev', fecha_inicio=date(2020, 1, 1), certificado='certificados/a.pdf')
+        self.escribir('certificados/a.pdf', pdf_bytes(1))
+
+    def escribir(self, name, content):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def huella(self):
+        # Perfil recién cargado: la huella se calcula sobre las filas precargadas
+        return cv_fingerprint(Perfil.objects.get(pk=self.perfil.pk))
+
+    def test_certificado_por_version(self):
+        primera = self.huella()
+        self.assertEqual(self.huella(), primera)
+
+        self.escribir('certificados/a.pdf', pdf_bytes(2))
+        local = self.huella()
+        self.assertNotEqual(local, primera)
+
+        # En Azure cuenta el ETag del índice
+        IndiceBlob.objects.create(nombre_blob='certificados/a.pdf', basename='a.pdf', etag='"1"')
+        azure = self.huella()
+        self.assertNotEqual(azure, local)
+        IndiceBlob.objects.filter(nombre_blob='certificados/a.pdf').update(etag='"2"')
+        self.assertNotEqual(self.huella(), azure)
+
+    def construir(self, **kwargs):
+        faltan = []
+        with self.settings(CV_PDF_CACHE_DIR=os.path.join(self.media_root, 'cache'), CV_PDF_JOBS_MODE='db'), \
+                mock.patch('pagina_usuario.cv_pdf.render_cv_pdf', return_value=pdf_bytes(1)) as render, \
+                mock.patch('pagina_usuario.cv_pdf.read_media_bytes', **kwargs):
+            path = build_cv_pdf_file(Perfil.objects.get(pk=self.perfil.pk), 'http://testserver/', faltan)
+        return path, faltan, render.call_count
+
+    def test_cache_invalidada_por_cambios(self):
+        primera, _, renders = self.construir(return_value=pdf_bytes(1))
+        self.assertEqual(renders, 1)
+        self.assertEqual(self.construir(return_value=pdf_bytes(1))[0::2], (primera, 0))
+
+        Experiencia.objects.filter(perfil=self.perfil).update(cargo='QA')
+        segunda, _, renders = self.construir(return_value=pdf_bytes(1))
+        self.assertNotEqual(segunda, primera)
+        self.assertEqual(renders, 1)
+        self.assertFalse(primera.exists())
+
+    def test_incompleto_no_se_cachea(self):
+        # Azure falla al leer el certificado: el PDF se entrega pero no queda con la huella
+        path, faltan, _ = self.construir(side_effect=OSError('Azure no responde'))
+        self.assertEqual(faltan, ['certificados/a.pdf'])
+        self.assertTrue(path.name.endswith('.incompleto.pdf'))
+        self.assertEqual(len(PdfReader(path).pages), 1)
+
+        completo, faltan, renders = self.construir(return_value=pdf_bytes(2))
+        self.assertEqual((faltan, renders), ([], 1))
+        self.assertEqual(len(PdfReader(completo).pages), 3)
+        self.assertFalse(path.exists())
+
+
+def weasyprint_disponible():
+    try:
+        import weasyprint  # noqa: F401
+    except Exception:  # OSError si faltan Pango/cairo
+        return False
+    return True
+
+
+@override_settings(CV_PDF_RENDER_POOL=False)
+class CVPdfResourcesTests(TestCase):
+
+    def setUp(self):
+        from . import cv_pdf
+        # Cada test empieza sin recursos compilados en este hilo
+        self.addCleanup(vars(cv_pdf._render_local).clear)
+        vars(cv_pdf._render_local).clear()
+
+    def test_recursos_por_hilo(self):
+        import threading
+        from .cv_pdf import render_resources
+
+        with mock.patch('pagina_usuario.cv_pdf._compile_resources', side_effect=lambda: (object(), object())) as compile_resources:
+            primero = render_resources()
+            self.assertIs(render_resources(), primero)
+            otro_hilo = []
+            thread = threading.Thread(target=lambda: otro_hilo.extend([render_resources(), render_resources()]))
+            thread.start()
+            thread.join()
+            self.assertIs(otro_hilo[0], otro_hilo[1])
+            self.assertIsNot(otro_hilo[0], primero)
+            self.assertEqual(compile_resources.call_count, 2)
+            # fresh=True (benchmark) compila siempre y no toca los del hilo
+            self.assertIsNot(render_resources(fresh=True), primero)
+            self.assertIs(render_resources(), primero)
+
+    def test_cache_de_imagenes_sin_desalojo_durante_el_render(self):
+        import sys
+        import threading
+        from . import cv_pdf
+
+        imagenes = cv_pdf.CV_IMAGE_CACHE_MAX_ENTRIES + 10
+        # Los dos renders guardan sus imágenes antes de que ninguno empiece el layout
+        barrier = threading.Barrier(2, timeout=5)
+        caches_usadas = []
+
+        class FakeHTML:
+            # Como LazyImage: guarda al cargar la imagen y vuelve a leer durante el layout
+            def __init__(self, string, base_url, url_fetcher):
+                self.prefix = string
+
+            def write_pdf(self, stylesheets, font_config, cache):
+                caches_usadas.append(cache)
+                keys = [f'{self.prefix}/{i}.png' for i in range(imagenes)]
+                for key in keys:
+                    cache[key] = key
+                barrier.wait()
+                return b''.join(cache[key].encode() for key in keys[-1:])
+
+        results, errors = {}, []
+
+        def render(prefix):
+            try:
+                results[prefix] = cv_pdf.render_cv_pdf(prefix, 'http://testserver/')
+            except Exception as e:
+                errors.append(e)
+
+        weasyprint = SimpleNamespace(HTML=FakeHTML, default_url_fetcher=None)
+        # El "HTML" de cada render es el perfil que recibe
+        with mock.patch.dict(sys.modules, {'weasyprint': weasyprint}), \
+                mock.patch('pagina_usuario.cv_pdf.build_cv_context', side_effect=lambda perfil: perfil), \
+                mock.patch('pagina_usuario.cv_pdf.get_template', return_value=SimpleNamespace(render=lambda context: context)), \
+                mock.patch('pagina_usuario.cv_pdf._compile_resources', side_effect=lambda: (object(), object())):
+            threads = [threading.Thread(target=render, args=(prefix,)) for prefix in ('ana', 'luis')]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(results, {prefix: f'{prefix}/{imagenes - 1}.png'.encode() for prefix in ('ana', 'luis')})
+            self.assertIsNot(caches_usadas[0], caches_usadas[1])
+
+            # En el mismo hilo se reutiliza mientras no pase del tope; si pasó, se empieza otra
+            cache = cv_pdf._image_cache()
+            self.assertIs(cv_pdf._image_cache(), cache)
+            cache.update((str(i), i) for i in range(imagenes))
+            self.assertEqual(cv_pdf._image_cache(), {})
+
+    @skipUnless(weasyprint_disponible(), 'WeasyPrint no disponible')
+    def test_mismo_pdf_que_con_estilos_en_linea(self):
+        from weasyprint import HTML
+        from .cv_pdf import CV_STYLESHEET, CV_TEMPLATE, _compile_resources, build_cv_context, render_cv_pdf
+        from django.template.loader import get_template
+
+        perfil = Perfil.objects.create(user=User.objects.create_user('ana', first_name='Ana'), profesion='Ingeniera')
+        poblar_perfil(perfil, 3)
+        perfil = Perfil.objects.get(pk=perfil.pk)
+
+        with mock.patch('pagina_usuario.cv_pdf._compile_resources', wraps=_compile_resources) as compile_resources:
+            precompilado = render_cv_pdf(perfil, 'http://testserver/')
+            render_cv_pdf(perfil, 'http://testserver/')
+        self.assertEqual(compile_resources.call_count, 1)
+
+        # Como antes: la hoja de estilos dentro de un <style> de la plantilla
+        html = get_template(CV_TEMPLATE).render(build_cv_context(perfil))
+        html = html.replace('</head>', f'<style>{CV_STYLESHEET.read_text(encoding="utf-8")}</style></head>', 1)
+        en_linea = HTML(string=html, base_url='http://testserver/').write_pdf()
+
+        a, b = PdfReader(BytesIO(precompilado)), PdfReader(BytesIO(en_linea))
+        self.assertEqual(len(a.pages), len(b.pages))
+        for page_a, page_b in zip(a.pages, b.pages):
+            self.assertEqual(page_a.mediabox, page_b.mediabox)
+            self.assertEqual(page_a.extract_text(), page_b.extract_text())
+
+
+class FakeExecutor:
+    """``ProcessPoolExecutor`` sin procesos: cada ``submit`` devuelve un future resuelto según ``outcomes``."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.futures = []
+        self.shutdowns = []
+        self._processes = {1: mock.Mock()}
+
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+
+        future = Future()
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            future.set_exception(outcome)
+        elif outcome is not None:  # None: el render no termina
+            future.set_result(outcome)
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shutdowns.append(cancel_futures)
+
+    @property
+    def killed(self):
+        return self._processes[1].terminate.called
+
+
+@override_settings(CV_PDF_RENDER_POOL=True, CV_PDF_RENDER_WORKERS=1, CV_PDF_RENDER_TIMEOUT=0.01)
+class RenderPoolTests(TestCase):
+
+    def setUp(self):
+        from . import render_pool
+
+        def reset():
+            render_pool._executor = render_pool._executor_pid = None
+            render_pool._counters.update(submitted=0, completed=0, failed=0, restarts=0, seconds=0.0)
+            render_pool._inflight.clear()
+            render_pool._retiring.clear()
+
+        reset()
+        self.addCleanup(reset)
+        self.pool = render_pool
+
+    def pools(self, *executors):
+        return mock.patch('pagina_usuario.render_pool.ProcessPoolExecutor', side_effect=executors)
+
+    def test_reintenta_con_pool_nuevo_si_muere_un_hijo(self):
+        from concurrent.futures.process import BrokenProcessPool
+
+        roto, nuevo = FakeExecutor(BrokenProcessPool('sin memoria')), FakeExecutor(b'%PDF')
+        with self.pools(roto, nuevo):
+            self.assertEqual(self.pool.render_pdf('<p>CV</p>', 'http://testserver/'), b'%PDF')
+        self.assertEqual(roto.shutdowns, [True])
+        self.assertFalse(roto.killed)
+        stats = self.pool.stats()
+        self.assertEqual((stats['submitted'], stats['completed'], stats['failed'], stats['restarts']), (2, 1, 1, 1))
+
+        # El segundo pool roto ya no se reintenta
+        with self.pools(FakeExecutor(BrokenProcessPool()), FakeExecutor(BrokenProcessPool())):
+            self.pool._executor = None
+            with self.assertRaises(BrokenProcessPool):
+                self.pool.render_pdf('<p>CV</p>', 'http://testserver/')
+
+    def test_timeout_mata_el_pool_sin_tumbar_los_demas_renders(self):
+        colgado, nuevo = FakeExecutor(None, None), FakeExecutor(b'%PDF')
+        with self.pools(colgado, nuevo):
+            # Otro render en curso en el mismo pool
+            otro = self.pool._get_executor().submit(None)
+            self.pool._track(otro, colgado)
+            with self.assertRaises(TimeoutError):
+                self.pool.render_pdf('<p>CV</p>', 'http://testserver/')
+            # El pool se retira, pero sus hijos siguen vivos hasta que acaba el otro render
+            self.assertFalse(colgado.killed)
+            self.assertEqual(self.pool.render_pdf('<p>CV</p>', 'http://testserver/'), b'%PDF')
+        stats = self.pool.stats()
+        self.assertEqual((stats['failed'], stats['restarts'], stats['running']), (1, 1, 1))
+
+        otro.set_result(b'%PDF otro')
+        self.assertTrue(colgado.killed)
+        self.assertEqual(colgado.shutdowns, [True])
+        stats = self.pool.stats()
+        self.assertEqual((stats['submitted'], stats['completed'], stats['failed'], stats['running']), (3, 2, 1, 0))
+        self.assertFalse(self.pool._retiring)
+
+    def test_timeout_sin_otros_renders_mata_en_el_acto(self):
+        colgado = FakeExecutor(None)
+        with self.pools(colgado):
+            with self.assertRaises(TimeoutError):
+                self.pool.render_pdf('<p>CV</p>', 'http://testserver/')
+        self.assertTrue(colgado.killed)
+        # El hijo muerto resuelve el future después: no se cuenta dos veces
+        colgado.futures[0].set_exception(RuntimeError('terminado'))
+        stats = self.pool.stats()
+        self.assertEqual((stats['submitted'], stats['completed'], stats['failed'], stats['restarts']), (1, 0, 1, 1))
+
+    def test_matar_hijos_sin_depender_de_internos(self):
+        # API pública (Python 3.14+): se usa en lugar de _processes
+        executor = FakeExecutor()
+        executor.terminate_workers = mock.Mock()
+        self.pool._kill(executor)
+        executor.terminate_workers.assert_called_once()
+        self.assertFalse(executor.killed)
+
+        # Sin _processes (cambió el interno): se avisa y el pool se cierra igual
+        executor = FakeExecutor()
+        del executor._processes
+        with self.assertLogs('pagina_usuario.render_pool', 'WARNING'):
+            self.pool._kill(executor)
+        self.assertEqual(executor.shutdowns, [True])
+
+    def test_cache_de_imagenes_del_hijo_acotada_entre_renders(self):
+        import sys
+
+        caches_usadas = []
+
+        class FakeHTML:
+            def __init__(self, string, base_url, url_fetcher):
+                self.imagenes = int(string)
+
+            def write_pdf(self, stylesheets, font_config, cache):
+                caches_usadas.append(cache)
+                for i in range(self.imagenes):
+                    cache[f'{len(caches_usadas)}/{i}.png'] = i
+                # Todo lo guardado en este render sigue ahí al maquetar
+                return sum(cache[f'{len(caches_usadas)}/{i}.png'] for i in range(self.imagenes))
+
+        self.addCleanup(setattr, self.pool, '_worker_images', {})
+        self.pool._worker_images = {}
+        self.pool._worker_resources = (object(), object(), 3)
+        self.addCleanup(setattr, self.pool, '_worker_resources', None)
+        with mock.patch.dict(sys.modules, {'weasyprint': SimpleNamespace(HTML=FakeHTML, default_url_fetcher=None)}):
+            self.assertEqual(self.pool._render_in_worker('5', 'http://testserver/'), 10)
+            self.assertEqual(self.pool._render_in_worker('2', 'http://testserver/'), 1)
+            self.assertEqual(self.pool._render_in_worker('1', 'http://testserver/'), 0)
+        # El primero pasó del tope: el segundo empezó otra caché, que el tercero reutiliza
+        self.assertIsNot(caches_usadas[1], caches_usadas[0])
+        self.assertIs(caches_usadas[2], caches_usadas[1])
+        self.assertEqual(len(caches_usadas[2]), 3)
+
+    def test_stats(self):
+        from concurrent.futures import Future
+
+        executor = FakeExecutor()
+        futures = [Future() for _ in range(3)]
+        for future in futures:
+            self.pool._track(future, executor)
+        with self.settings(CV_PDF_RENDER_WORKERS=2):
+            stats = self.pool.stats()
+        self.assertEqual((stats['running'], stats['queued'], stats['avg_seconds']), (2, 1, None))
+
+        futures[0].set_result(b'%PDF')
+        futures[1].set_exception(RuntimeError('WeasyPrint'))
+        futures[2].cancel()
+        stats = self.pool.stats()
+        self.assertEqual((stats['submitted'], stats['completed'], stats['failed']), (3, 1, 2))
+        self.assertEqual((stats['running'], stats['queued']), (0, 0))
+        self.assertIsInstance(stats['avg_seconds'], float)
+        self.assertTrue(stats['enabled'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CV_PDF_CERT_FETCH_WORKERS=4)
+class CertificateFetchTests(TestCase):
+
+    def test_resolucion_por_lotes(self):
+        from .azure_blob import resolve_blob_names
+
+        caches['default'].clear()
+        EstadoIndiceBlob.objects.create(pk=1)
+        IndiceBlob.objects.create(nombre_blob='certificados/a.pdf', basename='a.pdf')
+        IndiceBlob.objects.create(nombre_blob='antiguo/b.pdf', basename='b.pdf')
+
+        def rebuild():
+            IndiceBlob.objects.create(nombre_blob='certificados/c.pdf', basename='c.pdf')
+
+        names = ['certificados/d.pdf', '/certificados/c.pdf', 'certificados/a.pdf', 'certificados/b.pdf']
+        # 2 consultas, se reserva la reconstrucción (1), el índice se reconstruye una
+        # sola vez (1) y 2 más para los que faltaban
+        with mock.patch('pagina_usuario.azure_blob.rebuild_blob_index', side_effect=rebuild) as rebuild_index, \
+                self.assertNumQueries(6):
+            resolved = resolve_blob_names(names)
+        rebuild_index.assert_called_once()
+        self.assertEqual(list(resolved.items()), [
+            ('certificados/d.pdf', None), ('certificados/c.pdf', 'certificados/c.pdf'),
+            ('certificados/a.pdf', 'certificados/a.pdf'), ('certificados/b.pdf', 'antiguo/b.pdf'),
+        ])
+
+    def test_descarga_paralela_en_orden(self):
+        import threading
+        from .cv_pdf import fetch_certificates
+
+        names = [f'certificados/{i}.pdf' for i in range(4)]
+        items = [SimpleNamespace(certificado=SimpleNamespace(name=name)) for name in names]
+        # Solo pasan la barrera si las cuatro descargas están en curso a la vez
+        barrier = threading.Barrier(len(names), timeout=5)
+
+        def read_media_bytes(name, blob_path=None):
+            barrier.wait()
+            # Los primeros terminan los últimos
+            time.sleep(0.01 * (len(names) - names.index(name)))
+            if name.endswith('2.pdf'):
+                raise OSError('Azure no responde')
+            return name.encode()
+
+        with mock.patch('pagina_usuario.cv_pdf.resolve_blob_names', return_value={}), \
+                mock.patch('pagina_usuario.cv_pdf.read_media_bytes', read_media_bytes):
+            results = fetch_certificates(items)
+        self.assertEqual([item for item, _, _ in results], items)
+        self.assertEqual([content for _, content, _ in results], [b'certificados/0.pdf', b'certificados/1.pdf', None, b'certificados/3.pdf'])
+        self.assertIn('Azure no responde', results[2][2])
+
+
+@override_settings(CV_PDF_JOBS_MODE='db')
+class CVPdfJobTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media_root, CV_PDF_CACHE_DIR=os.path.join(self.media_root, 'cache'))
+        override.enable()
+        self.addCleanup(override.disable)
+        patcher = mock.patch('pagina_usuario.cv_pdf.render_cv_pdf', return_value=pdf_bytes(2))
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('ana')
+        self.perfil = Perfil.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def encolar(self):
+        response = self.client.post(reverse('encolar_cv_pdf'))
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_encolar_estado_y_descarga(self):
+        from .jobs import process_pending
+
+        job = self.encolar()
+        self.assertEqual(job['estado'], 'pendiente')
+        self.assertEqual(self.client.get(job['status_url']).json()['estado'], 'pendiente')
+        descarga = reverse('descargar_trabajo_cv_pdf', args=[job['id']])
+        self.assertEqual(self.client.get(descarga).status_code, 409)
+
+        self.assertEqual(process_pending(), 1)
+        estado = self.client.get(job['status_url']).json()
+        self.assertEqual(estado['estado'], 'completado')
+        response = self.client.get(estado['download_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(PdfReader(BytesIO(b''.join(response.streaming_content))).pages), 2)
+        response.close()
+
+        # Otro usuario no ve el trabajo
+        self.client.force_login(User.objects.create_user('luis'))
+        self.assertEqual(self.client.get(job['status_url']).status_code, 404)
+
+    def test_reutiliza_trabajos(self):
+        from .jobs import process_pending
+
+        primero = self.encolar()
+        self.assertEqual(self.encolar()['id'], primero['id'])
+        process_pending()
+        # PDF ya en caché: se devuelve el mismo trabajo completado, sin filas nuevas
+        for _ in range(3):
+            self.assertEqual(self.encolar()['id'], primero['id'])
+        self.assertEqual(TrabajoPDF.objects.count(), 1)
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_trabajos_bloqueados(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        viejo = timezone.now() - timedelta(hours=1)
+        procesando = TrabajoPDF.objects.create(perfil=self.perfil, estado='procesando')
+        TrabajoPDF.objects.filter(pk=procesando.pk).update(actualizado=viejo)
+        # Modo 'db': el worker lo vuelve a tomar
+        self.assertEqual(self.encolar()['id'], str(procesando.pk))
+        self.assertEqual(TrabajoPDF.objects.get(pk=procesando.pk).estado, 'pendiente')
+
+        # Modo 'thread': el proceso que lo tenía ya no está, se crea uno nuevo
+        TrabajoPDF.objects.filter(pk=procesando.pk).update(actualizado=viejo)
+        with self.settings(CV_PDF_JOBS_MODE='thread'), mock.patch('pagina_usuario.jobs.run_in_background') as background:
+            nuevo = self.encolar()
+        self.assertNotEqual(nuevo['id'], str(procesando.pk))
+        self.assertEqual(TrabajoPDF.objects.get(pk=procesando.pk).estado, 'error')
+        background.assert_called_once()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CV_PDF_JOBS_MODE='db')
+class ExportCVsCommandTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        for username in ('ana', 'luis'):
+            Perfil.objects.create(user=User.objects.create_user(username))
+        Perfil.objects.create(user=User.objects.create_user('baja'), activo=False)
+
+    def exportar(self, salida, *args):
+        from django.core.management import call_command
+
+        out = StringIO()
+        with self.settings(MEDIA_ROOT=self.tmp, CV_PDF_CACHE_DIR=os.path.join(self.tmp, 'cache')), \
+                mock.patch('pagina_usuario.cv_pdf.render_cv_pdf', return_value=pdf_bytes(1)) as render:
+            call_command('export_cvs', '--salida', salida, '--procesos', '1', *args, stdout=out)
+        return out.getvalue(), render.call_count
+
+    def test_exporta_carpeta_y_reanuda(self):
+        salida = os.path.join(self.tmp, 'exportacion')
+        salida_texto, renders = self.exportar(salida)
+        self.assertEqual(renders, 2)
+        self.assertIn('Exportados: 2', salida_texto)
+        self.assertEqual(
+            sorted(f for f in os.listdir(salida) if f.endswith('.pdf')),
+            ['Hoja_de_Vida_y_Certificados_ana.pdf', 'Hoja_de_Vida_y_Certificados_luis.pdf'],
+        )
+
+        # Sin cambios no se vuelve a generar nada; un perfil editado sí
+        Perfil.objects.filter(user__username='ana').update(profesion='Ingeniera')
+        salida_texto, renders = self.exportar(salida)
+        self.assertEqual(renders, 1)
+        self.assertIn('Exportados: 1, Sin cambios: 1', salida_texto)
+
+    def test_incompleto_se_reintenta(self):
+        perfil = Perfil.objects.get(user__username='ana')
+        Experiencia.objects.create(perfil=perfil, empresa='E', cargo='Dev', fecha_inicio=date(2020, 1, 1), certificado='certificados/falta.pdf')
+        salida = os.path.join(self.tmp, 'exportacion')
+        salida_texto, _ = self.exportar(salida, '--username', 'ana')
+        self.assertIn('faltan: certificados/falta.pdf', salida_texto)
+        salida_texto, renders = self.exportar(salida, '--username', 'ana')
+        self.assertEqual(renders, 1)
+        self.assertIn('Exportados: 1, Sin cambios: 0', salida_texto)
+
+    @override_settings(CV_PDF_RENDER_POOL=True, CV_CERT_BUNDLE_ENABLED=True)
+    def test_hijos_sin_pool_ni_anexo_en_segundo_plano(self):
+        from concurrent.futures import Future
+        from django.conf import settings
+        from django.core.management import call_command
+
+        perfil = Perfil.objects.get(user__username='ana')
+        Experiencia.objects.create(perfil=perfil, empresa='E', cargo='Dev', fecha_inicio=date(2020, 1, 1), certificado='certificados/a.pdf')
+
+        class InlineExecutor:
+            # Los hijos, en este mismo proceso
+            def __init__(self, **kwargs):
+                kwargs['initializer']()
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def submit(self, fn, *args, **kwargs):
+                future = Future()
+                future.set_result(fn(*args, **kwargs))
+                return future
+
+        with self.settings(MEDIA_ROOT=self.tmp, CV_PDF_CACHE_DIR=os.path.join(self.tmp, 'cache')), \
+                mock.patch('pagina_usuario.management.commands.export_cvs.ProcessPoolExecutor', InlineExecutor), \
+                mock.patch('pagina_usuario.cv_pdf.render_cv_pdf', return_value=pdf_bytes(1)) as render, \
+                mock.patch('pagina_usuario.cv_pdf.read_media_bytes', return_value=pdf_bytes(1)), \
+                mock.patch('pagina_usuario.cert_bundle.schedule_bundle') as schedule_bundle:
+            call_command('export_cvs', '--salida', os.path.join(self.tmp, 'exportacion'), '--procesos', '2', stdout=StringIO())
+            self.assertTrue(settings.CV_PDF_RENDER_POOL)
+        self.assertEqual([call.kwargs['use_pool'] for call in render.call_args_list], [False, False])
+        # El anexo no estaba al día, pero no se encarga desde un hijo
+        schedule_bundle.assert_not_called()
+
+    def test_exporta_zip(self):
+        salida = os.path.join(self.tmp, 'cvs.zip')
+        self.exportar(salida, '--username', 'ana', 'baja', '--incluir-inactivos')
+        with zipfile.ZipFile(salida) as zf:
+            self.assertEqual(
+                sorted(zf.namelist()),
+                ['Hoja_de_Vida_y_Certificados_ana.pdf', 'Hoja_de_Vida_y_Certificados_baja.pdf'],
+            )
+        self.assertFalse(os.path.exists(salida + '.partes'))
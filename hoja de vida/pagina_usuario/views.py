@@ -1,4 +1,8 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
+from django.urls import reverse
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_POST
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from django.contrib.auth import login, logout, authenticate
@@ -6,23 +10,29 @@ from django.contrib import messages
 from django.db import IntegrityError
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
-from django.template.loader import get_template
+from django.http import Http404, HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
 from django.conf import settings
-from weasyprint import HTML, CSS
-from io import BytesIO
+import hmac
 import os
 import logging
-import requests
 from urllib.parse import quote
 
-from pypdf import PdfReader, PdfWriter
+from azure.core.exceptions import ResourceNotFoundError
 
-from .azure_blob import download_blob_bytes, search_blob_by_basename
+from .azure_blob import (
+    get_container_name, list_blobs_page, resolve_blob_name
+)
+from . import azure_blob_aio, blob_cache, health, metrics, render_pool
+from .media_proxy import aserve_blob, serve_blob
+from .cv_pdf import open_cv_pdf
+from .jobs import enqueue_cv_pdf
+from .cv_context import load_cv_perfil, cv_context, cv_queryset
+from .cv_page_cache import CV_PAGE_TEMPLATE, get_cv_page, set_cv_page
+from .photo_variants import foto_context
 
 from .models import (
     Task, Perfil, Experiencia, Habilidad, 
-    Productos, Recomendacion, Curso, Educacion
+    Productos, Recomendacion, Curso, Educacion, TrabajoPDF
 )
 
 from .forms import (
@@ -36,138 +46,122 @@ logger = logging.getLogger(__name__)
 # --- VISTA DE PROXY PARA ARCHIVOS DE AZURE ---
 
 def serve_azure_media(request, file_path):
-    """Proxy para servir archivos desde Azure Blob Storage"""
+    """Proxy para servir archivos desde Azure Blob Storage (streaming, Range y 304)"""
     try:
         logger.info(f'Serving media from Azure: {file_path}')
         
         basename = os.path.basename(file_path)
         
-        # Intentar con diferentes prefijos
-        prefixes_to_try = [
-            file_path,  # Nombre original
-            basename,   # Solo el nombre
-        ]
-        
-        # Agregar prefijos específicos para fotos y certificados
-        if 'perfil_fotos' in file_path or 'foto' in file_path:
-            prefixes_to_try.extend([
-                f'perfil/foto/{basename}',
-                f'perfil_fotos/{basename}',
-            ])
-        
-        if 'certificados' in file_path:
-            prefixes_to_try.extend([
-                f'cursos/certificados/{basename}',
-                f'experiencia/certificados/{basename}',
-                f'cursos/{basename}',
-                f'experiencia/{basename}',
-            ])
-        
-        # Intentar descargar con cada prefijo
-        blob_content = None
-        found_path = None
-        
-        for prefix in prefixes_to_try:
-            logger.debug(f'Intentando: {prefix}')
-            blob_content = download_blob_bytes(prefix)
-            if blob_content:
-                logger.info(f'✓ Encontrado en Azure como: {prefix}')
-                found_path = prefix
-                break
-        
-        # Si no encontró con prefijos, buscar en Azure
-        if not blob_content:
-            logger.debug(f'Buscando en Azure por basename: {basename}')
-            matching_blobs = search_blob_by_basename(basename)
-            logger.debug(f'Blobs encontrados: {matching_blobs}')
-            
-            for blob_name in matching_blobs:
-                blob_content = download_blob_bytes(blob_name)
-                if blob_content:
-                    logger.info(f'✓ Encontrado en Azure como: {blob_name}')
-                    found_path = blob_name
-                    break
-        
-        if not blob_content:
+        # Resolver la ruta real del blob con el índice: una sola descarga
+        found_path = resolve_blob_name(file_path)
+        if not found_path:
             logger.error(f'No se encontró archivo: {file_path}')
             return HttpResponse('Archivo no encontrado', status=404)
         
-        # Determinar content type
-        content_type = 'image/jpeg'
-        if file_path.lower().endswith('.png'):
-            content_type = 'image/png'
-        elif file_path.lower().endswith('.gif'):
-            content_type = 'image/gif'
-        elif file_path.lower().endswith('.webp'):
-            content_type = 'image/webp'
-        elif file_path.lower().endswith('.pdf'):
-            content_type = 'application/pdf'
-        
-        # Servir el archivo
-        response = FileResponse(
-            BytesIO(blob_content),
-            content_type=content_type
-        )
-        response['Content-Disposition'] = f'inline; filename="{basename}"'
-        return response
+        # Servir desde la caché local o por trozos desde Azure
+        try:
+            return serve_blob(request, found_path, filename=basename)
+        except ResourceNotFoundError:
+            logger.error(f'No se encontró archivo: {file_path} (blob {found_path})')
+            return HttpResponse('Archivo no encontrado', status=404)
     
     except Exception as e:
         logger.exception(f'Error sirviendo media desde Azure: {str(e)}, file_path: {file_path}')
         return HttpResponse(f'Error: {str(e)}', status=500)
 
+async def serve_azure_media_async(request, file_path):
+    """Versión ASGI de serve_azure_media: la descarga desde Azure no ocupa un hilo (ASYNC_MEDIA_VIEWS)"""
+    try:
+        logger.info(f'Serving media from Azure (async): {file_path}')
+        found_path = await sync_to_async(resolve_blob_name, thread_sensitive=False)(file_path)
+        if not found_path:
+            logger.error(f'No se encontró archivo: {file_path}')
+            return HttpResponse('Archivo no encontrado', status=404)
+        try:
+            return await aserve_blob(request, found_path, filename=os.path.basename(file_path))
+        except ResourceNotFoundError:
+            logger.error(f'No se encontró archivo: {file_path} (blob {found_path})')
+            return HttpResponse('Archivo no encontrado', status=404)
+
+    except Exception as e:
+        logger.exception(f'Error sirviendo media desde Azure: {str(e)}, file_path: {file_path}')
+        return HttpResponse(f'Error: {str(e)}', status=500)
+
 # --- VISTAS DE AUTENTICACIÓN ---
 
 def health_check(request):
-    """Endpoint para diagnosticar problemas en Render"""
-    import json
-    from django.db import connection
-    
-    try:
-        # Verificar conexión a BD
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-        db_status = "✅ BD conectada"
-    except Exception as e:
-        db_status = f"❌ Error BD: {str(e)}"
-    
-    try:
-        # Verificar usuarios
-        user_count = User.objects.count()
-        perfil_count = Perfil.objects.count()
-    except Exception as e:
-        user_count = f"Error: {str(e)}"
-        perfil_count = "Error"
-    
+    """Endpoint para diagnosticar problemas en Render (readiness + estado de cachés y pools)"""
+    result = health.readiness()
+    database = result['checks']['database']
     response = {
-        "status": "OK",
-        "database": db_status,
-        "users": user_count,
-        "perfils": perfil_count,
+        "status": "OK" if result['ready'] else "ERROR",
+        "database": "✅ BD conectada" if database['ok'] else f"❌ Error BD: {database['error']}",
+        "checks": result['checks'],
+        "blob_cache": blob_cache.stats(),
+        "render_pool": render_pool.stats(),
         "debug": settings.DEBUG
     }
     return JsonResponse(response)
 
+def health_live(request):
+    """Liveness: el proceso responde (sin BD ni Azure)"""
+    return JsonResponse({"status": "OK"})
+
+def health_ready(request):
+    """Readiness: BD (y Azure si HEALTH_CHECK_AZURE) con latencias; 503 si algo falla"""
+    result = health.readiness()
+    return JsonResponse(
+        {"status": "OK" if result['ready'] else "ERROR", **result},
+        status=200 if result['ready'] else 503,
+    )
+
+def metrics_view(request):
+    """Métricas en formato Prometheus (latencias, PDF, caché de blobs, Azure, BD)"""
+    if not metrics.is_enabled():
+        return HttpResponse('Métricas desactivadas (METRICS_ENABLED)', status=404)
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('No autorizado', status=401)
+    body, content_type = metrics.render_latest()
+    return HttpResponse(body, content_type=content_type)
+
+def _blob_page_params(request):
+    """?prefix=&cursor=&limit=&delimiter= de /debug/blobs/"""
+    try:
+        limit = int(request.GET.get('limit', 100))
+    except ValueError:
+        limit = 100
+    return {
+        'prefix': request.GET.get('prefix') or None,
+        'cursor': request.GET.get('cursor') or None,
+        'page_size': limit,
+        'delimiter': request.GET.get('delimiter') or None,
+    }
+
+def _blob_page_json(container, params, page):
+    return JsonResponse({
+        "container": container,
+        "prefix": params['prefix'],
+        "count": len(page['blobs']),
+        "blobs": [blob.name for blob in page['blobs']],
+        "prefixes": page['prefixes'],
+        # Pasar como ?cursor= para la página siguiente (null = no hay más)
+        "next_cursor": page['next_cursor'],
+    })
+
 def debug_list_blobs(request):
-    """DEBUG: List all blobs in Azure Blob Storage"""
+    """DEBUG: List blobs in Azure Blob Storage, one page at a time (cursor pagination)"""
     try:
-        from azure.storage.blob import BlobServiceClient
-        from django.conf import settings
-        
-        conn_str = settings.AZURE_STORAGE_CONNECTION_STRING
-        container = settings.AZURE_CONTAINER_NAME or 'cursos'
-        
-        service_client = BlobServiceClient.from_connection_string(conn_str)
-        container_client = service_client.get_container_client(container)
-        
-        blobs = []
-        for blob in container_client.list_blobs():
-            blobs.append(blob.name)
-        
-        return JsonResponse({
-            "container": container,
-            "total_blobs": len(blobs),
-            "blobs": blobs[:100]  # Limit to first 100
-        })
+        params = _blob_page_params(request)
+        return _blob_page_json(get_container_name(), params, list_blobs_page(**params))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+async def debug_list_blobs_async(request):
+    """DEBUG: versión ASGI de debug_list_blobs"""
+    try:
+        params = _blob_page_params(request)
+        return _blob_page_json(get_container_name(), params, await azure_blob_aio.list_blobs_page(**params))
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -268,76 +262,75 @@ def delete_task(request, task_id):
 @login_required
 def panel_admin_perfil(request):
     """Panel de administración del perfil del usuario"""
-    perfil, created = Perfil.objects.get_or_create(user=request.user)
-    
-    context = {
-        'perfil': perfil,
-        'experiencias': perfil.experiencias.all(),
-        'educaciones': perfil.educaciones.all(),
-        'habilidades': perfil.habilidades.all(),
-        'cursos': perfil.cursos.all(),
-        'productos': perfil.productos.all(),
-        'recomendaciones': perfil.recomendaciones.all(),
-        'ventas_garage': perfil.ventas_garage.all(),
-    }
-    
-    return render(request, 'panel_admin_perfil.html', context)
+    perfil, created = load_cv_perfil(user=request.user)
+    return render(request, 'panel_admin_perfil.html', cv_context(perfil))
 
 def ver_hoja_de_vida(request, username=None):
     # Si username está especificado, usa ese, si no y usuario está autenticado, usa su perfil
     # Si es anónimo, redirige al login
+    perfil = None
     try:
         logger.debug(f"ver_hoja_de_vida called: username={username}, is_authenticated={request.user.is_authenticated}")
         
-        if username:
-            user_obj = get_object_or_404(User, username=username)
-        elif request.user.is_authenticated:
-            user_obj = request.user
-        else:
+        if not username and not request.user.is_authenticated:
             # Usuario anónimo - redirige al login
             logger.debug("Anonymous user, redirecting to login")
             return redirect('login_user')
-        
-        logger.debug(f"Getting or creating Perfil for user: {user_obj.username}")
-        perfil, created = Perfil.objects.get_or_create(user=user_obj)
-        
-        if created:
-            logger.info(f"Created new Perfil for user: {user_obj.username}")
-        
-        context = {
-            'perfil': perfil,
-            'experiencias': perfil.experiencias.all().order_by('-fecha_inicio'),
-            'educaciones': perfil.educaciones.all(),
-            'habilidades': perfil.habilidades.all(),
-            'cursos': perfil.cursos.all(),
-            'proyectos_productos': perfil.productos.all(),
-            'recomendaciones': perfil.recomendaciones.all(),
-            'ventas_garage': perfil.ventas_garage.all(),
-            'es_propietario': request.user == user_obj
-        }
-        
-        logger.debug(f"Rendering CV for user: {user_obj.username}")
-        # Usa la template original - si falla pasará a la excepción
-        return render(request, 'u_hoja_de_vida.html', context)
+
+        target = username or request.user.username
+        es_propietario = request.user.is_authenticated and request.user.username == target
+
+        # Cuerpo del CV ya renderizado: sin consultas ni render de la plantilla grande
+        cv_html = get_cv_page(target, es_propietario)
+        if cv_html is None:
+            # Perfil + usuario + todas las relaciones con un número fijo de consultas
+            try:
+                if username:
+                    perfil, created = load_cv_perfil(username=username)
+                else:
+                    perfil, created = load_cv_perfil(user=request.user)
+            except User.DoesNotExist:
+                raise Http404('Usuario no encontrado')
+            user_obj = perfil.user
+
+            if created:
+                logger.info(f"Created new Perfil for user: {user_obj.username}")
+
+            context = cv_context(
+                perfil,
+                experiencias=_experiencias_recientes(perfil),
+                proyectos_productos=perfil.productos.all(),
+                es_propietario=es_propietario,
+                **foto_context(perfil),
+            )
+
+            logger.debug(f"Rendering CV for user: {user_obj.username}")
+            # Usa la template original - si falla pasará a la excepción
+            cv_html = render_to_string(CV_PAGE_TEMPLATE, context)
+            set_cv_page(perfil, es_propietario, cv_html)
+
+        return render(request, 'u_hoja_de_vida.html', {'cv_html': cv_html})
+    except Http404:
+        raise
     except Exception as e:
         logger.error(f"Error in ver_hoja_de_vida: {str(e)}", exc_info=True)
-        # Si hay error, retorna una versión simple
+        # Si hay error, retorna una versión simple (reutiliza el perfil ya cargado)
         try:
-            if username:
-                user_obj = get_object_or_404(User, username=username)
-            elif request.user.is_authenticated:
-                user_obj = request.user
-            else:
-                return redirect('login_user')
-            
-            perfil, created = Perfil.objects.get_or_create(user=user_obj)
+            if perfil is None:
+                if username:
+                    user_obj = get_object_or_404(User, username=username)
+                elif request.user.is_authenticated:
+                    user_obj = request.user
+                else:
+                    return redirect('login_user')
+                perfil, created = load_cv_perfil(user=user_obj)
             
             context = {
                 'perfil': perfil,
-                'experiencias': perfil.experiencias.all().order_by('-fecha_inicio'),
+                'experiencias': _experiencias_recientes(perfil),
                 'educaciones': perfil.educaciones.all(),
                 'habilidades': perfil.habilidades.all(),
-                'es_propietario': request.user == user_obj
+                'es_propietario': request.user == perfil.user
             }
             logger.info("Falling back to simple template")
             return render(request, 'u_hoja_de_vida_simple.html', context)
@@ -345,137 +338,68 @@ def ver_hoja_de_vida(request, username=None):
             logger.error(f"Critical error in ver_hoja_de_vida fallback: {str(e2)}", exc_info=True)
             raise
 
+def _experiencias_recientes(perfil):
+    """Experiencias de la más reciente a la más antigua, sin otra consulta"""
+    return sorted(perfil.experiencias.all(), key=lambda exp: exp.fecha_inicio, reverse=True)
+
 @login_required  # Esto permite que 'marti' imprima sin ser administrador
 def descargar_cv_pdf(request):
     """Genera un PDF multipágina: CV + certificados con WeasyPrint.
 
     El primer documento del PDF resultante es la hoja de vida renderizada con WeasyPrint.
     Luego se anexan los certificados PDF de Experiencia, Curso y Recomendación.
+    Si el perfil no cambió desde la última descarga se sirve el PDF cacheado.
     """
-    import sys
-    import base64
-    import requests
-    from django.conf import settings
-    
-    perfil = get_object_or_404(Perfil, user=request.user)
+    perfil = get_object_or_404(cv_queryset(), user=request.user)
 
-    # Convertir foto a base64 si existe
-    foto_base64 = None
-    if perfil.foto:
-        try:
-            # Check if using Azure storage
-            if hasattr(settings, 'DEFAULT_FILE_STORAGE') and 'azure' in settings.DEFAULT_FILE_STORAGE.lower():
-                # Read from Azure Blob Storage
-                foto_url = perfil.foto.url
-                response = requests.get(foto_url, timeout=10)
-                if response.status_code == 200:
-                    foto_data = response.content
-                    foto_base64 = base64.b64encode(foto_data).decode('utf-8')
-            else:
-                # Read from local filesystem
-                with open(perfil.foto.path, 'rb') as f:
-                    foto_data = f.read()
-                    foto_base64 = base64.b64encode(foto_data).decode('utf-8')
-        except Exception as e:
-            print(f'ERROR al leer foto: {e}', file=sys.stderr)
-            foto_base64 = None
-
-    context = {
-        'perfil': perfil,
-        'foto_base64': foto_base64,
-        'experiencias': perfil.experiencias.all(),
-        'educaciones': perfil.educaciones.all(),
-        'cursos': perfil.cursos.all(),
-        'productos': perfil.productos.all(),
-        'recomendaciones': perfil.recomendaciones.all(),
-        'habilidades': perfil.habilidades.all(),
-        'timezone': timezone.now(),
-    }
-
-    # Generar PDF del CV con WeasyPrint
-    template = get_template('cv_pdf_template.html')
-    html_string = template.render(context)
-    
     try:
-        html_obj = HTML(string=html_string, base_url=request.build_absolute_uri('/'))
-        cv_bytes = html_obj.write_pdf()
+        pdf_file = open_cv_pdf(perfil, base_url=request.build_absolute_uri('/'))
     except Exception as e:
-        print(f'ERROR WeasyPrint: {e}', file=sys.stderr)
+        logger.error(f'ERROR WeasyPrint: {e}', exc_info=True)
         return HttpResponse(f"Error al generar el PDF: {e}", status=400)
 
-    writer = PdfWriter()
-
-    # Añadir páginas del CV
-    try:
-        reader_cv = PdfReader(BytesIO(cv_bytes))
-        for page in reader_cv.pages:
-            writer.add_page(page)
-    except Exception as e:
-        print(f'ERROR al leer CV PDF: {e}', file=sys.stderr)
-        # Si no se puede leer con pypdf, devolver solo el CV
-        response = HttpResponse(cv_bytes, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="Hoja_de_Vida_{request.user.username}.pdf"'
-        return response
-
-    # Recolectar y anexar certificados (Experiencia, Curso, Recomendacion)
-    from django.conf import settings
-    media_root = settings.MEDIA_ROOT
-    related_with_cert = []
-    related_with_cert += list(perfil.experiencias.all())
-    related_with_cert += list(perfil.cursos.all())
-    related_with_cert += list(perfil.recomendaciones.all())
-
-    certs_added = 0
-    for item in related_with_cert:
-        certificado_field = getattr(item, 'certificado', None)
-        if not certificado_field:
-            continue
-        nombre_blob = certificado_field.name if hasattr(certificado_field, 'name') else None
-        if not nombre_blob:
-            continue
-            
-        content = None
-
-        # Intentar descargar desde Azure (primero ruta completa, luego basename)
-        content = download_blob_bytes(nombre_blob)
-        if content is None:
-            content = download_blob_bytes(os.path.basename(nombre_blob))
-        
-        # Si no en Azure, intentar localmente
-        if content is None:
-            local_path = os.path.join(media_root, nombre_blob.replace('/', os.sep))
-            try:
-                with open(local_path, 'rb') as f:
-                    content = f.read()
-            except Exception as e:
-                print(f'ERROR local: {local_path} - {e}', file=sys.stderr)
-                content = None
+    # FileResponse lo envía por trozos y lo cierra al terminar
+    filename = f'Hoja_de_Vida_y_Certificados_{request.user.username}.pdf'
+    return FileResponse(pdf_file, as_attachment=True, filename=filename, content_type='application/pdf')
 
-        if not content:
-            print(f'WARNING: No se pudo obtener certificado: {nombre_blob}', file=sys.stderr)
-            continue
+# --- GENERACIÓN DEL PDF EN SEGUNDO PLANO ---
 
-        # Intentar anexar el PDF del certificado
-        try:
-            reader_cert = PdfReader(BytesIO(content))
-            for page in reader_cert.pages:
-                writer.add_page(page)
-            certs_added += 1
-            print(f'OK: Certificado anexado: {nombre_blob}', file=sys.stderr)
-        except Exception as e:
-            print(f'ERROR PDF: {nombre_blob} - {e}', file=sys.stderr)
-            continue
+def _trabajo_json(request, trabajo):
+    data = {
+        'id': str(trabajo.pk),
+        'estado': trabajo.estado,
+        'status_url': request.build_absolute_uri(reverse('estado_cv_pdf', args=[trabajo.pk])),
+    }
+    if trabajo.estado == 'completado':
+        data['download_url'] = request.build_absolute_uri(reverse('descargar_trabajo_cv_pdf', args=[trabajo.pk]))
+    elif trabajo.estado == 'error':
+        data['error'] = trabajo.error
+    return data
 
-    print(f'DEBUG: {certs_added} certificados añadidos', file=sys.stderr)
+@login_required
+@require_POST
+def encolar_cv_pdf(request):
+    """Encola la generación del PDF y responde 202 con la URL de estado"""
+    perfil = get_object_or_404(cv_queryset(), user=request.user)
+    trabajo = enqueue_cv_pdf(perfil, base_url=request.build_absolute_uri('/'))
+    return JsonResponse(_trabajo_json(request, trabajo), status=202)
 
-    # Serializar writer a bytes
-    out_buffer = BytesIO()
-    writer.write(out_buffer)
-    out_buffer.seek(0)
+@login_required
+def estado_cv_pdf(request, job_id):
+    trabajo = get_object_or_404(TrabajoPDF, pk=job_id, perfil__user=request.user)
+    return JsonResponse(_trabajo_json(request, trabajo))
 
-    response = HttpResponse(out_buffer.getvalue(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Hoja_de_Vida_y_Certificados_{request.user.username}.pdf"'
-    return response
+@login_required
+def descargar_trabajo_cv_pdf(request, job_id):
+    trabajo = get_object_or_404(TrabajoPDF, pk=job_id, perfil__user=request.user)
+    if trabajo.estado != 'completado':
+        return JsonResponse(_trabajo_json(request, trabajo), status=409)
+    filename = f'Hoja_de_Vida_y_Certificados_{request.user.username}.pdf'
+    try:
+        return FileResponse(open(trabajo.archivo, 'rb'), as_attachment=True, filename=filename, content_type='application/pdf')
+    except FileNotFoundError:
+        # El perfil cambió y la caché se invalidó: generar de nuevo en línea
+        return descargar_cv_pdf(request)
 
 # --- VISTAS DE CREACIÓN (POST) ---
 
@@ -657,7 +581,6 @@ def eliminar_curso(request, pk):
 def descargar_certificado(request, cert_type, cert_id):
     """Descarga certificados desde Azure Blob Storage o sistema local."""
     from django.http import FileResponse, HttpResponseNotFound
-    from pagina_usuario.azure_blob import download_blob_bytes
     import os
     import logging
     
@@ -666,7 +589,7 @@ def descargar_certificado(request, cert_type, cert_id):
     try:
         # Obtener el objeto según el tipo
         if cert_type == 'experiencia':
-            cert_obj = get_object_or_404(ExperienciaLaboral, pk=cert_id, perfil__user=request.user)
+            cert_obj = get_object_or_404(Experiencia, pk=cert_id, perfil__user=request.user)
         elif cert_type == 'curso':
             cert_obj = get_object_or_404(Curso, pk=cert_id, perfil__user=request.user)
         elif cert_type == 'recomendacion':
@@ -683,49 +606,17 @@ def descargar_certificado(request, cert_type, cert_id):
         cert_name = cert_obj.certificado.name
         logger.info(f"Intentando descargar certificado: {cert_name}")
         
-        # Intentar descargar desde Azure con diferentes prefijos
-        blob_content = None
+        # Resolver la ruta real en Azure con el índice de blobs y servir en streaming
         basename = os.path.basename(cert_name)
-        
-        # Definir prefijos según el tipo
-        prefixes_to_try = [
-            cert_name,  # Nombre original
-            basename,   # Solo el nombre
-        ]
-        
-        # Agregar prefijos específicos del tipo
-        if cert_type == 'curso':
-            prefixes_to_try.extend([
-                f'cursos/certificados/{basename}',
-                f'cursos/{basename}',
-            ])
-        elif cert_type == 'experiencia':
-            prefixes_to_try.extend([
-                f'experiencia/certificados/{basename}',
-                f'experiencia/{basename}',
-            ])
-        
-        # Intentar con cada prefijo
-        for prefix in prefixes_to_try:
+        blob_path = resolve_blob_name(cert_name)
+        if blob_path:
             try:
-                blob_content = download_blob_bytes(prefix)
-                if blob_content:
-                    logger.info(f"✓ Certificado descargado desde Azure: {prefix}")
-                    break
-            except Exception as e:
-                logger.debug(f"No encontrado con prefijo '{prefix}': {e}")
-                continue
-        
-        # Si logró obtener desde Azure, retornar
-        if blob_content:
-            response = FileResponse(
-                iter([blob_content]),
-                content_type='application/pdf'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{basename}"'
-            return response
-        else:
-            logger.error(f"No se pudo descargar de Azure. Intenté con prefijos: {prefixes_to_try}")
+                response = serve_blob(request, blob_path, filename=basename, disposition='attachment')
+                logger.info(f"✓ Certificado servido desde Azure: {blob_path}")
+                return response
+            except ResourceNotFoundError:
+                pass
+        logger.error(f"No se pudo descargar de Azure: {cert_name}")
         
         # Fallback: intentar desde el sistema local si existe
         if cert_obj.certificado and hasattr(cert_obj.certificado, 'path'):
@@ -747,4 +638,50 @@ def descargar_certificado(request, cert_type, cert_id):
     except Exception as e:
         logger.exception(f"Error general en descargar_certificado: {e}")
         return HttpResponseNotFound("Error al descargar certificado")
-        return HttpResponseNotFound("Error al descargar certificado")
\ No newline at end of file
+        return HttpResponseNotFound("Error al descargar certificado")
+
+CERTIFICADO_MODELS = {'experiencia': Experiencia, 'curso': Curso, 'recomendacion': Recomendacion}
+
+@login_required
+async def descargar_certificado_async(request, cert_type, cert_id):
+    """Versión ASGI de descargar_certificado: streaming desde Azure con el cliente aio."""
+    from django.http import HttpResponseNotFound
+
+    try:
+        model = CERTIFICADO_MODELS.get(cert_type)
+        if model is None:
+            return HttpResponseNotFound("Tipo de certificado inválido")
+        user = await request.auser()
+        cert_obj = await aget_object_or_404(model, pk=cert_id, perfil__user=user)
+
+        if not cert_obj.certificado:
+            logger.error(f"Certificado no encontrado para {cert_type} {cert_id}")
+            return HttpResponseNotFound("Certificado no encontrado")
+
+        cert_name = cert_obj.certificado.name
+        logger.info(f"Intentando descargar certificado: {cert_name}")
+
+        basename = os.path.basename(cert_name)
+        blob_path = await sync_to_async(resolve_blob_name, thread_sensitive=False)(cert_name)
+        if blob_path:
+            try:
+                response = await aserve_blob(request, blob_path, filename=basename, disposition='attachment')
+                logger.info(f"✓ Certificado servido desde Azure: {blob_path}")
+                return response
+            except ResourceNotFoundError:
+                pass
+        logger.error(f"No se pudo descargar de Azure: {cert_name}")
+
+        # Fallback: archivo local (poco frecuente; FileResponse lo lee en un hilo)
+        local_path = os.path.join(settings.MEDIA_ROOT, cert_name)
+        if os.path.exists(local_path):
+            return FileResponse(open(local_path, 'rb'), as_attachment=True, filename=basename, content_type='application/pdf')
+
+        logger.error(f"No se pudo descargar el certificado {cert_type} {cert_id}")
+        return HttpResponseNotFound("No se pudo descargar el certificado")
+
+    except Http404:
+        raise
+    except Exception as e:
+        logger.exception(f"Error general en descargar_certificado: {e}")
+        return HttpResponseNotFound("Error al descargar certificado")